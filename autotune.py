@@ -0,0 +1,146 @@
+"""Automatic threshold/morphology search for one ROI ("auto-tune").
+
+Instead of decoding every point of the parameter grid, candidates are
+ranked by cheap image-quality scores computed in batch with NumPy, and only
+the best few are handed to the decoder:
+
+1. The ROI is processed once up to CLAHE (the threshold stage's input).
+2. Every global threshold and every adaptive method/block size/C value is
+   applied to a downscaled copy as one boolean stack and scored at once.
+3. The best threshold settings are combined with a few morphology
+   variants, run through the real stages at full resolution and rescored.
+
+The score is the mean of two terms in 0..1: bimodality (Otsu's
+between-class variance of the gray levels split by the binary image) and
+edge sharpness (mean gradient magnitude along the binary edges, relative to
+the ROI's strong edges), which punishes speckle on flat areas.
+"""
+from dataclasses import dataclass, replace
+
+import cv2
+import numpy as np
+
+from pipeline import StageCache, process_roi
+
+SCORE_WORK_SIZE = 256 # Longest side of the image the threshold grid is scored on
+GLOBAL_THRESHOLDS = tuple(range(30, 231, 10))
+ADAPTIVE_METHODS = ("GAUSSIAN", "MEAN")
+ADAPTIVE_BLOCK_RAWS = (2, 3, 5, 7, 10, 14) # Block size (raw * 2) + 1
+ADAPTIVE_C_VALUES = tuple(range(-4, 11, 2))
+# (erode_size, erode_iter, close_size, open_size)
+MORPHOLOGY_VARIANTS = ((1, 1, 2, 2), (1, 1, 3, 2), (2, 1, 3, 3), (2, 1, 4, 3), (3, 1, 4, 3), (2, 2, 4, 3))
+THRESHOLD_SHORTLIST = 8
+DEFAULT_MAX_CANDIDATES = 16
+
+
+@dataclass(frozen=True)
+class TuneCandidate:
+    params: object # ProcessingParams
+    score: float # 0..1, higher is better
+
+    def describe(self):
+        params = self.params
+        if params.use_adaptive_thresh:
+            threshold = (f"adaptive {params.adaptive_method.lower()} block {params.adaptive_block_size_raw * 2 + 1}"
+                         f" C {params.adaptive_c_value}")
+        else:
+            threshold = f"global {params.thresh_val}"
+        return (f"{threshold}, erode {params.erode_size}x{params.erode_iter}, close {params.close_size}, "
+                f"open {params.open_size} (score {self.score:.2f})")
+
+
+def _downscale(image, work_size, interpolation):
+    height, width = image.shape[:2]
+    scale = min(1.0, work_size / float(max(height, width)))
+    if scale >= 1.0:
+        return image
+    return cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=interpolation)
+
+
+def quality_scores(binary_stack, gray):
+    # Scores for a (N, H, W) boolean stack of binarisations of gray (H, W), as an (N,) array
+    gray_f = gray.astype(np.float32)
+    count = binary_stack.shape[1] * binary_stack.shape[2]
+    variance = max(float(gray_f.var()), 1e-6)
+
+    # Bimodality: between-class variance of the gray levels split by each binary image
+    light_count = binary_stack.sum(axis=(1, 2)).astype(np.float64)
+    light_sum = (binary_stack * gray_f).sum(axis=(1, 2), dtype=np.float64)
+    dark_count = count - light_count
+    light_mean = light_sum / np.maximum(light_count, 1)
+    dark_mean = (float(gray_f.sum()) - light_sum) / np.maximum(dark_count, 1)
+    bimodality = (light_count / count) * (dark_count / count) * (light_mean - dark_mean) ** 2 / variance
+
+    # Edge sharpness: binary edges should sit on strong gray-level gradients
+    grad_x = np.abs(np.diff(gray_f, axis=1))
+    grad_y = np.abs(np.diff(gray_f, axis=0))
+    edges_x = binary_stack[:, :, 1:] != binary_stack[:, :, :-1]
+    edges_y = binary_stack[:, 1:, :] != binary_stack[:, :-1, :]
+    edge_count = edges_x.sum(axis=(1, 2)) + edges_y.sum(axis=(1, 2))
+    edge_strength = ((edges_x * grad_x).sum(axis=(1, 2)) + (edges_y * grad_y).sum(axis=(1, 2))) / np.maximum(edge_count, 1)
+    strong = max(float(np.percentile(np.concatenate((grad_x.ravel(), grad_y.ravel())), 99)), 1e-6)
+    sharpness = np.clip(edge_strength / strong, 0.0, 1.0)
+
+    return 0.5 * np.clip(bimodality, 0.0, 1.0) + 0.5 * sharpness
+
+
+def _threshold_grid(base_params):
+    candidates = [replace(base_params, use_adaptive_thresh=False, thresh_val=value) for value in GLOBAL_THRESHOLDS]
+    for method in ADAPTIVE_METHODS:
+        for block_raw in ADAPTIVE_BLOCK_RAWS:
+            for c_value in ADAPTIVE_C_VALUES:
+                candidates.append(replace(base_params, use_adaptive_thresh=True, adaptive_method=method,
+                                          adaptive_block_size_raw=block_raw, adaptive_c_value=c_value))
+    return candidates
+
+
+def _threshold_stack(gray, candidates, scale):
+    # All threshold candidates applied to gray at once; block sizes are scaled to the work image
+    gray_f = gray.astype(np.float32)
+    stack = np.empty((len(candidates),) + gray.shape, dtype=bool)
+    local_means = {}
+    for index, params in enumerate(candidates):
+        if not params.use_adaptive_thresh:
+            stack[index] = gray_f > params.thresh_val
+            continue
+        key = (params.adaptive_method, params.adaptive_block_size_raw)
+        if key not in local_means:
+            block = max(3, int((params.adaptive_block_size_raw * 2 + 1) * scale) | 1)
+            if params.adaptive_method == "GAUSSIAN":
+                local_means[key] = cv2.GaussianBlur(gray_f, (block, block), 0)
+            else:
+                local_means[key] = cv2.blur(gray_f, (block, block))
+        stack[index] = gray_f > local_means[key] - params.adaptive_c_value
+    return stack
+
+
+def rank_candidates(cropped, base_params, max_candidates=DEFAULT_MAX_CANDIDATES):
+    # Returns TuneCandidates for the ROI, best first. Stages before the threshold (and any
+    # upscale/denoise settings) come from base_params.
+    cache = StageCache() # Private: the full-resolution variants would flush the caller's cache
+    roi_key = 'autotune'
+    gray = process_roi(cropped, base_params, cache=cache, roi_key=roi_key, stop_after='clahe')
+    work_gray = _downscale(gray, SCORE_WORK_SIZE, cv2.INTER_AREA)
+    scale = work_gray.shape[1] / float(gray.shape[1])
+
+    # Phase 1: the whole threshold grid in one batch on the work image
+    thresholds = _threshold_grid(base_params)
+    scores = quality_scores(_threshold_stack(work_gray, thresholds, scale), work_gray)
+    shortlist = [thresholds[index] for index in np.argsort(-scores)[:THRESHOLD_SHORTLIST]]
+
+    # Phase 2: shortlisted thresholds x morphology variants through the real stages
+    variants = []
+    for params in shortlist:
+        morphologies = {(base_params.erode_size, base_params.erode_iter, base_params.close_size, base_params.open_size)}
+        morphologies.update(MORPHOLOGY_VARIANTS)
+        for erode_size, erode_iter, close_size, open_size in sorted(morphologies):
+            variants.append(replace(params, erode_size=erode_size, erode_iter=erode_iter,
+                                    close_size=close_size, open_size=open_size))
+    stack = np.empty((len(variants),) + work_gray.shape, dtype=bool)
+    for index, params in enumerate(variants):
+        processed = process_roi(cropped, params, cache=cache, roi_key=roi_key)
+        stack[index] = _downscale(processed, SCORE_WORK_SIZE, cv2.INTER_NEAREST) > 127
+    scores = quality_scores(stack, work_gray)
+
+    order = np.argsort(-scores)[:max_candidates]
+    return [TuneCandidate(params=variants[index], score=float(scores[index])) for index in order]
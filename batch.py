@@ -0,0 +1,398 @@
+"""Batch decoding of image directories, globs and file lists.
+
+Usage:
+    python read.py batch INPUT [INPUT ...] [--presets datamatrix_presets.ini]
+                         [--workers N] [--locate] [--output results.jsonl|results.csv]
+
+Each INPUT is a directory, a glob pattern, an image file, or a text file
+with one image path per line. Every image is run through the presets in
+file order (same stage order as the GUI) on a pool of worker processes and
+one record per image is written as JSONL or CSV. With --locate, candidate
+code regions are found automatically (see locate.py) and decoded instead
+of the whole frame. With --sweep, each preset is also tried on rotated,
+deskewed and rescaled variants of the ROI, cheapest first (see sweep.py).
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+
+from image_source import open_image
+from locate import find_candidate_rois
+from preset_stats import PresetStats
+from result_cache import ResultCache, file_key
+from pipeline import DEFAULT_DECODE_TIMEOUT_MS, StageCache, decode_all_roi, decode_roi, load_presets
+from sweep import sweep_attempts
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff')
+STAGES = ('load', 'locate', 'gray', 'upscale', 'denoise', 'variant', 'sharpen', 'clahe', 'threshold', 'morphology', 'grid', 'decode')
+
+
+def is_image_path(path):
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def collect_image_paths(inputs, recursive=False):
+    # Expands directories, globs and list files into image paths, in input order, without duplicates
+    paths = []
+    seen = set()
+
+    def add(path):
+        if path not in seen:
+            seen.add(path)
+            paths.append(path)
+
+    for item in inputs:
+        if os.path.isdir(item):
+            if recursive:
+                for dirpath, dirnames, filenames in os.walk(item):
+                    dirnames.sort()
+                    for filename in sorted(filenames):
+                        if is_image_path(filename):
+                            add(os.path.join(dirpath, filename))
+            else:
+                for filename in sorted(os.listdir(item)):
+                    if is_image_path(filename):
+                        add(os.path.join(item, filename))
+        elif os.path.isfile(item) and is_image_path(item):
+            add(item)
+        elif os.path.isfile(item):
+            # Newline-separated list of image paths; blank lines and '#' comments are ignored
+            with open(item, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        add(line)
+        else:
+            for match in sorted(glob.glob(item, recursive=True)):
+                if os.path.isfile(match):
+                    add(match)
+    return paths
+
+
+def open_rois(path, timings, roi=None, locate=False):
+    # Load stage: opens the image and picks the ROIs to try, as (ImageSource, rois), or
+    # (None, None) if the image could not be read. Large images are only opened as a proxy here.
+    start = time.perf_counter()
+    source = open_image(path)
+    timings['load'] = (time.perf_counter() - start) * 1000.0
+    if source is None:
+        return None, None
+    return source, select_rois(source, timings, roi, locate)
+
+
+def select_rois(source, timings, roi=None, locate=False):
+    # The fixed roi, the located candidates (best first) or the whole image
+    whole_image = (0, 0, source.width, source.height)
+    if roi is not None:
+        rois = [roi]
+    elif locate:
+        start = time.perf_counter()
+        rois = [candidate.selection for candidate in find_candidate_rois(source.proxy, full_size=(source.width, source.height))]
+        timings['locate'] = (time.perf_counter() - start) * 1000.0
+        if not rois:
+            rois = [whole_image]
+    else:
+        rois = [whole_image]
+    return rois
+
+
+def iter_crops(source, rois, timings):
+    # Reads each ROI at full resolution on demand, as (roi, cropped); cropped is None for empty ROIs
+    for current_roi in rois:
+        start = time.perf_counter()
+        cropped = source.read_region(current_roi)
+        timings['load'] += (time.perf_counter() - start) * 1000.0
+        yield current_roi, cropped
+
+
+def decode_crops(path, crops, presets, timeout_ms, timings, all_codes=False, deadline=None, sweep=False):
+    # Tries presets in order on each (roi, cropped) until one decodes; crops is None if the
+    # image could not be loaded. Returns the output record for path. With a deadline
+    # (time.time() value), no preset is started after it and timeouts are cut to fit.
+    # With sweep (single-code only), presets x orientation/scale variants are tried instead.
+    # With all_codes every ROI is decoded (first preset that finds codes there) and the
+    # symbols are merged, without duplicates; roi and preset then name the first ROI that decoded.
+    record = {'path': path, 'roi': None, 'preset': None, 'decoded_text': None, 'presets_tried': 0, 'error': None}
+    if all_codes:
+        record['codes'] = []
+    record['_attempts'] = [] # (preset name, success, ms) for PresetStats; not written to the output
+    if crops is None:
+        record['error'] = "Failed to load image"
+        record['timings'] = timings
+        return record
+
+    # Presets sharing denoise/sharpen settings reuse those stages within this image
+    stage_cache = StageCache()
+    for current_roi, cropped in crops:
+        if cropped is None:
+            if record['decoded_text'] is None:
+                record['error'] = "Empty ROI"
+            continue
+        if sweep and not all_codes:
+            if _sweep_crop(record, current_roi, cropped, presets, timeout_ms, timings, stage_cache, deadline):
+                break
+            if record['error'] == "Time budget exhausted":
+                break
+            continue
+        for section, name, params in presets:
+            preset_timeout_ms = timeout_ms
+            if deadline is not None:
+                remaining_ms = int((deadline - time.time()) * 1000.0)
+                if remaining_ms <= 0:
+                    if record['decoded_text'] is None: # Codes found so far are still reported
+                        record['error'] = "Time budget exhausted"
+                    record['timings'] = timings
+                    return record
+                preset_timeout_ms = min(timeout_ms, remaining_ms)
+            record['presets_tried'] += 1
+            spent_before = sum(timings.values())
+            try:
+                if all_codes:
+                    symbols = decode_all_roi(cropped, params, preset_timeout_ms, timings, stage_cache, current_roi,
+                                             origin=current_roi[:2])
+                    for symbol in symbols: # Overlapping candidate ROIs can report the same symbol
+                        code = {'text': symbol.text, 'rect': list(symbol.rect)}
+                        if code not in record['codes']:
+                            record['codes'].append(code)
+                    decoded_text = symbols[0].text if symbols else None
+                else:
+                    decoded_text = decode_roi(cropped, params, preset_timeout_ms, timings, stage_cache, current_roi)
+            except Exception as e:
+                if record['decoded_text'] is None:
+                    record['error'] = f"Preset '{name}': {e}"
+                continue
+            record['_attempts'].append((name, bool(decoded_text), sum(timings.values()) - spent_before))
+            if decoded_text:
+                if record['decoded_text'] is None:
+                    record['roi'] = list(current_roi)
+                    record['preset'] = name
+                    record['decoded_text'] = decoded_text
+                record['error'] = None
+                if all_codes:
+                    break # Other candidate ROIs may hold more codes
+                record['timings'] = timings
+                return record
+
+    record['timings'] = timings
+    return record
+
+
+def _sweep_crop(record, current_roi, cropped, presets, timeout_ms, timings, stage_cache, deadline):
+    # decode_crops for one ROI with the orientation/scale sweep; True once it decodes
+    for attempt in sweep_attempts(cropped, presets, timeout_ms, timings, stage_cache, current_roi, deadline=deadline):
+        record['presets_tried'] += 1
+        if attempt.error:
+            record['error'] = f"Preset '{attempt.name}' ({attempt.variant.describe()}): {attempt.error}"
+            continue
+        if attempt.variant.is_identity(): # Statistics describe the presets as configured
+            record['_attempts'].append((attempt.name, bool(attempt.decoded_text), attempt.elapsed_ms))
+        if attempt.decoded_text:
+            record['roi'] = list(current_roi)
+            record['preset'] = attempt.name
+            record['variant'] = attempt.variant.describe()
+            record['decoded_text'] = attempt.decoded_text
+            record['error'] = None
+            return True
+    if deadline is not None and time.time() >= deadline:
+        record['error'] = "Time budget exhausted"
+    return False
+
+
+def decode_file(path, presets, timeout_ms, roi=None, locate=False, all_codes=False, sweep=False):
+    # Worker entry point: load one image and try presets in order until one decodes.
+    # With locate=True and no fixed roi, each automatically found candidate ROI is tried in turn.
+    # With all_codes=True every symbol found by the winning preset is reported under 'codes'.
+    # With sweep=True rotated, deskewed and rescaled variants are tried too (see sweep.py).
+    timings = {}
+    source, rois = open_rois(path, timings, roi, locate)
+    crops = iter_crops(source, rois, timings) if source is not None else None # Read lazily, stop at the first decode
+    return decode_crops(path, crops, presets, timeout_ms, timings, all_codes, sweep=sweep)
+
+
+def decode_file_rois(path, rois, presets, timeout_ms, timings, all_codes=False):
+    # Worker entry point for ROIs picked beforehand (watch mode locates in its own stage):
+    # reopens the image and reads only those ROIs, lazily. rois=None means the whole image.
+    start = time.perf_counter()
+    source = open_image(path)
+    timings['load'] = timings.get('load', 0.0) + (time.perf_counter() - start) * 1000.0
+    if source is None:
+        return decode_crops(path, None, presets, timeout_ms, timings, all_codes)
+    crops = iter_crops(source, rois or select_rois(source, timings), timings)
+    return decode_crops(path, crops, presets, timeout_ms, timings, all_codes)
+
+
+class ResultWriter:
+    # Writes batch records as JSONL (nested timings) or CSV (one <stage>_ms column per stage)
+    def __init__(self, stream, fmt):
+        self.stream = stream
+        self.fmt = fmt
+        self.csv_writer = None
+        if fmt == 'csv':
+            fieldnames = ['path', 'roi', 'preset', 'variant', 'decoded_text', 'codes', 'presets_tried', 'error', 'total_ms']
+            fieldnames += [f"{stage}_ms" for stage in STAGES]
+            self.csv_writer = csv.DictWriter(stream, fieldnames=fieldnames)
+            self.csv_writer.writeheader()
+
+    def write(self, record):
+        timings = {stage: round(ms, 3) for stage, ms in record['timings'].items()}
+        total_ms = round(sum(timings.values()), 3)
+        if self.fmt == 'csv':
+            row = {key: record[key] for key in ('path', 'preset', 'decoded_text', 'presets_tried', 'error')}
+            row['roi'] = ','.join(str(v) for v in record['roi']) if record['roi'] else ''
+            row['codes'] = json.dumps(record['codes']) if record.get('codes') else ''
+            row['variant'] = record.get('variant') or ''
+            row['total_ms'] = total_ms
+            for stage in STAGES:
+                row[f"{stage}_ms"] = timings.get(stage, '')
+            self.csv_writer.writerow(row)
+        else:
+            self.stream.write(json.dumps(dict(record, timings=timings, total_ms=total_ms)) + "\n")
+        self.stream.flush()
+
+
+def _batch_cache_key(path, presets, timeout_ms, roi, locate, all_codes, sweep=False):
+    # File-level result cache key, or None if the file can't be stat'ed (it is then decoded
+    # and reported as usual). The timeout is kept with the entry, not in the key.
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    options = {'roi': list(roi) if roi else None, 'locate': locate, 'all_codes': all_codes}
+    if sweep:
+        options['sweep'] = True # Only when set, so existing cache entries stay valid
+    return file_key(os.path.abspath(path), stat, presets, options)
+
+
+def run_batch(paths, presets, writer, workers=None, timeout_ms=DEFAULT_DECODE_TIMEOUT_MS, roi=None, locate=False, all_codes=False,
+              stats=None, result_cache=None, sweep=False):
+    # Keeps a bounded number of jobs in flight so 200k paths don't become 200k futures.
+    # With a result_cache, images already decoded with the same presets and options are
+    # answered from the cache without being opened.
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 4
+    decoded = 0
+    path_iter = iter(paths)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = {} # future -> result cache key (or None)
+
+        def submit_next():
+            # Submits the next uncached path; cached records are written straight away.
+            # Returns False once the paths are exhausted.
+            nonlocal decoded
+            for path in path_iter:
+                key = _batch_cache_key(path, presets, timeout_ms, roi, locate, all_codes, sweep) if result_cache is not None else None
+                if key is not None:
+                    hit, record = result_cache.get(key, timeout_ms)
+                    if hit:
+                        if record['decoded_text']:
+                            decoded += 1
+                        writer.write(dict(record, timings={}, cached=True))
+                        continue
+                in_flight[executor.submit(decode_file, path, presets, timeout_ms, roi, locate, all_codes, sweep)] = key
+                return True
+            return False
+
+        while len(in_flight) < max_in_flight and submit_next():
+            pass
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = in_flight.pop(future)
+                record = future.result()
+                attempts = record.pop('_attempts', [])
+                if stats is not None:
+                    for name, success, elapsed_ms in attempts:
+                        stats.record(name, success, elapsed_ms)
+                if record['decoded_text']:
+                    decoded += 1
+                if key is not None and (record['decoded_text'] or (record['presets_tried'] and not record['error'])):
+                    result_cache.put(key, record, timeout_ms) # Load errors may be transient and are not cached
+                writer.write(record)
+                submit_next()
+    return decoded
+
+
+def parse_roi(value):
+    try:
+        x1, y1, x2, y2 = (int(v) for v in value.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError("ROI must be x1,y1,x2,y2")
+    return (x1, y1, x2, y2)
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(prog="read.py batch", description="Decode DataMatrix codes in many images.")
+    parser.add_argument('inputs', nargs='+', help="Directories, glob patterns, image files or newline-separated file lists")
+    parser.add_argument('--presets', default='datamatrix_presets.ini', help="Presets INI file (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--timeout', type=int, default=DEFAULT_DECODE_TIMEOUT_MS, help="Decode timeout per preset in ms (default: %(default)s)")
+    parser.add_argument('--roi', type=parse_roi, default=None, help="Crop x1,y1,x2,y2 applied to every image (default: whole image)")
+    parser.add_argument('--locate', action='store_true', help="Find candidate code regions automatically instead of decoding the whole image")
+    parser.add_argument('--all-codes', action='store_true', help="Report every code in the ROI with its position, not just the first")
+    parser.add_argument('--sweep', action='store_true', help="Also try rotated, deskewed and rescaled variants of each ROI, cheapest first (single-code only)")
+    parser.add_argument('--result-cache', default=None, help="SQLite result cache: images already decoded with the same presets and options are skipped")
+    parser.add_argument('--stats', default=None, help="Preset statistics file: try presets by expected payoff and update it with the results")
+    parser.add_argument('--recursive', action='store_true', help="Recurse into sub-directories")
+    parser.add_argument('--output', '-o', default=None, help="Output file (default: stdout)")
+    parser.add_argument('--format', choices=('jsonl', 'csv'), default=None, help="Output format (default: from --output extension, else jsonl)")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+
+    try:
+        presets = load_presets(args.presets)
+    except Exception as e:
+        print(f"Could not load presets: {e}", file=sys.stderr)
+        return 2
+    if not presets:
+        print(f"No presets found in {args.presets}", file=sys.stderr)
+        return 2
+
+    stats = None
+    if args.stats:
+        stats = PresetStats(args.stats, default_cost_ms=args.timeout)
+        presets = stats.order(presets, lambda preset: preset[1])
+
+    paths = collect_image_paths(args.inputs, recursive=args.recursive)
+    if not paths:
+        print("No images found.", file=sys.stderr)
+        return 1
+
+    fmt = args.format
+    if fmt is None:
+        fmt = 'csv' if args.output and args.output.lower().endswith('.csv') else 'jsonl'
+
+    result_cache = ResultCache(db_path=args.result_cache) if args.result_cache else None
+    start = time.perf_counter()
+    try:
+        if args.output:
+            with open(args.output, 'w', newline='', encoding='utf-8') as stream:
+                decoded = run_batch(paths, presets, ResultWriter(stream, fmt), args.workers, args.timeout, args.roi, args.locate,
+                                    args.all_codes, stats, result_cache, args.sweep)
+        else:
+            decoded = run_batch(paths, presets, ResultWriter(sys.stdout, fmt), args.workers, args.timeout, args.roi, args.locate,
+                                args.all_codes, stats, result_cache, args.sweep)
+    finally:
+        if result_cache is not None:
+            result_cache.close() # Commits, so an interrupted run keeps what it finished
+    elapsed = time.perf_counter() - start
+    if stats is not None:
+        stats.save()
+
+    print(f"Decoded {decoded}/{len(paths)} image(s) in {elapsed:.1f}s "
+          f"({len(paths) / elapsed if elapsed > 0 else 0:.1f} images/s).", file=sys.stderr)
+    if result_cache is not None:
+        print(f"Result cache: {result_cache.hits} hit(s), {result_cache.misses} miss(es).", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,291 @@
+"""Decode benchmark over a synthetic regression corpus.
+
+Usage:
+    python read.py benchmark [--corpus benchmark_corpus] [--presets datamatrix_presets.ini]
+                             [--baseline benchmark_baseline.json] [--save-baseline]
+                             [--repeat N] [--output report.json]
+
+The corpus is generated locally on first use (or with --regenerate): DataMatrix
+symbols encoded with pylibdmtx, each degraded in one controlled way (noise,
+blur, low contrast, damage, small modules) from a fixed seed, so every
+machine produces the same images. corpus.json lists each file with its
+expected text and degradation.
+
+Every preset is run over every image, uncached and in this process so the
+latencies are comparable between runs. Per preset, the decode rate (correct
+text only) and the p50/p95 latency of the whole run and of each stage are
+reported. With a baseline file, a preset whose decode rate drops or whose
+p50/p95 latency grows beyond the tolerances fails the run (exit code 1).
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from pylibdmtx.pylibdmtx import encode
+
+from pipeline import DEFAULT_DECODE_TIMEOUT_MS, decode_roi, load_presets
+
+DEFAULT_CORPUS_DIR = 'benchmark_corpus'
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+MANIFEST_NAME = 'corpus.json'
+CORPUS_SEED = 20240501
+ENCODED_MODULE_PX = 5 # pylibdmtx renders 5 pixels per module
+# (kind, settings); every payload is rendered once per variant
+DEGRADATIONS = (
+    ('clean', {}),
+    ('noise', {'sigma': 12}),
+    ('noise', {'sigma': 30}),
+    ('blur', {'sigma': 1.0}),
+    ('blur', {'sigma': 2.0}),
+    ('contrast', {'range': 0.4}),
+    ('contrast', {'range': 0.15}),
+    ('damage', {'fraction': 0.03}),
+    ('damage', {'fraction': 0.08}),
+    ('small', {'module_px': 2}),
+)
+DEFAULT_PER_VARIANT = 3
+DEFAULT_LATENCY_TOLERANCE = 0.25 # Allowed relative growth of p50/p95 latency
+DEFAULT_LATENCY_SLACK_MS = 2.0 # Absolute slack so sub-millisecond presets don't flap
+DEFAULT_RATE_TOLERANCE = 0.0 # Allowed drop of the decode rate (0.0-1.0)
+
+
+def _encode_symbol(text, module_px):
+    encoded = encode(text.encode('utf-8'))
+    pixels = np.frombuffer(encoded.pixels, dtype=np.uint8).reshape(encoded.height, encoded.width, encoded.bpp // 8)
+    gray = cv2.cvtColor(pixels[:, :, :3], cv2.COLOR_RGB2GRAY)
+    if module_px != ENCODED_MODULE_PX:
+        scale = module_px / float(ENCODED_MODULE_PX)
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST if scale >= 1 else cv2.INTER_AREA)
+    return gray
+
+
+def _degrade(gray, kind, settings, rng):
+    if kind == 'noise':
+        noisy = gray.astype(np.float32) + rng.normal(0.0, settings['sigma'], gray.shape)
+        return np.clip(noisy, 0, 255).astype(np.uint8)
+    if kind == 'blur':
+        return cv2.GaussianBlur(gray, (0, 0), settings['sigma'])
+    if kind == 'contrast':
+        return np.clip(128.0 + (gray.astype(np.float32) - 128.0) * settings['range'], 0, 255).astype(np.uint8)
+    if kind == 'damage':
+        # Blotches of random polarity about one module in size until the fraction is covered
+        damaged = gray.copy()
+        height, width = gray.shape
+        target = settings['fraction'] * height * width
+        covered = 0
+        while covered < target:
+            size = int(rng.integers(ENCODED_MODULE_PX, ENCODED_MODULE_PX * 2 + 1))
+            x, y = int(rng.integers(0, width - size)), int(rng.integers(0, height - size))
+            damaged[y:y + size, x:x + size] = 0 if rng.random() < 0.5 else 255
+            covered += size * size
+        return damaged
+    return gray
+
+
+def generate_corpus(corpus_dir, per_variant=DEFAULT_PER_VARIANT, seed=CORPUS_SEED):
+    # Writes the images and corpus.json; returns the manifest entries
+    os.makedirs(corpus_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    entries = []
+    for index in range(per_variant):
+        for kind, settings in DEGRADATIONS:
+            text = f"BENCH-{index:03d}-{int(rng.integers(0, 10 ** 8)):08d}"
+            module_px = settings.get('module_px', ENCODED_MODULE_PX)
+            symbol = _degrade(_encode_symbol(text, module_px), kind, settings, rng)
+            # Symbol on a light background, like a label in a larger frame
+            pad = symbol.shape[0] // 2
+            image = np.full((symbol.shape[0] + 2 * pad, symbol.shape[1] + 2 * pad), 235, dtype=np.uint8)
+            image[pad:pad + symbol.shape[0], pad:pad + symbol.shape[1]] = symbol
+            filename = f"{len(entries):04d}_{kind}.png"
+            cv2.imwrite(os.path.join(corpus_dir, filename), image)
+            entries.append({'file': filename, 'text': text, 'kind': kind, 'settings': settings})
+    with open(os.path.join(corpus_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump({'seed': seed, 'images': entries}, f, indent=2)
+    return entries
+
+
+def load_corpus(corpus_dir):
+    with open(os.path.join(corpus_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+        return json.load(f)['images']
+
+
+def corpus_fingerprint(corpus_dir, entries):
+    # Hash of the image bytes, so baselines are only compared on the same corpus
+    digest = hashlib.sha1()
+    for entry in entries:
+        with open(os.path.join(corpus_dir, entry['file']), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _percentiles(values):
+    if not values:
+        return {'p50_ms': None, 'p95_ms': None}
+    p50, p95 = np.percentile(values, (50, 95))
+    return {'p50_ms': round(float(p50), 3), 'p95_ms': round(float(p95), 3)}
+
+
+def run_benchmark(corpus_dir, entries, presets, timeout_ms=DEFAULT_DECODE_TIMEOUT_MS, repeat=1):
+    # Returns {preset name: summary}; summary has decode counts, latency percentiles over
+    # all runs and per-stage percentiles, plus decode counts per degradation kind
+    images = []
+    for entry in entries:
+        image = cv2.imread(os.path.join(corpus_dir, entry['file']))
+        if image is None:
+            raise FileNotFoundError(f"Corpus image missing: {entry['file']}")
+        images.append((entry, image))
+
+    results = {}
+    for section, name, params in presets:
+        totals = []
+        stage_samples = {}
+        decoded = 0
+        by_kind = {}
+        for entry, image in images:
+            correct = False
+            for _ in range(max(1, repeat)):
+                timings = {}
+                start = time.perf_counter()
+                try:
+                    text = decode_roi(image, params, timeout_ms, timings)
+                except Exception:
+                    text = None
+                totals.append((time.perf_counter() - start) * 1000.0)
+                for stage, ms in timings.items():
+                    stage_samples.setdefault(stage, []).append(ms)
+                correct = text == entry['text']
+            decoded += correct
+            kind_counts = by_kind.setdefault(entry['kind'], [0, 0])
+            kind_counts[0] += correct
+            kind_counts[1] += 1
+        results[name] = dict(
+            images=len(images),
+            decoded=decoded,
+            decode_rate=round(decoded / float(len(images)), 4) if images else 0.0,
+            stages={stage: _percentiles(values) for stage, values in stage_samples.items()},
+            by_kind={kind: {'decoded': counts[0], 'images': counts[1]} for kind, counts in by_kind.items()},
+            **_percentiles(totals))
+    return results
+
+
+def compare_to_baseline(results, baseline, latency_tolerance=DEFAULT_LATENCY_TOLERANCE,
+                        latency_slack_ms=DEFAULT_LATENCY_SLACK_MS, rate_tolerance=DEFAULT_RATE_TOLERANCE):
+    # Returns a list of human-readable regressions (empty if none). Presets missing from
+    # either side are not compared.
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get('presets', {}).get(name)
+        if previous is None:
+            continue
+        if current['decode_rate'] < previous['decode_rate'] - rate_tolerance:
+            regressions.append(f"{name}: decode rate {current['decode_rate']:.1%} < baseline {previous['decode_rate']:.1%}")
+        for key in ('p50_ms', 'p95_ms'):
+            if current[key] is None or previous.get(key) is None:
+                continue
+            limit = previous[key] * (1.0 + latency_tolerance) + latency_slack_ms
+            if current[key] > limit:
+                regressions.append(f"{name}: {key[:3]} latency {current[key]:.1f} ms > {limit:.1f} ms "
+                                   f"(baseline {previous[key]:.1f} ms)")
+    return regressions
+
+
+def _format_ms(value, width=0):
+    # Percentiles are None without samples (empty corpus, older baselines)
+    return f"{value:>{width}.1f}" if value is not None else f"{'-':>{width}}"
+
+
+def format_report(results, baseline=None):
+    lines = [f"{'Preset':<28} {'Decoded':>9} {'Rate':>7} {'p50 ms':>9} {'p95 ms':>9}  Baseline rate / p95"]
+    for name, summary in results.items():
+        previous = (baseline or {}).get('presets', {}).get(name)
+        against = "-"
+        if previous:
+            rate = previous.get('decode_rate')
+            against = f"{f'{rate:.1%}' if rate is not None else '-'} / {_format_ms(previous.get('p95_ms'))}"
+        lines.append(f"{name[:28]:<28} {summary['decoded']:>4}/{summary['images']:<4} {summary['decode_rate']:>7.1%} "
+                     f"{_format_ms(summary['p50_ms'], 9)} {_format_ms(summary['p95_ms'], 9)}  {against}")
+        stages = ", ".join(f"{stage} {_format_ms(values['p50_ms'])}/{_format_ms(values['p95_ms'])}" for stage, values in summary['stages'].items())
+        lines.append(f"    stages p50/p95 ms: {stages}")
+        kinds = ", ".join(f"{kind} {counts['decoded']}/{counts['images']}" for kind, counts in summary['by_kind'].items())
+        lines.append(f"    decoded by degradation: {kinds}")
+    return "\n".join(lines)
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(prog="read.py benchmark", description="Benchmark every preset on a synthetic DataMatrix corpus.")
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS_DIR, help="Corpus directory, generated if missing (default: %(default)s)")
+    parser.add_argument('--regenerate', action='store_true', help="Regenerate the corpus even if it exists")
+    parser.add_argument('--per-variant', type=int, default=DEFAULT_PER_VARIANT, help="Images per degradation when generating (default: %(default)s)")
+    parser.add_argument('--presets', default='datamatrix_presets.ini', help="Presets INI file (default: %(default)s)")
+    parser.add_argument('--timeout', type=int, default=DEFAULT_DECODE_TIMEOUT_MS, help="Decode timeout per preset in ms (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per image and preset, for steadier latencies (default: %(default)s)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline results to compare against (default: %(default)s)")
+    parser.add_argument('--save-baseline', action='store_true', help="Write this run as the new baseline instead of comparing")
+    parser.add_argument('--latency-tolerance', type=float, default=DEFAULT_LATENCY_TOLERANCE,
+                        help="Allowed relative p50/p95 latency growth (default: %(default)s)")
+    parser.add_argument('--rate-tolerance', type=float, default=DEFAULT_RATE_TOLERANCE,
+                        help="Allowed decode rate drop, 0-1 (default: %(default)s)")
+    parser.add_argument('--output', '-o', default=None, help="Also write the full results as JSON")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+
+    try:
+        presets = load_presets(args.presets)
+    except Exception as e:
+        print(f"Could not load presets: {e}", file=sys.stderr)
+        return 2
+    if not presets:
+        print(f"No presets found in {args.presets}", file=sys.stderr)
+        return 2
+
+    if args.regenerate or not os.path.exists(os.path.join(args.corpus, MANIFEST_NAME)):
+        print(f"Generating corpus in {args.corpus}...", file=sys.stderr)
+        entries = generate_corpus(args.corpus, args.per_variant)
+    else:
+        entries = load_corpus(args.corpus)
+    fingerprint = corpus_fingerprint(args.corpus, entries)
+
+    start = time.perf_counter()
+    results = run_benchmark(args.corpus, entries, presets, args.timeout, args.repeat)
+    elapsed = time.perf_counter() - start
+    report = {'corpus': fingerprint, 'images': len(entries), 'timeout_ms': args.timeout, 'repeat': args.repeat, 'presets': results}
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('corpus') != fingerprint or baseline.get('timeout_ms') != args.timeout:
+            print("Baseline was recorded on a different corpus or timeout; not comparing.", file=sys.stderr)
+            baseline = None
+
+    print(format_report(results, baseline))
+    print(f"{len(presets)} preset(s) x {len(entries)} image(s) in {elapsed:.1f}s", file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}", file=sys.stderr)
+        return 0
+    if baseline is None:
+        print("No baseline to compare against (run with --save-baseline to create one).", file=sys.stderr)
+        return 0
+
+    regressions = compare_to_baseline(results, baseline, args.latency_tolerance, DEFAULT_LATENCY_SLACK_MS, args.rate_tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""Module-grid sampling front-end for the decoder.
+
+Instead of letting libdmtx search the whole binarised ROI, estimate where
+the symbol is, its rotation and its module grid, then sample every module
+once and rebuild a clean, axis-aligned synthetic symbol with a quiet zone.
+Such a tiny, perfectly aligned image decodes in milliseconds, and majority
+sampling of each module also papers over small print defects.
+
+Grid estimation on the rotated-upright symbol:
+
+* module pitch from the FFT of the edge-transition projection profile,
+* module counts from the alternating clock track on the symbol border,
+  when it agrees with the FFT estimate (DataMatrix counts are always even).
+"""
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+DEFAULT_MODULE_PX = 4 # Output pixels per module; libdmtx needs a few to find edges
+DEFAULT_QUIET_MODULES = 2
+MIN_MODULES = 8 # Smallest DataMatrix side (8x18 rectangular)
+MAX_MODULES = 144
+
+
+@dataclass(frozen=True)
+class ModuleGrid:
+    image: object # Synthetic uint8 symbol, module_px pixels per module, with quiet zone
+    rows: int
+    cols: int
+    pitch: float # Estimated module size in ROI pixels
+    angle: float # Rotation applied to make the symbol upright, degrees
+
+
+def _symbol_rect(mask):
+    # Rotated bounding rectangle of the largest blob once modules are merged together
+    height, width = mask.shape[:2]
+    size = max(3, min(height, width) // 15)
+    merged = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (size, size)))
+    contours, _ = cv2.findContours(merged, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    return cv2.minAreaRect(max(contours, key=cv2.contourArea))
+
+
+def _upright_symbol(binary, background, rect):
+    # Rotates the ROI so rect is axis-aligned and crops it
+    center, _, angle = rect
+    matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
+    height, width = binary.shape[:2]
+    rotated = cv2.warpAffine(binary, matrix, (width, height), flags=cv2.INTER_NEAREST, borderValue=int(background))
+    corners = cv2.transform(cv2.boxPoints(rect)[None, :, :], matrix)[0]
+    x1, y1 = np.floor(corners.min(axis=0)).astype(int)
+    x2, y2 = np.ceil(corners.max(axis=0)).astype(int)
+    x1, y1 = max(0, x1), max(0, y1)
+    x2, y2 = min(width, x2), min(height, y2)
+    if x2 - x1 < MIN_MODULES * 2 or y2 - y1 < MIN_MODULES * 2:
+        return None
+    return rotated[y1:y2, x1:x2]
+
+
+def _fft_pitch(symbol, axis):
+    # Module pitch along axis from the dominant frequency of the transition profile
+    transitions = np.abs(np.diff(symbol.astype(np.int16), axis=axis)).sum(axis=1 - axis).astype(np.float64)
+    length = transitions.size
+    spectrum = np.abs(np.fft.rfft(transitions - transitions.mean()))
+    # One transition peak per module boundary: look for MIN_MODULES..MAX_MODULES cycles,
+    # with at least two pixels per module
+    low, high = MIN_MODULES - 2, min(length // 2, MAX_MODULES + 2)
+    if high <= low:
+        return None
+    peak = low + int(np.argmax(spectrum[low:high + 1]))
+    return length / float(peak)
+
+
+def _clock_track_count(symbol, pitch, axis):
+    # Modules along axis counted on the alternating clock track (top/bottom or left/right edge)
+    depth = max(0, int(pitch / 2))
+    if axis == 1:
+        lines = (symbol[depth, :], symbol[-1 - depth, :])
+    else:
+        lines = (symbol[:, depth], symbol[:, -1 - depth])
+    return max(int(np.count_nonzero(np.diff(line > 127))) for line in lines) + 1
+
+
+def _module_count(symbol, axis):
+    length = symbol.shape[axis]
+    pitch = _fft_pitch(symbol, axis)
+    if pitch is None:
+        return None
+    estimate = length / pitch
+    counted = _clock_track_count(symbol, pitch, axis)
+    if counted % 2 == 0 and abs(counted - estimate) <= 0.2 * estimate:
+        return counted # Exact when the clock track is readable
+    return max(2, int(round(estimate / 2.0)) * 2)
+
+
+def _sample_modules(symbol, rows, cols):
+    # Mean of a small window around every module centre, thresholded (vectorised)
+    height, width = symbol.shape[:2]
+    radius = max(0, int(min(width / float(cols), height / float(rows)) / 4))
+    offsets = np.arange(-radius, radius + 1)
+    centers_x = ((np.arange(cols) + 0.5) * width / cols).astype(int)
+    centers_y = ((np.arange(rows) + 0.5) * height / rows).astype(int)
+    sample_x = np.clip(centers_x[:, None] + offsets, 0, width - 1) # (cols, k)
+    sample_y = np.clip(centers_y[:, None] + offsets, 0, height - 1) # (rows, k)
+    patches = symbol[sample_y[:, :, None, None], sample_x[None, None, :, :]] # (rows, k, cols, k)
+    return patches.mean(axis=(1, 3)) > 127
+
+
+def sample_module_grid(binary, module_px=DEFAULT_MODULE_PX, quiet_modules=DEFAULT_QUIET_MODULES):
+    # Returns a ModuleGrid for the symbol in a thresholded ROI, or None if no plausible grid
+    # was found (the caller then decodes the ROI as usual)
+    if binary is None or binary.ndim != 2 or min(binary.shape) < MIN_MODULES * 2:
+        return None
+    background = 255 if cv2.mean(binary)[0] > 127 else 0
+    mask = (binary != background).astype(np.uint8) * 255
+    rect = _symbol_rect(mask)
+    if rect is None:
+        return None
+    symbol = _upright_symbol(binary, background, rect)
+    if symbol is None:
+        return None
+
+    cols = _module_count(symbol, 1)
+    rows = _module_count(symbol, 0)
+    if cols is None or rows is None or not (MIN_MODULES <= min(rows, cols) and max(rows, cols) <= MAX_MODULES):
+        return None
+
+    modules = _sample_modules(symbol, rows, cols)
+    grid = np.full((rows + 2 * quiet_modules, cols + 2 * quiet_modules), background, dtype=np.uint8)
+    grid[quiet_modules:quiet_modules + rows, quiet_modules:quiet_modules + cols] = np.where(modules, 255, 0)
+    image = np.repeat(np.repeat(grid, module_px, axis=0), module_px, axis=1)
+    pitch = (symbol.shape[1] / float(cols) + symbol.shape[0] / float(rows)) / 2.0
+    return ModuleGrid(image=image, rows=rows, cols=cols, pitch=pitch, angle=float(rect[2]))
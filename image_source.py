@@ -0,0 +1,315 @@
+"""Lazy image loading: a small display proxy plus full-resolution ROI reads.
+
+Large images are not decoded into RAM up front. open_image reads the file
+header, builds a downscaled proxy for the canvas and reads full-resolution
+pixels only for the ROI that is actually processed:
+
+* JPEG: the proxy is decoded at 1/2, 1/4 or 1/8 resolution by libjpeg
+  (IMREAD_REDUCED_*); the full image is decoded on the first ROI read.
+* Uncompressed TIFF/BMP/PGM: pixels are memory-mapped and streamed into
+  the proxy band by band, so only the ROI rows are ever resident.
+* Anything else is decoded once and kept as 8-bit BGR.
+
+16-bit (and float) images are mapped to 8 bit with levels taken from the
+proxy, so the display and every ROI read agree. Small 8-bit images are
+loaded whole, exactly as before.
+"""
+import numpy as np
+import cv2
+from PIL import Image
+
+# Pillow's decompression-bomb guard rejects multi-gigapixel scans, which this module is
+# built to open lazily. It is switched off once, here, rather than around each open:
+# images are opened from several threads (GUI, preview worker, watch loader) and a
+# per-call toggle of this process-wide setting races between them.
+Image.MAX_IMAGE_PIXELS = None
+
+DEFAULT_PROXY_MAX_SIDE = 4096 # Longest side of the display proxy
+DEFAULT_IN_MEMORY_PIXELS = 40000000 # 8-bit images up to this many pixels are loaded whole
+PROXY_BAND_ROWS = 64 # Proxy rows computed per band when streaming a memory-mapped image
+
+# Pillow modes that cv2.imread turns into 8-bit BGR without losing precision
+EIGHT_BIT_MODES = ('1', 'L', 'LA', 'P', 'RGB', 'RGBA', 'RGBX', 'CMYK', 'YCbCr')
+
+# Pillow raw modes that map 1:1 onto a NumPy array: rawmode -> (dtype, channels)
+_RAW_LAYOUTS = {
+    'L': ('u1', 1),
+    'I;16': ('<u2', 1),
+    'I;16L': ('<u2', 1),
+    'I;16B': ('>u2', 1),
+    'I;16N': ('=u2', 1),
+    'RGB': ('u1', 3),
+    'BGR': ('u1', 3),
+    'RGBA': ('u1', 4),
+    'RGBX': ('u1', 4),
+    'BGRA': ('u1', 4),
+    'BGRX': ('u1', 4),
+}
+
+_REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+class ImageSource:
+    # Full-resolution pixels are held in memory (small images, clipboard, decoded files),
+    # memory-mapped read-only, or decoded on first use by loader. Coordinates passed in and
+    # out are always full-resolution image coordinates.
+    def __init__(self, width, height, proxy, pixels=None, order='BGR', levels=None, loader=None,
+                 page=0, page_count=1):
+        self.width = width
+        self.height = height
+        self.proxy = proxy # 8-bit BGR display image, possibly downscaled
+        self.pixels = pixels # Full-resolution pixels, native dtype; None until loader has run
+        self.order = order # Channel order of pixels: 'BGR' or 'RGB'
+        self.levels = levels # (low, high) mapped to 0..255 for non-8-bit pixels
+        self.loader = loader
+        self.page = page
+        self.page_count = page_count
+        self.edits = [] # (box, color) fills applied on read when pixels are read-only
+
+    @classmethod
+    def from_array(cls, image):
+        # In-memory 8-bit BGR image; the proxy is the image itself
+        return cls(image.shape[1], image.shape[0], image, pixels=image)
+
+    @property
+    def is_proxy(self):
+        # True if the display image is a reduced copy rather than the full-resolution pixels
+        return self.proxy is not self.pixels
+
+    @property
+    def proxy_scale(self):
+        # Proxy pixels per full-resolution pixel
+        return self.proxy.shape[1] / float(self.width)
+
+    def to_proxy(self, box):
+        # Full-resolution box to the proxy pixels covering it (at least one pixel)
+        scale = self.proxy_scale
+        proxy_h, proxy_w = self.proxy.shape[:2]
+        x1 = min(int(box[0] * scale), proxy_w - 1)
+        y1 = min(int(box[1] * scale), proxy_h - 1)
+        x2 = min(max(int(np.ceil(box[2] * scale)), x1 + 1), proxy_w)
+        y2 = min(max(int(np.ceil(box[3] * scale)), y1 + 1), proxy_h)
+        return (x1, y1, x2, y2)
+
+    def _writable(self):
+        pixels = self.pixels
+        return (pixels is not None and pixels.flags.writeable and pixels.dtype == np.uint8
+                and pixels.ndim == 3 and pixels.shape[2] == 3 and self.order == 'BGR')
+
+    def _ensure_pixels(self):
+        if self.pixels is not None or self.loader is None:
+            return
+        self.pixels = self.loader()
+        self.loader = None
+        if self._writable():
+            # Fills made while the pixels were not loaded yet
+            for (x1, y1, x2, y2), color in self.edits:
+                self.pixels[y1:y2, x1:x2] = color
+            self.edits = []
+
+    def read_region(self, box):
+        # 8-bit BGR full-resolution pixels for box (x1, y1, x2, y2), or None if it is empty.
+        # In-memory images return a view, like crop_selection; other sources return a copy.
+        if not box:
+            return None
+        x1, y1 = max(0, box[0]), max(0, box[1])
+        x2, y2 = min(self.width, box[2]), min(self.height, box[3])
+        if x1 >= x2 or y1 >= y2:
+            return None
+        self._ensure_pixels()
+        if self.pixels is None:
+            return None
+        region = self.pixels[y1:y2, x1:x2]
+        if self._writable():
+            return region
+
+        region = _to_bgr8(region, self.order, self.levels)
+        for (ex1, ey1, ex2, ey2), color in self.edits:
+            ix1, iy1 = max(ex1, x1), max(ey1, y1)
+            ix2, iy2 = min(ex2, x2), min(ey2, y2)
+            if ix1 < ix2 and iy1 < iy2:
+                region[iy1 - y1:iy2 - y1, ix1 - x1:ix2 - x1] = color
+        return region
+
+    def fill_rect(self, box, color):
+        # Paints box (exclusive x2/y2) with a BGR color at full resolution and mirrors it into
+        # the proxy. Read-only pixels keep the edit and apply it on every read.
+        x1, y1, x2, y2 = box
+        if self._writable():
+            self.pixels[y1:y2, x1:x2] = color
+        else:
+            self.edits.append((box, color))
+        if self.is_proxy:
+            px1, py1, px2, py2 = self.to_proxy(box)
+            self.proxy[py1:py2, px1:px2] = color
+
+
+def _open_header(path):
+    # Pillow only parses the header here; pixels are read tile by tile or through a proxy
+    return Image.open(path)
+
+
+def _native(pixels):
+    # OpenCV needs native byte order and C-contiguous rows
+    if not pixels.dtype.isnative:
+        pixels = pixels.astype(pixels.dtype.newbyteorder('='))
+    return np.ascontiguousarray(pixels)
+
+
+def _to_bgr8(pixels, order, levels):
+    # Copy of pixels as 8-bit BGR; non-8-bit data is stretched from levels to 0..255
+    if pixels.ndim == 3 and pixels.shape[2] == 1:
+        pixels = pixels[:, :, 0]
+    if pixels.dtype != np.uint8:
+        low, high = levels
+        scaled = (_native(pixels).astype(np.float32) - low) * (255.0 / max(high - low, 1e-6))
+        np.clip(scaled, 0, 255, out=scaled)
+        pixels = scaled.astype(np.uint8)
+    else:
+        pixels = _native(pixels)
+
+    if pixels.ndim == 2:
+        return cv2.cvtColor(pixels, cv2.COLOR_GRAY2BGR)
+    if pixels.shape[2] == 4:
+        return cv2.cvtColor(pixels, cv2.COLOR_RGBA2BGR if order == 'RGB' else cv2.COLOR_BGRA2BGR)
+    if order == 'RGB':
+        return cv2.cvtColor(pixels, cv2.COLOR_RGB2BGR)
+    return pixels.copy() if pixels.base is not None else pixels
+
+
+def _levels(pixels):
+    # Robust black/white points, ignoring isolated hot and dead pixels
+    low, high = np.percentile(pixels[::4, ::4], (0.1, 99.9))
+    return (float(low), float(high))
+
+
+def _proxy_size(width, height, proxy_max_side):
+    factor = max(width, height) / float(proxy_max_side)
+    if factor <= 1.0:
+        return None
+    return (max(1, int(round(width / factor))), max(1, int(round(height / factor))))
+
+
+def _area_downscale(pixels, size):
+    # INTER_AREA resize in horizontal bands, so only one band of full-resolution rows of a
+    # memory-mapped image is resident at a time
+    out_w, out_h = size
+    height = pixels.shape[0]
+    bands = []
+    for out_y1 in range(0, out_h, PROXY_BAND_ROWS):
+        out_y2 = min(out_h, out_y1 + PROXY_BAND_ROWS)
+        band = _native(pixels[out_y1 * height // out_h:out_y2 * height // out_h])
+        bands.append(cv2.resize(band, (out_w, out_y2 - out_y1), interpolation=cv2.INTER_AREA))
+    return np.concatenate(bands)
+
+
+def _memmap_pixels(path, pil_image):
+    # Memory-maps uncompressed, strip-contiguous pixel data described by Pillow's tile list.
+    # Returns (array, channel order), or None if the layout can't be mapped directly.
+    tiles = pil_image.tile
+    if not tiles or any(tile[0] != 'raw' for tile in tiles):
+        return None
+    args = [tile[3] if isinstance(tile[3], tuple) else (tile[3],) for tile in tiles]
+    rawmode = args[0][0]
+    layout = _RAW_LAYOUTS.get(rawmode)
+    if layout is None:
+        return None
+
+    width, height = pil_image.size
+    dtype, channels = np.dtype(layout[0]), layout[1]
+    row_bytes = width * channels * dtype.itemsize
+    stride = args[0][1] if len(args[0]) > 1 and args[0][1] else row_bytes
+    orientation = args[0][2] if len(args[0]) > 2 else 1
+    offset = tiles[0][2]
+    for tile, tile_args in zip(tiles, args):
+        x1, y1, x2, _ = tile[1]
+        tile_stride = tile_args[1] if len(tile_args) > 1 and tile_args[1] else row_bytes
+        if tile_args[0] != rawmode or x1 != 0 or x2 != width or tile_stride != stride or tile[2] != offset + y1 * stride:
+            return None # Tiled or non-contiguous strips
+
+    data = np.memmap(path, dtype=np.uint8, mode='r', offset=offset, shape=(stride * (height - 1) + row_bytes,))
+    if channels == 1:
+        pixels = np.ndarray((height, width), dtype=dtype, buffer=data, strides=(stride, dtype.itemsize))
+    else:
+        pixels = np.ndarray((height, width, channels), dtype=dtype, buffer=data,
+                            strides=(stride, channels * dtype.itemsize, dtype.itemsize))
+    if orientation < 0:
+        pixels = pixels[::-1] # Bottom-up rows (BMP)
+    return pixels, ('BGR' if rawmode.startswith('BGR') else 'RGB')
+
+
+def _source_from_native(pixels, order, proxy_max_side, mapped, page, page_count):
+    height, width = pixels.shape[:2]
+    size = _proxy_size(width, height, proxy_max_side)
+    proxy_native = _area_downscale(pixels, size) if size is not None else _native(pixels)
+    levels = _levels(proxy_native) if pixels.dtype != np.uint8 else None
+    if mapped:
+        proxy = _to_bgr8(proxy_native, order, levels)
+        return ImageSource(width, height, proxy, pixels=pixels, order=order, levels=levels,
+                           page=page, page_count=page_count)
+
+    # Decoded into memory anyway: keep only the 8-bit BGR copy
+    image = _to_bgr8(pixels, order, levels)
+    if size is None:
+        source = ImageSource.from_array(image)
+    else:
+        source = ImageSource(width, height, cv2.resize(image, size, interpolation=cv2.INTER_AREA), pixels=image)
+    source.page, source.page_count = page, page_count
+    return source
+
+
+def _open_jpeg(path, pil_image, proxy_max_side):
+    width, height = pil_image.size
+    if pil_image.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+        width, height = height, width # cv2.imread applies the EXIF rotation
+    factor = max(width, height) / float(proxy_max_side)
+    reduction = max([r for r in (1, 2, 4, 8) if r <= factor] or [1])
+    if reduction == 1:
+        image = cv2.imread(path)
+        return ImageSource.from_array(image) if image is not None else None
+    proxy = cv2.imread(path, _REDUCED_FLAGS[reduction])
+    if proxy is None:
+        return None
+    return ImageSource(width, height, proxy, loader=lambda: cv2.imread(path))
+
+
+def open_image(path, page=0, proxy_max_side=DEFAULT_PROXY_MAX_SIDE, in_memory_pixels=DEFAULT_IN_MEMORY_PIXELS):
+    # Returns an ImageSource for page of path, or None if it can't be read (like cv2.imread)
+    try:
+        header = _open_header(path)
+    except (OSError, ValueError):
+        header = None # Formats Pillow can't parse may still load through OpenCV
+    if header is None:
+        image = cv2.imread(path) if page == 0 else None
+        return ImageSource.from_array(image) if image is not None else None
+
+    pil_image = header
+    try:
+        page_count = getattr(pil_image, 'n_frames', 1)
+        if page:
+            pil_image.seek(page)
+        width, height = pil_image.size
+        if page == 0 and pil_image.mode in EIGHT_BIT_MODES and width * height <= in_memory_pixels:
+            image = cv2.imread(path)
+            return ImageSource.from_array(image) if image is not None else None
+        if pil_image.format == 'JPEG':
+            return _open_jpeg(path, pil_image, proxy_max_side)
+
+        mapped = _memmap_pixels(path, pil_image)
+        if mapped is not None:
+            return _source_from_native(mapped[0], mapped[1], proxy_max_side, True, page, page_count)
+
+        # Compressed: decode this page once
+        if page == 0:
+            pixels, order = cv2.imread(path, cv2.IMREAD_ANYDEPTH | cv2.IMREAD_ANYCOLOR), 'BGR'
+        else:
+            if pil_image.mode in ('1', 'P', 'CMYK', 'YCbCr', 'LA'):
+                pil_image = pil_image.convert('RGB')
+            pixels, order = np.array(pil_image), 'RGB'
+        if pixels is None:
+            return None
+        return _source_from_native(pixels, order, proxy_max_side, False, page, page_count)
+    except (OSError, EOFError, ValueError):
+        return None
+    finally:
+        header.close()
@@ -0,0 +1,113 @@
+"""Automatic DataMatrix candidate localisation.
+
+A DataMatrix is a compact, roughly square area that is dense in edges in both
+the horizontal and vertical direction. The finder works on a downscaled
+grayscale copy of the frame, builds per-direction gradient density maps,
+keeps the blobs where both are high and returns padded bounding boxes in
+original image coordinates, best first. The boxes are meant as selections
+for the regular pipeline, so they err on the side of including a quiet zone.
+"""
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+DEFAULT_WORK_SIZE = 1024 # Longest side of the downscaled search image
+DEFAULT_MAX_CANDIDATES = 5
+
+
+@dataclass(frozen=True)
+class CandidateROI:
+    x1: int
+    y1: int
+    x2: int
+    y2: int
+    score: float
+
+    @property
+    def selection(self):
+        # Same (x1, y1, x2, y2) tuple as DataMatrixReader.selection
+        return (self.x1, self.y1, self.x2, self.y2)
+
+
+def _overlap_ratio(a, b):
+    # Intersection over the smaller box, used to drop nested/duplicate blobs
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    smaller = min((a[2] - a[0]) * (a[3] - a[1]), (b[2] - b[0]) * (b[3] - b[1]))
+    return (ix * iy) / smaller if smaller > 0 else 0.0
+
+
+def find_candidate_rois(image, max_candidates=DEFAULT_MAX_CANDIDATES, work_size=DEFAULT_WORK_SIZE,
+                        min_side_frac=0.02, max_aspect=4.0, padding_frac=0.15, full_size=None):
+    # full_size (width, height) is given when image is a downscaled proxy; boxes are then
+    # returned in full-resolution coordinates
+    if image is None or image.size == 0:
+        return []
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if gray.dtype != np.uint8:
+        gray = cv2.normalize(gray, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+
+    img_h, img_w = gray.shape[:2]
+    scale = min(1.0, work_size / float(max(img_h, img_w)))
+    if scale < 1.0:
+        small = cv2.resize(gray, (max(1, int(img_w * scale)), max(1, int(img_h * scale))), interpolation=cv2.INTER_AREA)
+    else:
+        small = gray
+    small_h, small_w = small.shape[:2]
+    out_w, out_h = full_size or (img_w, img_h)
+    scale_x, scale_y = small_w / float(out_w), small_h / float(out_h) # Work pixels per output pixel
+
+    # Gradient density per direction; a symbol is dense in both, text and 1D codes mostly in one
+    window = max(3, (max(small_h, small_w) // 100) | 1)
+    grad_x = cv2.convertScaleAbs(cv2.Sobel(small, cv2.CV_16S, 1, 0, ksize=3))
+    grad_y = cv2.convertScaleAbs(cv2.Sobel(small, cv2.CV_16S, 0, 1, ksize=3))
+    density_x = cv2.blur(grad_x, (window, window))
+    density_y = cv2.blur(grad_y, (window, window))
+    density = cv2.min(density_x, density_y)
+
+    _, mask = cv2.threshold(density, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # Merge the modules of one symbol into a single blob, then drop speckles
+    close_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (window * 2 + 1, window * 2 + 1))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, close_kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (window, window)))
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_side = max(8, int(min_side_frac * max(small_h, small_w)))
+
+    scored = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w < min_side or h < min_side:
+            continue
+        aspect = max(w, h) / float(min(w, h))
+        if aspect > max_aspect:
+            continue
+        fill = cv2.contourArea(contour) / float(w * h)
+        if fill < 0.4:
+            continue
+        mean_density = float(cv2.mean(density[y:y + h, x:x + w])[0])
+        # Prefer dense, well-filled, square blobs
+        score = mean_density * fill / aspect
+        scored.append((score, (x, y, x + w, y + h)))
+
+    scored.sort(key=lambda item: item[0], reverse=True)
+
+    candidates = []
+    kept_boxes = []
+    for score, box in scored:
+        if any(_overlap_ratio(box, kept) > 0.5 for kept in kept_boxes):
+            continue
+        kept_boxes.append(box)
+
+        # Pad for the quiet zone and map back to original image coordinates
+        x1, y1, x2, y2 = box
+        pad = int(max(x2 - x1, y2 - y1) * padding_frac)
+        x1 = max(0, int((x1 - pad) / scale_x))
+        y1 = max(0, int((y1 - pad) / scale_y))
+        x2 = min(out_w, int((x2 + pad) / scale_x))
+        y2 = min(out_h, int((y2 + pad) / scale_y))
+        candidates.append(CandidateROI(x1, y1, x2, y2, score))
+        if len(candidates) >= max_candidates:
+            break
+    return candidates
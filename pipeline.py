@@ -0,0 +1,610 @@
+"""Headless preprocessing and decode engine for DataMatrix regions.
+
+This mirrors the stage order of the GUI (grayscale -> upscale -> denoise ->
+sharpen -> CLAHE -> threshold -> invert -> erode/close/open) but takes its
+parameters from an immutable ProcessingParams object instead of Tk
+variables, so it can run in worker processes and on machines without a
+display.
+"""
+import configparser
+import functools
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+
+import cv2
+import numpy as np
+from PIL import Image
+from pylibdmtx.pylibdmtx import decode as dmtx_decode
+
+from grid_sample import sample_module_grid
+
+DEFAULT_DECODE_TIMEOUT_MS = 1000
+GRID_DECODE_TIMEOUT_MS = 200 # The synthetic grid symbol decodes almost instantly or not at all
+
+# Sharpening kernel, built once
+SHARPEN_KERNEL = np.array([[-1, -1, -1],
+                           [-1,  9, -1],
+                           [-1, -1, -1]], dtype=np.float32)
+
+# libdmtx DmtxSymbolSize values accepted by pylibdmtx's shape argument
+DMTX_SHAPES = {
+    'AUTO': None, # libdmtx default (DmtxSymbolShapeAuto)
+    'SQUARE': -2, # DmtxSymbolSquareAuto
+    'RECT': -3, # DmtxSymbolRectAuto
+}
+
+# Interpolations for the ROI upscale stage. REPLICATE copies every pixel into a whole
+# k x k block, which keeps the module edges of printed codes perfectly sharp.
+UPSCALE_INTERPOLATIONS = {
+    'NEAREST': cv2.INTER_NEAREST,
+    'LANCZOS': cv2.INTER_LANCZOS4,
+    'REPLICATE': None,
+}
+
+
+@dataclass(frozen=True)
+class ProcessingParams:
+    # Same fields (and defaults) as a [PresetN] section in datamatrix_presets.ini
+    thresh_val: int = 127
+    inverse: bool = False
+    erode_size: int = 2
+    erode_iter: int = 1
+    close_size: int = 4
+    open_size: int = 3
+    sharpness_factor: int = 0
+    denoise_strength: int = 0
+    use_adaptive_thresh: bool = False
+    adaptive_method: str = "GAUSSIAN" # "GAUSSIAN" or "MEAN"
+    adaptive_block_size_raw: int = 5 # Represents (value*2)+1
+    adaptive_c_value: int = 2
+    clahe_clip_limit: float = 2.0 # <= 0 disables CLAHE
+    clahe_tile_grid: int = 8 # Tiles per side
+    upscale_factor: float = 1.0 # ROI-only upscaling before denoising; 1.0 = off
+    upscale_interpolation: str = "LANCZOS" # Key of UPSCALE_INTERPOLATIONS
+    # libdmtx decoder options; 0 means "not set" (libdmtx default) except for shrink
+    dmtx_shrink: int = 1
+    dmtx_max_count: int = 0
+    dmtx_min_edge: int = 0
+    dmtx_max_edge: int = 0
+    dmtx_threshold: int = 0
+    dmtx_deviation: int = 0
+    dmtx_shape: str = "AUTO" # "AUTO", "SQUARE" or "RECT"
+    dmtx_auto_edges: bool = False # Derive min/max edge from the ROI size
+    grid_sample: bool = False # Try a sampled module-grid symbol before the full ROI (grid_sample.py)
+
+    @classmethod
+    def from_config_section(cls, config, section):
+        # Morphology and threshold keys are required, as they always were for presets;
+        # everything added later falls back to the defaults.
+        return cls(
+            thresh_val=config.getint(section, 'thresh_val'),
+            inverse=config.getboolean(section, 'inverse'),
+            erode_size=config.getint(section, 'erode_size'),
+            erode_iter=config.getint(section, 'erode_iter'),
+            close_size=config.getint(section, 'close_size'),
+            open_size=config.getint(section, 'open_size'),
+            sharpness_factor=config.getint(section, 'sharpness_factor', fallback=0),
+            denoise_strength=config.getint(section, 'denoise_strength', fallback=0),
+            use_adaptive_thresh=config.getboolean(section, 'use_adaptive_thresh', fallback=False),
+            adaptive_method=config.get(section, 'adaptive_method', fallback="GAUSSIAN"),
+            adaptive_block_size_raw=config.getint(section, 'adaptive_block_size_raw', fallback=5),
+            adaptive_c_value=config.getint(section, 'adaptive_c_value', fallback=2),
+            clahe_clip_limit=config.getfloat(section, 'clahe_clip_limit', fallback=2.0),
+            clahe_tile_grid=config.getint(section, 'clahe_tile_grid', fallback=8),
+            upscale_factor=config.getfloat(section, 'upscale_factor', fallback=1.0),
+            upscale_interpolation=config.get(section, 'upscale_interpolation', fallback="LANCZOS").upper(),
+            dmtx_shrink=config.getint(section, 'dmtx_shrink', fallback=1),
+            dmtx_max_count=config.getint(section, 'dmtx_max_count', fallback=0),
+            dmtx_min_edge=config.getint(section, 'dmtx_min_edge', fallback=0),
+            dmtx_max_edge=config.getint(section, 'dmtx_max_edge', fallback=0),
+            dmtx_threshold=config.getint(section, 'dmtx_threshold', fallback=0),
+            dmtx_deviation=config.getint(section, 'dmtx_deviation', fallback=0),
+            dmtx_shape=config.get(section, 'dmtx_shape', fallback="AUTO").upper(),
+            dmtx_auto_edges=config.getboolean(section, 'dmtx_auto_edges', fallback=False),
+            grid_sample=config.getboolean(section, 'grid_sample', fallback=False),
+        )
+
+    def validate(self):
+        # Raises ValueError for settings the stages or libdmtx cannot work with; returns self
+        problems = []
+        if not 0 <= self.thresh_val <= 255:
+            problems.append(f"thresh_val {self.thresh_val} not in 0-255")
+        for key in ('erode_size', 'close_size', 'open_size', 'adaptive_block_size_raw', 'clahe_tile_grid', 'dmtx_shrink'):
+            if getattr(self, key) < 1:
+                problems.append(f"{key} must be at least 1")
+        if self.erode_iter < 0:
+            problems.append("erode_iter must not be negative")
+        if self.adaptive_method not in ("GAUSSIAN", "MEAN"):
+            problems.append(f"unknown adaptive_method '{self.adaptive_method}'")
+        if self.upscale_interpolation not in UPSCALE_INTERPOLATIONS:
+            problems.append(f"unknown upscale_interpolation '{self.upscale_interpolation}'")
+        if self.upscale_factor <= 0:
+            problems.append("upscale_factor must be positive")
+        if self.dmtx_shape not in DMTX_SHAPES:
+            problems.append(f"unknown dmtx_shape '{self.dmtx_shape}'")
+        if problems:
+            raise ValueError("; ".join(problems))
+        return self
+
+    def upscale_scale(self):
+        # Effective ROI upscale factor; REPLICATE only does whole-pixel blocks
+        if self.upscale_interpolation == 'REPLICATE':
+            return float(max(1, int(round(self.upscale_factor))))
+        return max(1.0, self.upscale_factor)
+
+    def decode_kwargs(self, image_shape):
+        # Keyword arguments for pylibdmtx.decode; unset options are left to libdmtx.
+        # Telling libdmtx the expected symbol size and max_count=1 lets the scan stop much earlier.
+        kwargs = {}
+        if self.dmtx_shrink > 1:
+            kwargs['shrink'] = self.dmtx_shrink
+        if self.dmtx_max_count > 0:
+            kwargs['max_count'] = self.dmtx_max_count
+        if self.dmtx_threshold > 0:
+            kwargs['threshold'] = self.dmtx_threshold
+        if self.dmtx_deviation > 0:
+            kwargs['deviation'] = self.dmtx_deviation
+        shape = DMTX_SHAPES.get(self.dmtx_shape)
+        if shape is not None:
+            kwargs['shape'] = shape
+
+        # Edge limits are given in ROI pixels; the decoder sees the upscaled ROI
+        scale = self.upscale_scale()
+        min_edge, max_edge = int(self.dmtx_min_edge * scale), int(self.dmtx_max_edge * scale)
+        if self.dmtx_auto_edges:
+            # A roughly framed ROI holds a symbol between a quarter of and the full ROI size
+            height, width = image_shape[:2]
+            min_edge = max(min_edge, int(min(height, width) * 0.25))
+            max_edge = max(height, width) if max_edge <= 0 else min(max_edge, max(height, width))
+        if min_edge > 0:
+            kwargs['min_edge'] = min_edge
+        if max_edge > 0:
+            kwargs['max_edge'] = max_edge
+        return kwargs
+
+    def to_config_dict(self):
+        # String values ready for ConfigParser.set / section assignment
+        return {key: str(value) for key, value in asdict(self).items()}
+
+
+@dataclass(frozen=True)
+class PipelineResult:
+    processed: object # Binary uint8 image, or None if the ROI was empty
+    decoded_text: object # Decoded UTF-8 string, or None
+
+
+def crop_selection(image, selection):
+    # Returns the BGR crop for selection (x1, y1, x2, y2), or None if it is empty
+    if image is None or not selection:
+        return None
+    x1, y1, x2, y2 = selection
+    if x1 >= x2 or y1 >= y2:
+        return None
+    cropped = image[y1:y2, x1:x2]
+    if cropped.shape[0] == 0 or cropped.shape[1] == 0:
+        return None
+    return cropped
+
+
+def _record_stage(timings, stage, start):
+    # Accumulate wall time in ms for stage if the caller asked for timings
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + (time.perf_counter() - start) * 1000.0
+
+
+class StageCache:
+    # LRU cache of intermediate stage outputs, bounded by entry count and bytes.
+    # Keys are (roi_key, stage, parameters of this stage and every stage before it),
+    # so changing a late-stage parameter reuses the earlier outputs. The roi_key must
+    # change whenever the pixels change (the GUI uses image version + selection).
+    # Cached arrays are shared and must not be modified in place.
+    def __init__(self, max_entries=64, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key).nbytes
+            self.entries[key] = value
+            self.total_bytes += value.nbytes
+            while self.entries and (len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+# OpenCV objects and buffers reused across runs. CLAHE objects carry internal state and
+# scratch buffers are overwritten on every call, so each thread (GUI, preview worker) has its own.
+_resources = threading.local()
+
+
+@functools.lru_cache(maxsize=64)
+def _rect_kernel(size):
+    # Structuring elements are small read-only arrays and safe to share between threads
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (size, size))
+    kernel.setflags(write=False)
+    return kernel
+
+
+def _clahe(clip_limit, tile_grid):
+    objects = getattr(_resources, 'clahe', None)
+    if objects is None:
+        objects = _resources.clahe = {}
+    clahe = objects.get((clip_limit, tile_grid))
+    if clahe is None:
+        clahe = objects[(clip_limit, tile_grid)] = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=(tile_grid, tile_grid))
+    return clahe
+
+
+def _scratch(name, shape):
+    # Per-thread uint8 buffer for intermediates that never leave a stage, reallocated only
+    # when the ROI shape changes. Stage outputs go into the StageCache and are always new arrays.
+    buffers = getattr(_resources, 'scratch', None)
+    if buffers is None:
+        buffers = _resources.scratch = {}
+    buffer = buffers.get(name)
+    if buffer is None or buffer.shape != shape:
+        buffer = buffers[name] = np.empty(shape, dtype=np.uint8)
+    return buffer
+
+
+def _stage_gray(image, params):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def _stage_upscale(gray, params):
+    # Enlarge only the ROI, after grayscale conversion so a single channel is resized
+    scale = params.upscale_scale()
+    if scale <= 1.0:
+        return gray
+    if params.upscale_interpolation == 'REPLICATE':
+        factor = int(scale)
+        return np.repeat(np.repeat(gray, factor, axis=0), factor, axis=1)
+    height, width = gray.shape[:2]
+    interpolation = UPSCALE_INTERPOLATIONS.get(params.upscale_interpolation, cv2.INTER_LANCZOS4)
+    return cv2.resize(gray, (int(round(width * scale)), int(round(height * scale))), interpolation=interpolation)
+
+
+def _stage_denoise(gray, params):
+    # Apply Denoising if strength > 0
+    if params.denoise_strength <= 0:
+        return gray
+    # h regulates filter strength; template/search windows are the recommended 7/21
+    return cv2.fastNlMeansDenoising(gray, h=float(params.denoise_strength), templateWindowSize=7, searchWindowSize=21)
+
+
+def _stage_sharpen(gray, params):
+    # Apply sharpening if factor > 0
+    if params.sharpness_factor <= 0:
+        return gray
+    alpha = params.sharpness_factor / 100.0 # Convert to 0.0-1.0
+    sharpened_gray = cv2.filter2D(gray, -1, SHARPEN_KERNEL, dst=_scratch('sharpen', gray.shape))
+    # Blend the original gray image with the sharpened one; addWeighted saturates to uint8
+    return cv2.addWeighted(gray, 1.0 - alpha, sharpened_gray, alpha, 0)
+
+
+def _stage_clahe(gray, params):
+    # Improve contrast using CLAHE
+    if params.clahe_clip_limit <= 0:
+        return gray
+    return _clahe(params.clahe_clip_limit, max(1, params.clahe_tile_grid)).apply(gray)
+
+
+def _stage_threshold(gray, params):
+    # Apply binary threshold (Global or Adaptive)
+    if params.use_adaptive_thresh:
+        method = cv2.ADAPTIVE_THRESH_GAUSSIAN_C if params.adaptive_method == "GAUSSIAN" else cv2.ADAPTIVE_THRESH_MEAN_C
+        block_size_val = params.adaptive_block_size_raw * 2 + 1 # Ensure odd: 1->3, 2->5, ...
+        if block_size_val < 3: block_size_val = 3 # Minimum block size
+        processed = cv2.adaptiveThreshold(gray, 255, method,
+                                          cv2.THRESH_BINARY, block_size_val, params.adaptive_c_value)
+    else:
+        _, processed = cv2.threshold(gray, params.thresh_val, 255, cv2.THRESH_BINARY)
+
+    # Invert if needed (applies to both global and adaptive result); processed is ours, so in place
+    if params.inverse:
+        cv2.bitwise_not(processed, dst=processed)
+    return processed
+
+
+def _stage_morphology(processed, params):
+    eroded = cv2.erode(processed, _rect_kernel(params.erode_size), dst=_scratch('erode', processed.shape),
+                       iterations=params.erode_iter)
+    closed = cv2.morphologyEx(eroded, cv2.MORPH_CLOSE, _rect_kernel(params.close_size),
+                              dst=_scratch('close', processed.shape))
+    return cv2.morphologyEx(closed, cv2.MORPH_OPEN, _rect_kernel(params.open_size))
+
+
+def _upscale_key(params):
+    scale = params.upscale_scale()
+    if scale <= 1.0:
+        return ()
+    return (scale, params.upscale_interpolation)
+
+
+def _threshold_key(params):
+    # Only the parameters that affect the active threshold mode
+    if params.use_adaptive_thresh:
+        return ('adaptive', params.adaptive_method, params.adaptive_block_size_raw, params.adaptive_c_value, params.inverse)
+    return ('global', params.thresh_val, params.inverse)
+
+
+# (stage name, function returning this stage's own cache key, stage function), in pipeline order
+STAGES = (
+    ('gray', lambda params: (), _stage_gray),
+    ('upscale', _upscale_key, _stage_upscale),
+    ('denoise', lambda params: (max(params.denoise_strength, 0),), _stage_denoise),
+    ('sharpen', lambda params: (max(params.sharpness_factor, 0),), _stage_sharpen),
+    ('clahe', lambda params: (max(params.clahe_clip_limit, 0.0), params.clahe_tile_grid), _stage_clahe),
+    ('threshold', _threshold_key, _stage_threshold),
+    ('morphology', lambda params: (params.erode_size, params.erode_iter, params.close_size, params.open_size), _stage_morphology),
+)
+
+
+def _expand_box(box, margin, width, height):
+    x1, y1, x2, y2 = box
+    return (max(0, x1 - margin), max(0, y1 - margin), min(width, x2 + margin), min(height, y2 + margin))
+
+
+def _local_stage_radius(name, params):
+    # Neighbourhood radius of stages whose output at a pixel depends only on nearby input
+    # pixels, so a dirty region can be recomputed in place. 0 means a pass-through stage.
+    # CLAHE (tile histograms) and everything after it is not handled and recomputed in full.
+    if name == 'gray':
+        return 0
+    if name == 'upscale':
+        return 0 if params.upscale_scale() <= 1.0 else None # Changes the geometry when active
+    if name == 'denoise':
+        return 7 // 2 + 21 // 2 if params.denoise_strength > 0 else 0 # templateWindowSize/2 + searchWindowSize/2
+    if name == 'sharpen':
+        return 1 if params.sharpness_factor > 0 else 0 # 3x3 kernel
+    if name == 'clahe' and params.clahe_clip_limit <= 0:
+        return 0
+    return None
+
+
+def update_cached_region(cache, cropped, params, old_roi_key, new_roi_key, dirty_box):
+    # After pixels inside dirty_box (x1, y1, x2, y2 in crop coordinates) changed, carry the
+    # cached gray/denoise/sharpen outputs for params over from old_roi_key to new_roi_key,
+    # recomputing only the dirty box grown by each stage's neighbourhood. The next
+    # process_roi call with new_roi_key then resumes at CLAHE instead of re-denoising the ROI.
+    # An active upscale stage changes the geometry, so carrying stops there.
+    # dirty_box=None means the ROI pixels did not change: every cached stage is re-keyed.
+    # Returns the number of stages carried over.
+    height, width = cropped.shape[:2]
+    box = dirty_box
+    prefix = ()
+    updated_input = cropped
+    carried = 0
+    for name, key_func, stage_func in STAGES:
+        prefix = prefix + (key_func(params),)
+        radius = _local_stage_radius(name, params)
+        if radius is None and dirty_box is not None:
+            break
+        old_output = cache.get((old_roi_key, name, prefix))
+        if old_output is None:
+            break
+
+        if dirty_box is None:
+            updated = old_output
+        elif name != 'gray' and radius == 0:
+            updated = updated_input # Pass-through stage (e.g. denoise strength 0)
+        else:
+            box = _expand_box(box, radius, width, height) # Output pixels affected by the change
+            window = _expand_box(box, radius, width, height) # Input pixels needed to compute them
+            part = stage_func(updated_input[window[1]:window[3], window[0]:window[2]], params)
+            updated = old_output.copy() # Cached arrays are shared; never modify them in place
+            updated[box[1]:box[3], box[0]:box[2]] = part[box[1] - window[1]:box[3] - window[1],
+                                                         box[0] - window[0]:box[2] - window[0]]
+        cache.put((new_roi_key, name, prefix), updated)
+        updated_input = updated
+        carried += 1
+    return carried
+
+
+def process_roi(cropped, params, timings=None, cache=None, roi_key=None, stop_after=None, sizes=None, start_after=None):
+    # Runs the stage chain on a BGR crop. With a StageCache and a roi_key, the
+    # deepest cached stage is reused and only the stages after it are computed.
+    # With stop_after (a stage name) the chain ends after that stage. With start_after,
+    # cropped is taken to be that stage's output (e.g. a rotated denoised ROI) and only
+    # the later stages run; their cache keys still include every earlier stage's params.
+    # sizes, if given, receives stage -> (height, width) of the outputs computed or
+    # taken from the cache.
+    use_cache = cache is not None and roi_key is not None
+    stage_names = [stage[0] for stage in STAGES]
+    stage_count = len(STAGES) if stop_after is None else stage_names.index(stop_after) + 1
+    start_stage = 0 if start_after is None else stage_names.index(start_after) + 1
+    stage_keys = []
+    prefix = ()
+    for name, key_func, _ in STAGES[:stage_count]:
+        prefix = prefix + (key_func(params),)
+        stage_keys.append((roi_key, name, prefix))
+
+    result = cropped
+    first_stage = start_stage
+    if use_cache:
+        for index in range(stage_count - 1, start_stage - 1, -1):
+            cached = cache.get(stage_keys[index])
+            if cached is not None:
+                result = cached
+                first_stage = index + 1
+                if sizes is not None:
+                    sizes[STAGES[index][0]] = result.shape[:2]
+                break
+
+    for index in range(first_stage, stage_count):
+        name, _, stage_func = STAGES[index]
+        start = time.perf_counter()
+        result = stage_func(result, params)
+        _record_stage(timings, name, start)
+        if sizes is not None:
+            sizes[name] = result.shape[:2]
+        if use_cache:
+            cache.put(stage_keys[index], result)
+
+    return result
+
+
+def cached_output(params, cache, roi_key):
+    # The final stage's output for roi_key if the StageCache holds it, else None; nothing is computed
+    prefix = tuple(key_func(params) for _, key_func, _ in STAGES)
+    return cache.get((roi_key, STAGES[-1][0], prefix))
+
+
+@dataclass(frozen=True)
+class DecodedSymbol:
+    text: str
+    rect: tuple # (x1, y1, x2, y2) in the coordinates of the image the ROI was cut from
+
+
+def _dmtx_decode(processed, timeout_ms, timings, params, max_count=None):
+    if timeout_ms is None or timeout_ms <= 0:
+        timeout_ms = DEFAULT_DECODE_TIMEOUT_MS
+    decode_kwargs = params.decode_kwargs(processed.shape) if params is not None else {}
+    if max_count is not None:
+        decode_kwargs['max_count'] = max_count
+    start = time.perf_counter()
+    decoded_data = dmtx_decode(Image.fromarray(processed), timeout=timeout_ms, **decode_kwargs)
+    _record_stage(timings, 'decode', start)
+    return decoded_data
+
+
+def _decode_sampled_grid(processed, timeout_ms, timings, params):
+    # Decode a clean synthetic symbol rebuilt from the estimated module grid; None if no
+    # grid was found or it did not decode. Time spent is recorded as the 'grid' stage.
+    start = time.perf_counter()
+    grid = sample_module_grid(processed)
+    decoded_data = None
+    if grid is not None:
+        # Edge limits and shrink refer to the ROI, not to the synthetic symbol
+        kwargs = {'max_count': 1}
+        shape = DMTX_SHAPES.get(params.dmtx_shape)
+        if shape is not None:
+            kwargs['shape'] = shape
+        decoded_data = dmtx_decode(Image.fromarray(grid.image), timeout=min(timeout_ms, GRID_DECODE_TIMEOUT_MS), **kwargs)
+    _record_stage(timings, 'grid', start)
+    if decoded_data:
+        return decoded_data[0].data.decode('utf-8')
+    return None
+
+
+def decode_processed(processed, timeout_ms=DEFAULT_DECODE_TIMEOUT_MS, timings=None, params=None):
+    # Returns the first decoded symbol as text, or None. libdmtx errors propagate.
+    # params (ProcessingParams) supplies the libdmtx decoder options, if given. Only the
+    # first symbol is used, so libdmtx can stop scanning as soon as it finds one.
+    # With params.grid_sample the sampled module grid is tried first.
+    if timeout_ms is None or timeout_ms <= 0:
+        timeout_ms = DEFAULT_DECODE_TIMEOUT_MS
+    if params is not None and params.grid_sample:
+        decoded_text = _decode_sampled_grid(processed, timeout_ms, timings, params)
+        if decoded_text:
+            return decoded_text
+    decoded_data = _dmtx_decode(processed, timeout_ms, timings, params, max_count=1)
+    if decoded_data:
+        return decoded_data[0].data.decode('utf-8')
+    return None
+
+
+def symbol_rect(rect, image_height, origin=(0, 0), scale=1.0):
+    # pylibdmtx reports two opposite symbol corners with the y axis pointing up from the
+    # bottom of the image; convert to a top-left based (x1, y1, x2, y2) box offset by origin.
+    # scale is the ROI upscale factor, undone so the box lands in original pixels.
+    xs = sorted((rect.left, rect.left + rect.width))
+    ys = sorted((image_height - rect.top, image_height - (rect.top + rect.height)))
+    xs = [int(round(x / scale)) for x in xs]
+    ys = [int(round(y / scale)) for y in ys]
+    return (xs[0] + origin[0], ys[0] + origin[1], xs[1] + origin[0], ys[1] + origin[1])
+
+
+def decode_all_processed(processed, timeout_ms=DEFAULT_DECODE_TIMEOUT_MS, timings=None, params=None, origin=(0, 0)):
+    # Returns every symbol found as DecodedSymbol, with rects offset by origin (the ROI's
+    # top-left corner) so they land in original image coordinates. max_count is taken
+    # from params (0 = no limit).
+    decoded_data = _dmtx_decode(processed, timeout_ms, timings, params)
+    image_height = processed.shape[0]
+    scale = params.upscale_scale() if params is not None else 1.0
+    return [DecodedSymbol(text=decoded.data.decode('utf-8'), rect=symbol_rect(decoded.rect, image_height, origin, scale))
+            for decoded in decoded_data]
+
+
+def decode_roi(cropped, params, timeout_ms=DEFAULT_DECODE_TIMEOUT_MS, timings=None, cache=None, roi_key=None):
+    # Preprocess and decode an already cropped ROI. Module-level so it can be
+    # submitted to a ProcessPoolExecutor (arguments are plain picklable values).
+    processed = process_roi(cropped, params, timings, cache, roi_key)
+    return decode_processed(processed, timeout_ms, timings, params)
+
+
+def decode_roi_timed(cropped, params, timeout_ms=DEFAULT_DECODE_TIMEOUT_MS):
+    # decode_roi for process pools that also reports per-stage timings: (text, timings)
+    timings = {}
+    decoded_text = decode_roi(cropped, params, timeout_ms, timings)
+    return decoded_text, timings
+
+
+def decode_processed_timed(processed, timeout_ms=DEFAULT_DECODE_TIMEOUT_MS, params=None, all_codes=False, origin=(0, 0)):
+    # decode_processed (or decode_all_processed with all_codes) for process pools that also
+    # reports the decoder-side timings ('grid', 'decode'): (result, timings)
+    timings = {}
+    if all_codes:
+        result = decode_all_processed(processed, timeout_ms, timings, params, origin)
+    else:
+        result = decode_processed(processed, timeout_ms, timings, params)
+    return result, timings
+
+
+def decode_all_roi(cropped, params, timeout_ms=DEFAULT_DECODE_TIMEOUT_MS, timings=None, cache=None, roi_key=None, origin=(0, 0)):
+    # Multi-code counterpart of decode_roi
+    processed = process_roi(cropped, params, timings, cache, roi_key)
+    return decode_all_processed(processed, timeout_ms, timings, params, origin)
+
+
+def decode_all_roi_timed(cropped, params, timeout_ms=DEFAULT_DECODE_TIMEOUT_MS, origin=(0, 0)):
+    # decode_all_roi for process pools that also reports per-stage timings: (symbols, timings)
+    timings = {}
+    symbols = decode_all_roi(cropped, params, timeout_ms, timings, origin=origin)
+    return symbols, timings
+
+
+def run_pipeline(image, selection, params, timeout_ms=DEFAULT_DECODE_TIMEOUT_MS):
+    # Full crop -> preprocess -> decode run on a BGR image; no Tk involved
+    cropped = crop_selection(image, selection)
+    if cropped is None:
+        return PipelineResult(processed=None, decoded_text=None)
+    processed = process_roi(cropped, params)
+    return PipelineResult(processed=processed, decoded_text=decode_processed(processed, timeout_ms, params=params))
+
+
+def load_presets(filepath):
+    # Returns [(section, name, ProcessingParams)] for every [PresetN] section, in file order.
+    # Malformed presets raise, so headless callers fail loudly instead of silently skipping.
+    config = configparser.ConfigParser()
+    if not config.read(filepath):
+        raise FileNotFoundError(f"Presets file not found: {filepath}")
+    presets = []
+    for section in config.sections():
+        if section.startswith("Preset"):
+            name = config.get(section, 'name', fallback=section)
+            presets.append((section, name, ProcessingParams.from_config_section(config, section).validate()))
+    return presets
@@ -0,0 +1,90 @@
+"""Persistent per-preset success statistics used to order preset iteration.
+
+Stats live in datamatrix_preset_stats.ini, one section per preset name:
+
+    [Default Global]
+    attempts = 120
+    successes = 97
+    total_ms = 35120.5
+
+Presets are ranked by expected payoff, i.e. estimated success rate divided
+by mean cost per attempt, so cheap presets that usually work are tried
+first. Presets without history keep their file order after the ranked ones
+with comparable payoff.
+"""
+import configparser
+import os
+
+DEFAULT_STATS_FILE = 'datamatrix_preset_stats.ini'
+
+
+class PresetStats:
+    def __init__(self, filepath=DEFAULT_STATS_FILE, default_cost_ms=1000.0):
+        self.filepath = filepath
+        self.default_cost_ms = default_cost_ms # Assumed cost of a preset with no history
+        self.stats = {} # name -> {'attempts': int, 'successes': int, 'total_ms': float}
+        self.load()
+
+    def load(self):
+        self.stats = {}
+        if not os.path.exists(self.filepath):
+            return
+        config = configparser.ConfigParser(interpolation=None)
+        config.read(self.filepath)
+        for name in config.sections():
+            self.stats[name] = {
+                'attempts': config.getint(name, 'attempts', fallback=0),
+                'successes': config.getint(name, 'successes', fallback=0),
+                'total_ms': config.getfloat(name, 'total_ms', fallback=0.0),
+            }
+
+    def save(self):
+        config = configparser.ConfigParser(interpolation=None)
+        for name, entry in self.stats.items():
+            config[name] = {
+                'attempts': str(entry['attempts']),
+                'successes': str(entry['successes']),
+                'total_ms': f"{entry['total_ms']:.1f}",
+            }
+        with open(self.filepath, 'w') as configfile:
+            config.write(configfile)
+
+    def reset(self):
+        self.stats = {}
+        self.save()
+
+    def record(self, name, success, elapsed_ms):
+        entry = self.stats.setdefault(name, {'attempts': 0, 'successes': 0, 'total_ms': 0.0})
+        entry['attempts'] += 1
+        if success:
+            entry['successes'] += 1
+        entry['total_ms'] += float(elapsed_ms)
+
+    def success_rate(self, name):
+        # Laplace-smoothed so a single lucky/unlucky attempt doesn't dominate
+        entry = self.stats.get(name)
+        if entry is None:
+            return 0.5
+        return (entry['successes'] + 1.0) / (entry['attempts'] + 2.0)
+
+    def mean_ms(self, name):
+        entry = self.stats.get(name)
+        if entry is None or entry['attempts'] == 0:
+            return self.default_cost_ms
+        return max(entry['total_ms'] / entry['attempts'], 1.0)
+
+    def expected_payoff(self, name):
+        return self.success_rate(name) / self.mean_ms(name)
+
+    def order(self, items, name_of=lambda item: item):
+        # Sorts items by descending expected payoff; ties keep their original (file) order
+        return sorted(items, key=lambda item: -self.expected_payoff(name_of(item)))
+
+    def rows(self):
+        # (name, attempts, successes, success rate, mean ms, payoff) sorted best first, for display
+        result = []
+        for name in self.order(list(self.stats)):
+            entry = self.stats[name]
+            result.append((name, entry['attempts'], entry['successes'], self.success_rate(name),
+                           self.mean_ms(name), self.expected_payoff(name)))
+        return result
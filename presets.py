@@ -0,0 +1,114 @@
+"""Parsed, cached view of datamatrix_presets.ini.
+
+PresetRegistry parses and validates the presets file once and keeps the
+result as immutable Preset records (name plus ProcessingParams). Every
+access checks the file's modification time and size, so edits made in a
+text editor are picked up on the next click without re-parsing the file
+when nothing changed. Presets that fail to parse or validate are kept as
+PresetError records and reported instead of stopping the others.
+"""
+import configparser
+import os
+import re
+from dataclasses import dataclass
+
+from pipeline import ProcessingParams
+
+DEFAULT_PRESETS_FILE = 'datamatrix_presets.ini'
+_SECTION_NUMBER = re.compile(r'^\s*\[Preset(\d+)\]', re.MULTILINE)
+
+
+@dataclass(frozen=True)
+class Preset:
+    section: str # [PresetN] section name
+    name: str
+    params: object # ProcessingParams
+
+
+@dataclass(frozen=True)
+class PresetError:
+    section: str
+    name: str
+    error: str
+
+
+def _file_signature(filepath):
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class PresetRegistry:
+    def __init__(self, filepath=DEFAULT_PRESETS_FILE):
+        self.filepath = filepath
+        self.presets = () # Preset records in file order
+        self.errors = () # PresetError records for sections that could not be used
+        self._signature = None # (mtime_ns, size) the records were parsed from; None = not loaded
+        self.parse_error = None # configparser message if the whole file could not be parsed
+
+    def exists(self):
+        return os.path.exists(self.filepath)
+
+    def refresh(self):
+        # Re-parses the file if it changed since the last load; returns True if it did
+        signature = _file_signature(self.filepath)
+        if signature is not None and signature == self._signature:
+            return False
+        self._signature = signature
+        self.presets, self.errors = self._parse() if signature is not None else ((), ())
+        return True
+
+    def get(self):
+        # Current presets, reloaded first if the file changed
+        self.refresh()
+        return self.presets
+
+    def _parse(self):
+        self.parse_error = None
+        config = configparser.ConfigParser()
+        try:
+            config.read(self.filepath)
+        except configparser.Error as e:
+            self.parse_error = str(e)
+            return (), (PresetError(section="", name=self.filepath, error=str(e)),)
+        presets, errors = [], []
+        for section in config.sections():
+            if not section.startswith("Preset"):
+                continue
+            name = config.get(section, 'name', fallback=section)
+            try:
+                params = ProcessingParams.from_config_section(config, section).validate()
+            except (configparser.Error, ValueError) as e:
+                errors.append(PresetError(section=section, name=name, error=str(e)))
+                continue
+            presets.append(Preset(section=section, name=name, params=params))
+        return tuple(presets), tuple(errors)
+
+    def next_section(self):
+        # First unused [PresetN] name after the highest existing number. The raw file is
+        # scanned, so sections configparser rejected are counted too. Raises ValueError if
+        # the file cannot be parsed: appending to it could only add a duplicate section.
+        self.refresh()
+        if self.parse_error is not None:
+            raise ValueError(f"{self.filepath} cannot be parsed, fix it before adding presets: {self.parse_error}")
+        numbers = [0]
+        try:
+            with open(self.filepath, 'r') as configfile:
+                numbers.extend(int(number) for number in _SECTION_NUMBER.findall(configfile.read()))
+        except FileNotFoundError:
+            pass
+        return f"Preset{max(numbers) + 1}"
+
+    def add(self, name, params):
+        # Appends a new preset section to the file (the rest of the file is left as is)
+        # and returns its Preset record
+        section = self.next_section()
+        config = configparser.ConfigParser()
+        config[section] = dict(name=name, **params.to_config_dict())
+        with open(self.filepath, 'a') as configfile:
+            configfile.write("\n")
+            config.write(configfile)
+        self.refresh()
+        return Preset(section=section, name=name, params=params)
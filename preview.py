@@ -0,0 +1,90 @@
+"""Background, latest-wins preview rendering.
+
+The GUI submits a request on every slider event; the worker waits until no
+new request has arrived for the debounce interval, computes only the newest
+one, and queues the result. Tk is not thread-safe, so results are picked up
+on the main thread (DataMatrixReader polls with root.after) and anything
+older than the newest submitted request is dropped.
+"""
+import queue
+import threading
+import time
+
+DEFAULT_DEBOUNCE_MS = 80
+
+
+class PreviewWorker:
+    def __init__(self, compute, debounce_ms=DEFAULT_DEBOUNCE_MS):
+        self.compute = compute # Called on the worker thread with the request object
+        self.debounce_ms = debounce_ms
+        self.results = queue.Queue() # (seq, result, error, elapsed_ms)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending = None # (seq, request) not yet picked up by the worker
+        self._last_submit = 0.0
+        self._seq = 0
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="preview-worker", daemon=True)
+        self._thread.start()
+
+    @property
+    def latest_seq(self):
+        return self._seq
+
+    def submit(self, request):
+        # Replaces any request the worker has not started yet
+        with self._lock:
+            self._seq += 1
+            self._pending = (self._seq, request)
+            self._last_submit = time.monotonic()
+            seq = self._seq
+        self._wakeup.set()
+        return seq
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+    def take_latest(self):
+        # Main thread: drain finished results and return the newest one if it is still
+        # current, i.e. (result, error, elapsed_ms); stale results are discarded.
+        newest = None
+        while True:
+            try:
+                newest = self.results.get_nowait()
+            except queue.Empty:
+                break
+        if newest is None or newest[0] != self._seq:
+            return None
+        return newest[1:]
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            if self._stopped:
+                return
+
+            # Debounce: wait until no new request has arrived for debounce_ms
+            while True:
+                with self._lock:
+                    remaining = self._last_submit + self.debounce_ms / 1000.0 - time.monotonic()
+                if remaining <= 0:
+                    break
+                time.sleep(remaining)
+                if self._stopped:
+                    return
+
+            with self._lock:
+                pending = self._pending
+                self._pending = None
+                self._wakeup.clear()
+            if pending is None:
+                continue
+
+            seq, request = pending
+            start = time.perf_counter()
+            try:
+                result, error = self.compute(request), None
+            except Exception as e:
+                result, error = None, e
+            self.results.put((seq, result, error, (time.perf_counter() - start) * 1000.0))
@@ -0,0 +1,103 @@
+"""Per-stage timing history and one-off cProfile captures.
+
+Previews, manual decodes and preset attempts report the wall time of every
+pipeline stage they ran and the size of each stage's output (see
+pipeline.process_roi). StageProfiler keeps the most recent runs in a ring
+buffer and summarises them as the last run plus rolling percentiles per
+stage. The history can be exported as JSON, and every run is also emitted
+as one JSON line on the "datamatrix.timings" logger, which stays silent
+unless logging is configured.
+
+Stages served from the StageCache take no time; the stage the cached
+result came from is listed in a run's sizes but not in its timings.
+"""
+import cProfile
+import io
+import json
+import logging
+import pstats
+import time
+from collections import deque
+
+import numpy as np
+
+from pipeline import STAGES
+
+DEFAULT_HISTORY = 200 # Runs kept for the rolling percentiles
+PERCENTILES = (50, 90, 99)
+STAGE_ORDER = tuple(stage[0] for stage in STAGES) + ('grid', 'decode')
+
+logger = logging.getLogger('datamatrix.timings')
+
+
+class StageProfiler:
+    def __init__(self, history=DEFAULT_HISTORY):
+        self.runs = deque(maxlen=history) # Oldest first
+
+    def record(self, kind, timings, sizes=None, **info):
+        # kind is 'preview', 'decode', 'preset', 'autotune' or 'profile'; timings maps
+        # stage -> ms and sizes maps stage -> (height, width). Extra info is kept as is.
+        run = {
+            'time': round(time.time(), 3),
+            'kind': kind,
+            'total_ms': round(sum(timings.values()), 3),
+            'timings': {stage: round(ms, 3) for stage, ms in timings.items()},
+            'sizes': {stage: [int(v) for v in size] for stage, size in (sizes or {}).items()},
+        }
+        run.update(info)
+        self.runs.append(run)
+        logger.info(json.dumps(run))
+        return run
+
+    def reset(self):
+        self.runs.clear()
+
+    def last_run(self, kind=None):
+        for run in reversed(self.runs):
+            if kind is None or run['kind'] == kind:
+                return run
+        return None
+
+    def stage_percentiles(self, kind=None, percentiles=PERCENTILES):
+        # stage -> (sample count, [percentile ms, ...]) over the kept runs, plus 'total'.
+        # A stage only counts in the runs that computed it.
+        samples = {}
+        for run in self.runs:
+            if kind is not None and run['kind'] != kind:
+                continue
+            for stage, ms in run['timings'].items():
+                samples.setdefault(stage, []).append(ms)
+            samples.setdefault('total', []).append(run['total_ms'])
+        return {stage: (len(values), [float(p) for p in np.percentile(values, percentiles)])
+                for stage, values in samples.items()}
+
+    def stages(self, kind=None):
+        # Stage names seen in the history, in pipeline order
+        seen = set()
+        for run in self.runs:
+            if kind is None or run['kind'] == kind:
+                seen.update(run['timings'])
+                seen.update(run['sizes'])
+        ordered = [stage for stage in STAGE_ORDER if stage in seen]
+        return ordered + sorted(seen.difference(ordered))
+
+    def to_dict(self, kind=None):
+        summary = {}
+        for stage, (count, values) in self.stage_percentiles(kind).items():
+            summary[stage] = dict(runs=count, **{f"p{p}_ms": round(v, 3) for p, v in zip(PERCENTILES, values)})
+        runs = [run for run in self.runs if kind is None or run['kind'] == kind]
+        return {'exported': time.strftime('%Y-%m-%dT%H:%M:%S'), 'kind': kind, 'summary': summary, 'runs': runs}
+
+    def export_json(self, filepath, kind=None):
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(kind), f, indent=2)
+
+
+def profile_call(func, *args, limit=30, **kwargs):
+    # Runs func under cProfile: (result, text report of the top functions by cumulative
+    # time, the Profile object for dump_stats). Exceptions from func propagate.
+    profile = cProfile.Profile()
+    result = profile.runcall(func, *args, **kwargs)
+    stream = io.StringIO()
+    pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(limit)
+    return result, stream.getvalue(), profile
@@ -1,12 +1,30 @@
 from PIL import Image, ImageTk, ImageGrab
-from pylibdmtx.pylibdmtx import decode as dmtx_decode
 import cv2
 import numpy as np
 import os
+import time
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, simpledialog 
 import configparser
 import pyperclip # For clipboard functionality
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from autotune import rank_candidates
+from locate import find_candidate_rois
+from preview import PreviewWorker, DEFAULT_DEBOUNCE_MS
+from tile_view import TiledImageView
+from image_source import ImageSource, open_image
+from pipeline import DMTX_SHAPES, UPSCALE_INTERPOLATIONS, DecodedSymbol, ProcessingParams, StageCache, cached_output, process_roi, decode_processed, decode_processed_timed, decode_all_roi_timed, decode_roi, decode_roi_timed, update_cached_region
+from preset_stats import PresetStats
+from presets import DEFAULT_PRESETS_FILE, PresetRegistry
+from profiling import StageProfiler, profile_call
+from result_cache import DEFAULT_DB_FILE, ResultCache, decode_key, pixels_digest
+from sweep import sweep_attempts
+from watch import WatchPipeline
+
+WATCH_FEED_ROWS = 500 # Results table rows kept while watching a folder
+
 
 class DataMatrixReader:
     def __init__(self, root):
@@ -18,10 +36,23 @@ class DataMatrixReader:
         self.start_x = None
         self.start_y = None
         self.rect_id = None
+        self.pan_last = (0, 0)
         self.selection = None
-        self.cv_image = None
-        self.photo = None
-        self.scale_factor = 1.0
+        self.image_source = None # ImageSource: display proxy plus full-resolution ROI reads
+        self.scale_factor = 1.0 # Display pixels per image pixel (mirrors self.view.scale)
+        self.candidate_rois = [] # CandidateROI list proposed by "Locate Codes"
+        self.decoded_symbols = [] # DecodedSymbol list (original image coordinates) from multi-code decoding
+        self.multi_code_var = tk.BooleanVar(value=False)
+        self.image_version = 0 # Bumped whenever image pixels change; part of the stage cache key
+        self.stage_cache = StageCache()
+        self.stage_profiler = StageProfiler() # Per-stage timings of previews, decodes and preset runs
+        self.result_cache = None # ResultCache keyed by ROI pixels + params, created on first use
+        self.persist_results_var = tk.BooleanVar(value=False) # Keep decode results on disk across sessions
+
+        # Live preview is computed on a background thread; only the newest request is rendered
+        self.preview_debounce_ms = tk.IntVar(value=DEFAULT_DEBOUNCE_MS)
+        self.preview_worker = PreviewWorker(self._compute_preview)
+        self.preview_polling = False
         
         # Adaptive Thresholding Variables
         self.use_adaptive_thresh = tk.BooleanVar(value=False)
@@ -33,6 +64,29 @@ class DataMatrixReader:
         self.repair_mode_var = tk.BooleanVar(value=False)
         self.paint_color_var = tk.StringVar(value="BLACK") # "BLACK" or "WHITE"
         self.brush_size_var = tk.IntVar(value=3) # Brush size in pixels on original image
+        self.paint_last = None # Last painted image point of the current stroke
+        self.paint_refresh_pending = False
+
+        # Preset Iteration Variables
+        self.parallel_presets_var = tk.BooleanVar(value=False)
+        self.stop_at_first_success_var = tk.BooleanVar(value=False)
+        self.adaptive_order_var = tk.BooleanVar(value=False)
+        self.sweep_var = tk.BooleanVar(value=False) # Also try rotated/deskewed/rescaled ROI variants
+        self.preset_stats = PresetStats()
+        self.preset_registry = PresetRegistry(DEFAULT_PRESETS_FILE) # Parsed once, reloaded when the file changes
+        self.decode_executor = None # ProcessPoolExecutor shared by decode jobs, created on first use
+        self.decode_job = None # (future, timeout_ms, start time, multi_code, cache key, origin) of the running Try Decode, if any
+        self.preset_jobs = {} # Future -> (results source, params, stats name or None, cache key or None) for parallel iteration/auto-tune
+        self.preset_jobs_kind = "presets" # "presets" or "autotune"
+        self.preset_generation = 0 # Bumped per iteration/cancel so stale poll loops stop
+        self.preset_found_count = 0
+        self.preset_winner = None
+        self.sweep_job = None # (cancel Event, attempt Queue) of the running rotation/scale sweep, if any
+        self.autotune_job = None # (future, cropped, start time) of the running auto-tune grid scoring, if any
+        self.sweep_tried = 0
+        self.sweep_winner = None # SweepAttempt that decoded
+        self.watch_pipeline = None # WatchPipeline while a hot folder is being watched
+        self.watch_feed = queue.Queue() # (record, attempts) from the watch pipeline's writer thread
         
         self.main_frame = ttk.Frame(root)
         self.main_frame.pack(fill="both", expand=True)
@@ -50,6 +104,8 @@ class DataMatrixReader:
         self.canvas.pack(fill="both", expand=True)
         
         self.canvas.bind("<Configure>", self.resize_image_on_canvas_configure)
+        # Tiled pyramid renderer: redraw cost scales with the window, not the image
+        self.view = TiledImageView(self.canvas)
         
         self.create_controls()
         
@@ -57,17 +113,45 @@ class DataMatrixReader:
         
         self.toggle_adaptive_thresh_controls() # Set initial state of controls
         self.toggle_repair_mode_controls() # Initialize repair mode UI state
+        self.toggle_sweep_controls()
         
         self.load_initial_image() 
         
         self.canvas.bind("<ButtonPress-1>", self.on_press)
         self.canvas.bind("<B1-Motion>", self.on_drag)
         self.canvas.bind("<ButtonRelease-1>", self.on_release)
-
-    def _setup_new_cv_image(self, cv_image_data):
-        self.cv_image = cv_image_data
+        # Zoom with the mouse wheel, pan with the middle (or right) button
+        self.canvas.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-4>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-5>", self.on_mouse_wheel)
+        for button in (2, 3):
+            self.canvas.bind(f"<ButtonPress-{button}>", self.on_pan_start)
+            self.canvas.bind(f"<B{button}-Motion>", self.on_pan_drag)
+
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_close(self):
+        self.preview_worker.stop()
+        if self.sweep_job is not None:
+            self.sweep_job[0].set()
+        if self.watch_pipeline is not None:
+            self.watch_pipeline.stop()
+        if self.decode_executor is not None:
+            self.decode_executor.shutdown(wait=False, cancel_futures=True)
+        if self.result_cache is not None:
+            self.result_cache.close()
+        self.root.destroy()
+
+    def _setup_new_image_source(self, source):
+        self.image_source = source
+        self.image_version += 1
+        self.stage_cache.clear()
         self.selection = None 
         self.rect_id = None 
+        self.candidate_rois = []
+        self.decoded_symbols = []
+        # Large images are displayed from a reduced proxy; selections stay in full-resolution coordinates
+        self.view.set_image(source.proxy, self.image_version, (source.width, source.height))
         self.display_image_on_canvas()
         self.update_preview()
         # Optionally, disable repair mode when a new image is loaded
@@ -79,9 +163,9 @@ class DataMatrixReader:
         current_dir = os.path.dirname(os.path.abspath(__file__))
         default_image_path = os.path.join(current_dir, 'image.png')
         if os.path.exists(default_image_path):
-            temp_cv_image = cv2.imread(default_image_path)
-            if temp_cv_image is not None:
-                self._setup_new_cv_image(temp_cv_image)
+            source = open_image(default_image_path)
+            if source is not None:
+                self._setup_new_image_source(source)
             else:
                 messagebox.showerror("Error", f"Failed to load default image: {default_image_path}")
                 self.canvas.delete("all")
@@ -96,20 +180,25 @@ class DataMatrixReader:
                        ("All files", "*.*"))
         )
         if file_path:
-            temp_cv_image = cv2.imread(file_path)
-            if temp_cv_image is not None:
-                self._setup_new_cv_image(temp_cv_image)
+            source = open_image(file_path)
+            if source is not None and source.page_count > 1:
+                # Multi-page TIFF stack: pick the page to open
+                page = simpledialog.askinteger("Select Page", f"Page to open (1-{source.page_count}):", parent=self.root,
+                                               minvalue=1, maxvalue=source.page_count, initialvalue=1)
+                if page is not None and page > 1:
+                    source = open_image(file_path, page=page - 1)
+            if source is not None:
+                self._setup_new_image_source(source)
+                if source.is_proxy:
+                    self.results_table.insert("", tk.END, values=("Info", f"Large image ({source.width}x{source.height}): displaying a reduced proxy, the selection is read at full resolution."))
             else:
                 messagebox.showerror("Error", f"Failed to load image: {file_path}")
 
-    # load_image method is now effectively _setup_new_cv_image combined with file reading
-    # For clarity, direct calls will use _setup_new_cv_image after getting cv_image_data
+    # load_image method is now effectively _setup_new_image_source combined with open_image
 
     def display_image_on_canvas(self):
-        if self.cv_image is None:
+        if self.image_source is None:
             self.canvas.delete("all")
-            if hasattr(self, 'photo'): 
-                del self.photo
             return
 
         canvas_width = self.canvas.winfo_width()
@@ -119,32 +208,69 @@ class DataMatrixReader:
             self.root.after(50, self.display_image_on_canvas) 
             return
 
-        img_height, img_width = self.cv_image.shape[:2]
-        scale_w = canvas_width / img_width
-        scale_h = canvas_height / img_height
-        self.scale_factor = min(scale_w, scale_h)
-        
-        new_width = int(img_width * self.scale_factor)
-        new_height = int(img_height * self.scale_factor)
-        
-        if new_width <= 0 or new_height <= 0: 
-            return
+        # Only the visible tiles at the needed pyramid level are rendered (and cached)
+        self.view.render()
+        self.scale_factor = self.view.scale
+        # self.selection = None # Keep selection if image is just re-rendered due to resize
+        self.draw_selection_rect()
+        self.draw_candidate_boxes()
+        self.draw_decoded_symbols()
 
-        self.cv_image_display = cv2.resize(self.cv_image, (new_width, new_height), interpolation=cv2.INTER_AREA)
-        
-        rgb_image = cv2.cvtColor(self.cv_image_display, cv2.COLOR_BGR2RGB)
-        self.pil_image = Image.fromarray(rgb_image)
-        
-        self.photo = ImageTk.PhotoImage(self.pil_image) 
-        
-        self.canvas.delete("all") 
-        self.canvas.create_image(0, 0, image=self.photo, anchor="nw")
-        if self.rect_id: 
+    def canvas_to_image(self, x, y):
+        # Canvas (event) coordinates to integer original image coordinates, clamped to the image
+        image_x, image_y = self.view.canvas_to_image(x, y)
+        return (min(max(int(image_x), 0), self.image_source.width), min(max(int(image_y), 0), self.image_source.height))
+
+    def image_box_to_canvas(self, box):
+        x1, y1 = self.view.image_to_canvas(box[0], box[1])
+        x2, y2 = self.view.image_to_canvas(box[2], box[3])
+        return int(x1), int(y1), int(x2), int(y2)
+
+    def draw_selection_rect(self):
+        if self.rect_id:
+            self.canvas.delete(self.rect_id)
             self.rect_id = None
-        # self.selection = None # Keep selection if image is just re-rendered due to resize
+        if self.selection and not self.repair_mode_var.get():
+            self.rect_id = self.canvas.create_rectangle(*self.image_box_to_canvas(self.selection), outline='red', width=2)
+
+    def on_mouse_wheel(self, event):
+        if self.image_source is None:
+            return
+        zoom_in = event.num == 4 or getattr(event, 'delta', 0) > 0
+        self.view.zoom_at(event.x, event.y, 1.25 if zoom_in else 0.8)
+        self.display_image_on_canvas()
+
+    def on_pan_start(self, event):
+        self.pan_last = (event.x, event.y)
+
+    def on_pan_drag(self, event):
+        if self.image_source is None:
+            return
+        self.view.pan(event.x - self.pan_last[0], event.y - self.pan_last[1])
+        self.pan_last = (event.x, event.y)
+        self.display_image_on_canvas()
+
+    def fit_image_to_window(self):
+        if self.image_source is not None:
+            self.view.fit()
+            self.display_image_on_canvas()
+
+    def draw_decoded_symbols(self):
+        self.canvas.delete("decoded")
+        for index, symbol in enumerate(self.decoded_symbols, start=1):
+            x1, y1, x2, y2 = self.image_box_to_canvas(symbol.rect)
+            self.canvas.create_rectangle(x1, y1, x2, y2, outline='lime', width=2, tags="decoded")
+            self.canvas.create_text(x1 + 3, y2 - 3, text=str(index), anchor="sw", fill='lime', tags="decoded")
+
+    def draw_candidate_boxes(self):
+        self.canvas.delete("candidate")
+        for index, candidate in enumerate(self.candidate_rois, start=1):
+            x1, y1, x2, y2 = self.image_box_to_canvas(candidate.selection)
+            self.canvas.create_rectangle(x1, y1, x2, y2, outline='orange', width=2, dash=(4, 2), tags="candidate")
+            self.canvas.create_text(x1 + 3, y1 + 3, text=str(index), anchor="nw", fill='orange', tags="candidate")
 
     def resize_image_on_canvas_configure(self, event):
-        if self.cv_image is not None:
+        if self.image_source is not None:
             self.display_image_on_canvas()
             
     def create_controls(self):
@@ -156,9 +282,22 @@ class DataMatrixReader:
         self.erode_iter = tk.IntVar(value=1)
         self.sharpness_factor = tk.IntVar(value=0) 
         self.denoise_strength = tk.IntVar(value=0)
+        self.clahe_clip_limit = tk.DoubleVar(value=2.0) # 0 = CLAHE off
+        self.clahe_tile_grid = tk.IntVar(value=8)
         self.manual_decode_timeout = tk.IntVar(value=2000) 
         self.preset_iteration_timeout = tk.IntVar(value=1000)
-        self.upscale_factor_var = tk.DoubleVar(value=1.0) # For upscaling
+        self.upscale_factor_var = tk.DoubleVar(value=1.0) # ROI upscaling stage (1.0 = off)
+        self.upscale_interp_var = tk.StringVar(value="LANCZOS")
+        # libdmtx decoder options (0 = libdmtx default)
+        self.dmtx_shrink = tk.IntVar(value=1)
+        self.dmtx_max_count = tk.IntVar(value=0)
+        self.dmtx_min_edge = tk.IntVar(value=0)
+        self.dmtx_max_edge = tk.IntVar(value=0)
+        self.dmtx_threshold = tk.IntVar(value=0)
+        self.dmtx_deviation = tk.IntVar(value=0)
+        self.dmtx_shape = tk.StringVar(value="AUTO")
+        self.dmtx_auto_edges = tk.BooleanVar(value=False)
+        self.grid_sample_var = tk.BooleanVar(value=False)
 
         # --- Top Buttons ---
         top_button_frame = ttk.Frame(self.right_frame)
@@ -168,7 +307,10 @@ class DataMatrixReader:
         load_image_button.pack(side="left", fill="x", expand=True, padx=(0,2)) 
 
         load_clipboard_button = ttk.Button(top_button_frame, text="Load from Clipboard", command=self.load_from_clipboard)
-        load_clipboard_button.pack(side="left", fill="x", expand=True, padx=(2,0))
+        load_clipboard_button.pack(side="left", fill="x", expand=True, padx=(2,2))
+
+        fit_button = ttk.Button(top_button_frame, text="Fit Image", command=self.fit_image_to_window)
+        fit_button.pack(side="left", fill="x", expand=True, padx=(2,0))
         
         # --- Main Settings Area (2 columns) ---
         main_settings_frame = ttk.Frame(self.right_frame)
@@ -224,6 +366,24 @@ class DataMatrixReader:
         self.repair_brush_scale.grid(row=1, column=1, columnspan=2, sticky="ew", padx=5)
         self.repair_params_frame.columnconfigure(1, weight=1)
 
+        # --- Decoder Options (Column 1) ---
+        decoder_frame = ttk.LabelFrame(settings_col1, text="Decoder Options (0 = default)")
+        decoder_frame.pack(fill="x", padx=5, pady=5)
+        decoder_entries = (("Shrink:", self.dmtx_shrink), ("Max count:", self.dmtx_max_count),
+                           ("Min edge (px):", self.dmtx_min_edge), ("Max edge (px):", self.dmtx_max_edge),
+                           ("Edge threshold:", self.dmtx_threshold), ("Deviation:", self.dmtx_deviation))
+        for index, (label, variable) in enumerate(decoder_entries):
+            row, column = divmod(index, 2)
+            ttk.Label(decoder_frame, text=label).grid(row=row, column=column * 2, sticky="w", padx=5, pady=2)
+            ttk.Entry(decoder_frame, textvariable=variable, width=6).grid(row=row, column=column * 2 + 1, sticky="ew", padx=5, pady=2)
+        ttk.Label(decoder_frame, text="Shape:").grid(row=3, column=0, sticky="w", padx=5, pady=2)
+        ttk.Combobox(decoder_frame, textvariable=self.dmtx_shape, values=list(DMTX_SHAPES),
+                     state="readonly", width=8).grid(row=3, column=1, sticky="ew", padx=5, pady=2)
+        ttk.Checkbutton(decoder_frame, text="Auto edges from ROI",
+                        variable=self.dmtx_auto_edges).grid(row=3, column=2, columnspan=2, sticky="w", padx=5, pady=2)
+        ttk.Checkbutton(decoder_frame, text="Sample module grid first (fast, single code)",
+                        variable=self.grid_sample_var).grid(row=4, column=0, columnspan=4, sticky="w", padx=5, pady=2)
+
 
         # --- Column 2 Controls ---
         sharpness_frame = ttk.LabelFrame(settings_col2, text="Sharpness")
@@ -238,12 +398,24 @@ class DataMatrixReader:
         ttk.Scale(denoise_frame, from_=0, to=30, variable=self.denoise_strength,
                   orient="horizontal", command=self.update_preview).pack(fill="x", padx=5)
 
-        upscale_frame = ttk.LabelFrame(settings_col2, text="Image Upscaling")
+        clahe_frame = ttk.LabelFrame(settings_col2, text="Contrast (CLAHE)")
+        clahe_frame.pack(fill="x", padx=5, pady=5)
+        ttk.Label(clahe_frame, text="Clip Limit (0 = off, 0-8):").pack(fill="x", padx=5)
+        ttk.Scale(clahe_frame, from_=0.0, to=8.0, variable=self.clahe_clip_limit,
+                  orient="horizontal", command=self.update_preview).pack(fill="x", padx=5)
+        ttk.Label(clahe_frame, text="Tile Grid (2-16):").pack(fill="x", padx=5)
+        ttk.Scale(clahe_frame, from_=2, to=16, variable=self.clahe_tile_grid,
+                  orient="horizontal", command=self.update_preview).pack(fill="x", padx=5)
+
+        upscale_frame = ttk.LabelFrame(settings_col2, text="ROI Upscaling")
         upscale_frame.pack(fill="x", padx=5, pady=5)
         ttk.Label(upscale_frame, text="Upscale Factor (1.0-4.0):").pack(fill="x", padx=5)
         ttk.Scale(upscale_frame, from_=1.0, to=4.0, variable=self.upscale_factor_var,
-                  orient="horizontal").pack(fill="x", padx=5) # No command, applied by button
-        ttk.Button(upscale_frame, text="Apply Upscale to Image", command=self.apply_image_upscale).pack(fill="x", padx=5, pady=(5,0))
+                  orient="horizontal", command=self.update_preview).pack(fill="x", padx=5)
+        upscale_interp_combo = ttk.Combobox(upscale_frame, textvariable=self.upscale_interp_var,
+                                            values=list(UPSCALE_INTERPOLATIONS), state="readonly")
+        upscale_interp_combo.pack(fill="x", padx=5, pady=(2,5))
+        upscale_interp_combo.bind("<<ComboboxSelected>>", self.update_preview)
 
         # --- Global Threshold (can be disabled by adaptive) ---
         self.global_thresh_frame = ttk.LabelFrame(settings_col2, text="Global Threshold")
@@ -289,14 +461,47 @@ class DataMatrixReader:
         ttk.Entry(timeout_frame, textvariable=self.manual_decode_timeout, width=7).grid(row=0, column=1, sticky="ew", padx=5, pady=2)
         ttk.Label(timeout_frame, text="Preset Iteration Timeout:").grid(row=1, column=0, sticky="w", padx=5, pady=2)
         ttk.Entry(timeout_frame, textvariable=self.preset_iteration_timeout, width=7).grid(row=1, column=1, sticky="ew", padx=5, pady=2)
+        ttk.Label(timeout_frame, text="Preview Debounce:").grid(row=2, column=0, sticky="w", padx=5, pady=2)
+        ttk.Entry(timeout_frame, textvariable=self.preview_debounce_ms, width=7).grid(row=2, column=1, sticky="ew", padx=5, pady=2)
         timeout_frame.columnconfigure(1, weight=1)
 
         decode_actions_frame = ttk.LabelFrame(settings_col2, text="Decode Actions")
         decode_actions_frame.pack(fill="x", padx=5, pady=5)
-        ttk.Button(decode_actions_frame, text="Try Decode", 
-                  command=self.try_decode).pack(fill="x", padx=5, pady=2)
+        ttk.Button(decode_actions_frame, text="Locate Codes",
+                   command=self.locate_codes).pack(fill="x", padx=5, pady=2)
+        self.try_decode_button = ttk.Button(decode_actions_frame, text="Try Decode", 
+                  command=self.try_decode)
+        self.try_decode_button.pack(fill="x", padx=5, pady=2)
+        ttk.Checkbutton(decode_actions_frame, text="Decode all codes (whole image if nothing selected)",
+                        variable=self.multi_code_var).pack(anchor="w", padx=5)
         ttk.Button(decode_actions_frame, text="Iterate Presets",
                    command=self.iterate_presets).pack(fill="x", padx=5, pady=2)
+        self.parallel_presets_check = ttk.Checkbutton(decode_actions_frame, text="Run presets in parallel (all cores)",
+                                                      variable=self.parallel_presets_var)
+        self.parallel_presets_check.pack(anchor="w", padx=5)
+        ttk.Checkbutton(decode_actions_frame, text="Stop at first success",
+                        variable=self.stop_at_first_success_var).pack(anchor="w", padx=5)
+        ttk.Checkbutton(decode_actions_frame, text="Order presets by success history",
+                        variable=self.adaptive_order_var).pack(anchor="w", padx=5)
+        ttk.Checkbutton(decode_actions_frame, text="Sweep rotation and scale",
+                        variable=self.sweep_var, command=self.toggle_sweep_controls).pack(anchor="w", padx=5)
+        ttk.Checkbutton(decode_actions_frame, text="Remember results on disk",
+                        variable=self.persist_results_var).pack(anchor="w", padx=5)
+        ttk.Button(decode_actions_frame, text="Auto-Tune Parameters",
+                   command=self.auto_tune).pack(fill="x", padx=5, pady=2)
+        ttk.Button(decode_actions_frame, text="Preset Statistics...",
+                   command=self.show_preset_stats).pack(fill="x", padx=5, pady=2)
+        ttk.Button(decode_actions_frame, text="Stage Timings...",
+                   command=self.show_stage_timings).pack(fill="x", padx=5, pady=2)
+        self.watch_button = ttk.Button(decode_actions_frame, text="Watch Folder...",
+                                       command=self.toggle_watch_folder)
+        self.watch_button.pack(fill="x", padx=5, pady=2)
+        progress_row = ttk.Frame(decode_actions_frame)
+        progress_row.pack(fill="x", padx=5, pady=2)
+        self.decode_progress = ttk.Progressbar(progress_row, mode="indeterminate")
+        self.decode_progress.pack(side="left", fill="x", expand=True)
+        self.cancel_decode_button = ttk.Button(progress_row, text="Cancel", command=self.cancel_decode, state=tk.DISABLED)
+        self.cancel_decode_button.pack(side="right", padx=(5,0))
         ttk.Button(decode_actions_frame, text="Save Current as Preset",
                    command=self.save_current_as_preset).pack(fill="x", padx=5, pady=2)
 
@@ -315,6 +520,10 @@ class DataMatrixReader:
         copy_result_button.pack(side="bottom", fill="x", padx=5, pady=(0,5))
 
 
+        # --- Status Line ---
+        self.status_var = tk.StringVar(value="")
+        ttk.Label(self.right_frame, textvariable=self.status_var, anchor="w").pack(fill="x", padx=5)
+
         # --- Bottom Buttons (Save/Load Settings) ---
         bottom_buttons_frame = ttk.Frame(self.right_frame)
         bottom_buttons_frame.pack(fill="x", pady=(5,0))
@@ -350,29 +559,6 @@ class DataMatrixReader:
             self.global_thresh_frame.config(text="Global Threshold")
         self.update_preview()
 
-    def apply_image_upscale(self):
-        if self.cv_image is None:
-            messagebox.showwarning("Upscale Error", "Please load an image first.")
-            return
-        
-        factor = self.upscale_factor_var.get()
-        if factor <= 1.0:
-            messagebox.showinfo("Upscale Info", "Upscale factor must be greater than 1.0.")
-            return
-
-        orig_h, orig_w = self.cv_image.shape[:2]
-        new_w = int(orig_w * factor)
-        new_h = int(orig_h * factor)
-
-        try:
-            # Using INTER_LANCZOS4 for better quality upscaling
-            upscaled_image = cv2.resize(self.cv_image, (new_w, new_h), interpolation=cv2.INTER_LANCZOS4)
-            self._setup_new_cv_image(upscaled_image) # This will handle display update
-            messagebox.showinfo("Upscale Complete", f"Image upscaled by a factor of {factor:.2f}.")
-        except Exception as e:
-            messagebox.showerror("Upscale Error", f"Could not upscale image: {e}")
-
-
     def copy_selected_result(self):
         selected_item = self.results_table.focus() # Get selected item
         if not selected_item:
@@ -391,6 +577,7 @@ class DataMatrixReader:
 
     def on_press(self, event):
         if self.repair_mode_var.get():
+            self.paint_last = None # Start a new stroke
             self.paint_on_canvas(event) # Call paint function if in repair mode
             return # Skip selection logic
 
@@ -401,8 +588,7 @@ class DataMatrixReader:
         
     def on_drag(self, event):
         if self.repair_mode_var.get():
-            # For simplicity, drag painting is not implemented here. 
-            # Could be added by calling self.paint_on_canvas(event) continuously.
+            self.paint_on_canvas(event) # Drag painting; the stroke is interpolated from the last point
             return # Skip selection logic
 
         if self.rect_id:
@@ -412,59 +598,134 @@ class DataMatrixReader:
         
     def on_release(self, event):
         if self.repair_mode_var.get():
+            self.paint_last = None
             return # Skip selection logic
 
-        if self.cv_image is None or self.start_x is None: # Ensure image is loaded and press occurred
+        if self.image_source is None or self.start_x is None: # Ensure image is loaded and press occurred
             return
 
+        if abs(event.x - self.start_x) < 3 and abs(event.y - self.start_y) < 3:
+            # A click (no drag) inside a proposed box selects that candidate
+            candidate = self._candidate_at(*self.view.canvas_to_image(event.x, event.y))
+            if candidate is not None:
+                self.select_candidate(candidate)
+                return
+
         x1 = min(self.start_x, event.x)
         y1 = min(self.start_y, event.y)
         x2 = max(self.start_x, event.x)
         y2 = max(self.start_y, event.y)
         
-        # Convert coordinates back to original image scale
-        x1_orig = int(x1 / self.scale_factor)
-        y1_orig = int(y1 / self.scale_factor)
-        x2_orig = int(x2 / self.scale_factor)
-        y2_orig = int(y2 / self.scale_factor)
+        # Convert coordinates back to original image scale (accounts for zoom and pan)
+        x1_orig, y1_orig = self.canvas_to_image(x1, y1)
+        x2_orig, y2_orig = self.canvas_to_image(x2, y2)
         self.selection = (x1_orig, y1_orig, x2_orig, y2_orig)
         
         self.update_preview() # Update preview after selection is made
         
+    def _candidate_at(self, x_orig, y_orig):
+        for candidate in self.candidate_rois:
+            if candidate.x1 <= x_orig < candidate.x2 and candidate.y1 <= y_orig < candidate.y2:
+                return candidate
+        return None
+
+    def select_candidate(self, candidate):
+        self.selection = candidate.selection
+        self.draw_selection_rect()
+        self.update_preview()
+
+    def locate_codes(self):
+        if self.image_source is None:
+            messagebox.showwarning("Warning", "Please load an image first.")
+            return
+
+        # The proxy is plenty for localisation; boxes come back in full-resolution coordinates
+        source = self.image_source
+        self.candidate_rois = find_candidate_rois(source.proxy, full_size=(source.width, source.height))
+        self.draw_candidate_boxes()
+        if not self.candidate_rois:
+            self.results_table.insert("", tk.END, values=("Locate", "No candidate code regions found."))
+            return
+
+        self.results_table.insert("", tk.END, values=("Locate", f"Found {len(self.candidate_rois)} candidate region(s). Click a box to select it."))
+        self.select_candidate(self.candidate_rois[0]) # Best candidate first
+
     def paint_on_canvas(self, event):
-        if self.cv_image is None or not self.repair_mode_var.get():
+        if self.image_source is None or not self.repair_mode_var.get():
             return
 
         # Convert canvas click coordinates to original image coordinates
-        x_canvas = event.x
-        y_canvas = event.y
-        
-        x_orig = int(x_canvas / self.scale_factor)
-        y_orig = int(y_canvas / self.scale_factor)
+        x_orig, y_orig = self.canvas_to_image(event.x, event.y)
+        stroke_start = self.paint_last if self.paint_last is not None else (x_orig, y_orig)
+        self.paint_last = (x_orig, y_orig)
+
+        dirty = self._paint_segment(stroke_start, (x_orig, y_orig))
+        if dirty is not None:
+            self._apply_paint_damage(dirty)
 
+    def _paint_segment(self, start, end):
+        # Stamps the square brush along start->end (image coordinates) so fast drags leave no
+        # gaps. Returns the painted bounding box (x1, y1, x2, y2), or None if nothing was painted.
         brush_size = self.brush_size_var.get()
         brush_half = brush_size // 2
 
         # Determine paint color (BGR for OpenCV)
         paint_color_bgr = (0, 0, 0) if self.paint_color_var.get() == "BLACK" else (255, 255, 255)
 
-        # Define the top-left and bottom-right corners of the brush stroke
-        pt1 = (max(0, x_orig - brush_half), max(0, y_orig - brush_half))
-        pt2 = (min(self.cv_image.shape[1] - 1, x_orig + brush_half), 
-               min(self.cv_image.shape[0] - 1, y_orig + brush_half))
-
-        # Ensure points are valid before drawing
-        if pt1[0] < pt2[0] and pt1[1] < pt2[1]:
-            cv2.rectangle(self.cv_image, pt1, pt2, paint_color_bgr, -1) # -1 for filled
-
-            self.display_image_on_canvas() # Refresh the main canvas display
-            self.update_preview()          # Refresh the processed preview
-
-    def process_image(self):
-        if not self.selection or self.cv_image is None: # Check if cv_image exists
+        distance = max(abs(end[0] - start[0]), abs(end[1] - start[1]))
+        steps = max(1, int(distance / max(1, brush_half)))
+        dirty = None
+        for step in range(steps + 1):
+            x_orig = int(round(start[0] + (end[0] - start[0]) * step / steps))
+            y_orig = int(round(start[1] + (end[1] - start[1]) * step / steps))
+
+            # Define the top-left and bottom-right corners of the brush stroke
+            pt1 = (max(0, x_orig - brush_half), max(0, y_orig - brush_half))
+            pt2 = (min(self.image_source.width - 1, x_orig + brush_half), 
+                   min(self.image_source.height - 1, y_orig + brush_half))
+
+            # Ensure points are valid before drawing
+            if pt1[0] < pt2[0] and pt1[1] < pt2[1]:
+                box = (pt1[0], pt1[1], pt2[0] + 1, pt2[1] + 1)
+                self.image_source.fill_rect(box, paint_color_bgr) # Full resolution and display proxy
+                if dirty is None:
+                    dirty = box
+                else:
+                    dirty = (min(dirty[0], box[0]), min(dirty[1], box[1]), max(dirty[2], box[2]), max(dirty[3], box[3]))
+        return dirty
+
+    def _apply_paint_damage(self, dirty):
+        # Updates only the painted region of the display pyramid and of the cached pipeline stages
+        old_version = self.image_version
+        self.image_version += 1 # Invalidates cached stages for the painted image
+        self.view.invalidate(self.image_version, dirty)
+
+        cropped = self.image_source.read_region(self.selection)
+        if cropped is not None:
+            sx1, sy1, sx2, sy2 = self.selection
+            ix1, iy1 = max(dirty[0], sx1), max(dirty[1], sy1)
+            ix2, iy2 = min(dirty[2], sx2), min(dirty[3], sy2)
+            dirty_in_roi = (ix1 - sx1, iy1 - sy1, ix2 - sx1, iy2 - sy1) if ix1 < ix2 and iy1 < iy2 else None
+            update_cached_region(self.stage_cache, cropped, self.current_params(),
+                                 (old_version, self.selection), (self.image_version, self.selection), dirty_in_roi)
+
+        # Coalesce redraws to at most one per display frame while dragging
+        if not self.paint_refresh_pending:
+            self.paint_refresh_pending = True
+            self.root.after(16, self._refresh_after_paint)
+
+    def _refresh_after_paint(self):
+        self.paint_refresh_pending = False
+        self.display_image_on_canvas() # Refresh the main canvas display (cached tiles outside the stroke are reused)
+        self.update_preview()          # Refresh the processed preview
+
+    def _current_crop(self, box=None):
+        # Full-resolution pixels of box, by default the selection
+        box = box or self.selection
+        if not box or self.image_source is None: # Check if an image is loaded
             return None
             
-        x1, y1, x2, y2 = self.selection
+        x1, y1, x2, y2 = box
         # Ensure selection coordinates are valid before cropping
         if x1 >= x2 or y1 >= y2:
             # Invalid selection, e.g., zero width or height
@@ -472,83 +733,88 @@ class DataMatrixReader:
                 self.results_table.insert("", tk.END, values=("Process Warning", "Invalid selection area (zero width or height)."))
             return None 
             
-        cropped = self.cv_image[y1:y2, x1:x2]
+        # Only the selected region is read at full resolution
+        cropped = self.image_source.read_region(box)
         
         # Add a check for the cropped image dimensions
-        if cropped.shape[0] == 0 or cropped.shape[1] == 0:
+        if cropped is None or cropped.shape[0] == 0 or cropped.shape[1] == 0:
             # If cropped image is empty, return None
             if hasattr(self, 'results_table'): # Check if table exists
                 self.results_table.insert("", tk.END, values=("Process Warning", "Cropped area is empty."))
             return None
+        return cropped
+
+    def process_image(self, timings=None, sizes=None):
+        cropped = self._current_crop()
+        if cropped is None:
+            return None
             
-        # Rotate if needed - REMOVED
-        
-        # Convert to grayscale
-        gray = cv2.cvtColor(cropped, cv2.COLOR_BGR2GRAY)
-
-        # Apply Denoising if strength > 0
-        denoise_val = self.denoise_strength.get()
-        if denoise_val > 0:
-            # Parameters for fastNlMeansDenoising:
-            # h : Parameter regulating filter strength. Higher h value removes more noise but also blurs details.
-            # templateWindowSize : Should be odd. (Recommended 7)
-            # searchWindowSize : Should be odd. (Recommended 21)
-            gray = cv2.fastNlMeansDenoising(gray, h=float(denoise_val), templateWindowSize=7, searchWindowSize=21)
-
-        # Apply sharpening if factor > 0
-        sharpness_level = self.sharpness_factor.get() # Integer 0-100
-        if sharpness_level > 0:
-            alpha = sharpness_level / 100.0 # Convert to 0.0-1.0
-            # Common sharpening kernel
-            kernel = np.array([[-1, -1, -1],
-                               [-1,  9, -1],
-                               [-1, -1, -1]], dtype=np.float32)
-            # Apply the sharpening kernel
-            sharpened_gray = cv2.filter2D(gray, -1, kernel)
-            # Blend the original gray image with the sharpened one
-            gray = cv2.addWeighted(gray, 1.0 - alpha, sharpened_gray, alpha, 0)
-            # Ensure the result is still uint8 (though addWeighted should handle it if inputs are uint8)
-            gray = np.clip(gray, 0, 255).astype(np.uint8)
-        
-        # Improve contrast using CLAHE
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        gray = clahe.apply(gray)
-        
-        # Apply binary threshold (Global or Adaptive)
-        if self.use_adaptive_thresh.get():
-            method = cv2.ADAPTIVE_THRESH_GAUSSIAN_C if self.adaptive_method_var.get() == "GAUSSIAN" else cv2.ADAPTIVE_THRESH_MEAN_C
-            block_size_val = self.adaptive_block_size_raw.get() * 2 + 1 # Ensure odd: 1->3, 2->5, ...
-            if block_size_val < 3: block_size_val = 3 # Minimum block size
-            c_val = self.adaptive_c_value.get()
-            
-            processed = cv2.adaptiveThreshold(gray, 255, method, 
-                                              cv2.THRESH_BINARY, block_size_val, c_val)
-        else:
-            _, processed = cv2.threshold(gray, self.thresh_val.get(), 255, 
-                cv2.THRESH_BINARY)
-        
-        # Invert if needed (applies to both global and adaptive result)
-        if self.inverse.get():
-            processed = cv2.bitwise_not(processed)
-        
-        # Morphological operations with current settings
-        kernel_small = cv2.getStructuringElement(cv2.MORPH_RECT, 
-            (self.erode_size.get(), self.erode_size.get()))
-        processed = cv2.erode(processed, kernel_small, 
-            iterations=self.erode_iter.get())
-        
-        kernel_square = cv2.getStructuringElement(cv2.MORPH_RECT, 
-            (self.close_size.get(), self.close_size.get()))
-        processed = cv2.morphologyEx(processed, cv2.MORPH_CLOSE, kernel_square)
-        
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, 
-            (self.open_size.get(), self.open_size.get()))
-        processed = cv2.morphologyEx(processed, cv2.MORPH_OPEN, kernel)
-        
-        return processed
+        # The stage chain itself lives in pipeline.process_roi so it can run headless
+        # Intermediate stages are cached per (image version, selection) so slider moves
+        # and preset iteration only recompute the stages after the first changed parameter
+        return process_roi(cropped, self.current_params(), timings, cache=self.stage_cache,
+                           roi_key=(self.image_version, self.selection), sizes=sizes)
+
+    def current_params(self):
+        # Snapshot of the processing controls as an immutable ProcessingParams
+        return ProcessingParams(
+            thresh_val=self.thresh_val.get(),
+            inverse=self.inverse.get(),
+            erode_size=self.erode_size.get(),
+            erode_iter=self.erode_iter.get(),
+            close_size=self.close_size.get(),
+            open_size=self.open_size.get(),
+            sharpness_factor=self.sharpness_factor.get(),
+            denoise_strength=self.denoise_strength.get(),
+            use_adaptive_thresh=self.use_adaptive_thresh.get(),
+            adaptive_method=self.adaptive_method_var.get(),
+            adaptive_block_size_raw=self.adaptive_block_size_raw.get(),
+            adaptive_c_value=self.adaptive_c_value.get(),
+            clahe_clip_limit=round(self.clahe_clip_limit.get(), 1), # Rounded so slider jitter reuses cached stages
+            clahe_tile_grid=self.clahe_tile_grid.get(),
+            upscale_factor=round(self.upscale_factor_var.get(), 2), # Rounded so slider jitter reuses cached stages
+            upscale_interpolation=self.upscale_interp_var.get(),
+            dmtx_shrink=max(1, self.dmtx_shrink.get()),
+            dmtx_max_count=self.dmtx_max_count.get(),
+            dmtx_min_edge=self.dmtx_min_edge.get(),
+            dmtx_max_edge=self.dmtx_max_edge.get(),
+            dmtx_threshold=self.dmtx_threshold.get(),
+            dmtx_deviation=self.dmtx_deviation.get(),
+            dmtx_shape=self.dmtx_shape.get(),
+            dmtx_auto_edges=self.dmtx_auto_edges.get(),
+            grid_sample=self.grid_sample_var.get(),
+        )
+
+    def apply_params(self, params):
+        # Reflect a ProcessingParams (e.g. a preset) in the processing controls
+        self.thresh_val.set(params.thresh_val)
+        self.inverse.set(params.inverse)
+        self.erode_size.set(params.erode_size)
+        self.erode_iter.set(params.erode_iter)
+        self.close_size.set(params.close_size)
+        self.open_size.set(params.open_size)
+        self.sharpness_factor.set(params.sharpness_factor)
+        self.denoise_strength.set(params.denoise_strength)
+        self.use_adaptive_thresh.set(params.use_adaptive_thresh)
+        self.adaptive_method_var.set(params.adaptive_method)
+        self.adaptive_block_size_raw.set(params.adaptive_block_size_raw)
+        self.adaptive_c_value.set(params.adaptive_c_value)
+        self.clahe_clip_limit.set(params.clahe_clip_limit)
+        self.clahe_tile_grid.set(params.clahe_tile_grid)
+        self.upscale_factor_var.set(params.upscale_factor)
+        self.upscale_interp_var.set(params.upscale_interpolation)
+        self.dmtx_shrink.set(params.dmtx_shrink)
+        self.dmtx_max_count.set(params.dmtx_max_count)
+        self.dmtx_min_edge.set(params.dmtx_min_edge)
+        self.dmtx_max_edge.set(params.dmtx_max_edge)
+        self.dmtx_threshold.set(params.dmtx_threshold)
+        self.dmtx_deviation.set(params.dmtx_deviation)
+        self.dmtx_shape.set(params.dmtx_shape)
+        self.dmtx_auto_edges.set(params.dmtx_auto_edges)
+        self.grid_sample_var.set(params.grid_sample)
 
     def update_preview(self, *args):
-        if self.cv_image is None: # Don't try to process if no image
+        if self.image_source is None: # Don't try to process if no image
             if hasattr(self, 'preview_label') and self.preview_label.winfo_exists():
                  # Clear previous preview if it exists
                 empty_preview = ImageTk.PhotoImage(Image.new('L', (1, 1))) # Minimal placeholder
@@ -556,57 +822,225 @@ class DataMatrixReader:
                 self.preview_label.image = empty_preview
             return
 
-        processed = self.process_image()
-        if processed is not None:
-            preview = Image.fromarray(processed)
-            preview.thumbnail((200, 200), Image.Resampling.LANCZOS) # Use Image.Resampling.LANCZOS
-            preview_tk = ImageTk.PhotoImage(preview) # Renamed to avoid conflict
-            self.preview_label.configure(image=preview_tk)
-            self.preview_label.image = preview_tk # Keep reference
-
-    def _try_decode_current_settings(self, timeout_ms=None):
-        if self.cv_image is None or not self.selection:
-            return None
-            
-        processed = self.process_image()
-        if processed is None:
-            return None 
-            
-        current_timeout = timeout_ms if timeout_ms is not None else self.manual_decode_timeout.get()
-        if current_timeout <= 0: 
-            current_timeout = 1000 
+        cropped = self._current_crop()
+        if cropped is None:
+            return
+
+        try:
+            self.preview_worker.debounce_ms = max(0, self.preview_debounce_ms.get())
+        except tk.TclError:
+            pass # Keep the previous interval while the entry holds an invalid value
+
+        # Copy the crop so repair painting on the main thread can't race the worker
+        self.preview_worker.submit((cropped.copy(), self.current_params(), (self.image_version, self.selection)))
+        if not self.preview_polling:
+            self.preview_polling = True
+            self.root.after(15, self._poll_preview)
+
+    def _compute_preview(self, request):
+        # Runs on the preview worker thread: no Tk calls here
+        cropped, params, roi_key = request
+        timings, sizes = {}, {}
+        processed = process_roi(cropped, params, timings, cache=self.stage_cache, roi_key=roi_key, sizes=sizes)
+        preview = Image.fromarray(processed)
+        preview.thumbnail((200, 200), Image.Resampling.LANCZOS) # Use Image.Resampling.LANCZOS
+        return preview, timings, sizes
+
+    def _poll_preview(self):
+        latest = self.preview_worker.take_latest()
+        if latest is None:
+            self.root.after(15, self._poll_preview) # Newest request still pending
+            return
 
+        self.preview_polling = False
+        result, error, elapsed_ms = latest
+        if error is not None:
+            self.status_var.set(f"Preview error: {error}")
+            return
+        preview, timings, sizes = result
+        self.stage_profiler.record("preview", timings, sizes)
+        preview_tk = ImageTk.PhotoImage(preview) # PhotoImage must be created on the Tk thread
+        self.preview_label.configure(image=preview_tk)
+        self.preview_label.image = preview_tk # Keep reference
+        self.status_var.set(f"Preview: {elapsed_ms:.0f} ms (debounce {self.preview_worker.debounce_ms} ms)")
+
+    def _get_result_cache(self):
+        # Reopened when "Remember results on disk" is toggled
+        db_path = DEFAULT_DB_FILE if self.persist_results_var.get() else None
+        if self.result_cache is None or self.result_cache.db_path != db_path:
+            if self.result_cache is not None:
+                self.result_cache.close()
+            self.result_cache = ResultCache(db_path=db_path)
+        return self.result_cache
+
+    def _decode_preset(self, cropped, roi_key, params, timeout_ms, digest):
+        # Runs one preset on the ROI straight through the pipeline, without touching the
+        # controls; stages shared with the preview or earlier presets come from the cache.
+        # digest is the pixels_digest of cropped; repeated ROI + preset pairs skip decoding.
+        # Returns (decoded text or None, served from the result cache)
+        cache = self._get_result_cache()
+        key = decode_key(digest, params)
+        hit, decoded_text = cache.get(key, timeout_ms)
+        if hit:
+            return decoded_text, True
+        timings, sizes = {}, {}
         try:
-            decoded_data = dmtx_decode(Image.fromarray(processed), timeout=current_timeout)
-            if decoded_data:
-                return decoded_data[0].data.decode('utf-8')
+            processed = process_roi(cropped, params, timings, cache=self.stage_cache, roi_key=roi_key, sizes=sizes)
+            decoded_text = decode_processed(processed, timeout_ms=timeout_ms, timings=timings, params=params)
+            cache.put(key, decoded_text, timeout_ms)
         except Exception as e: 
             # Log to results table/area instead of just console or a popup
-            self.results_table.insert("", tk.END, values=("Decode Error", f"Timeout {current_timeout}ms: {e}"))
-            self.root.update_idletasks()
-        return None
+            self.results_table.insert("", tk.END, values=("Decode Error", f"Timeout {timeout_ms}ms: {e}"))
+        self.stage_profiler.record("preset", timings, sizes, decoded=bool(decoded_text))
+        return decoded_text, False
 
     def try_decode(self):
-        if self.cv_image is None:
+        if self.image_source is None:
             messagebox.showwarning("Warning", "Please load an image first.")
             return
-        if not self.selection:
+        multi_code = self.multi_code_var.get()
+        box = self.selection
+        if not box and multi_code:
+            # Decode a whole tray at once; the selection itself stays empty
+            box = (0, 0, self.image_source.width, self.image_source.height)
+        if not box:
             messagebox.showwarning("Warning", "Please select an area first")
             return
+        if self.decode_job is not None:
+            return # A decode is already running; the button is disabled, this guards keyboard activation
             
         for i in self.results_table.get_children(): # Clear previous results
             self.results_table.delete(i)
+        self.decoded_symbols = []
+        self.draw_decoded_symbols()
         
+        cropped = self._current_crop(box)
+        if cropped is None:
+            return
+        origin = box[:2]
+        params = self.current_params()
         manual_timeout = self.manual_decode_timeout.get()
-        decoded_text = self._try_decode_current_settings(timeout_ms=manual_timeout) 
-        
-        if decoded_text:
+        # The same pixels decoded with the same settings give the same result
+        cache_key = decode_key(pixels_digest(cropped), params, "multi" if multi_code else "single")
+        hit, cached = self._get_result_cache().get(cache_key, manual_timeout)
+        if hit:
+            self._show_decode_result(self._from_cached(cached, multi_code, origin), manual_timeout, multi_code)
+            self.status_var.set("Decoded from the result cache")
+            return
+
+        # Preprocessing and libdmtx run in a worker process so the window stays responsive and the
+        # job can be abandoned; only a processed ROI the preview already left in the stage cache
+        # is reused. origin maps symbol rects back to original image coordinates in multi-code mode.
+        executor = self._get_decode_executor()
+        roi_key = (self.image_version, box)
+        processed = cached_output(params, self.stage_cache, roi_key)
+        if processed is not None:
+            future = executor.submit(decode_processed_timed, processed, manual_timeout, params,
+                                     multi_code, origin)
+        elif multi_code:
+            future = executor.submit(decode_all_roi_timed, cropped, params, manual_timeout, origin)
+        else:
+            future = executor.submit(decode_roi_timed, cropped, params, manual_timeout)
+        self.decode_job = (future, manual_timeout, time.perf_counter(), multi_code, cache_key, origin)
+        self.try_decode_button.configure(state=tk.DISABLED)
+        self._set_busy(True, f"Decoding (timeout {manual_timeout} ms)...")
+        self.root.after(50, self._poll_decode_job, future)
+
+    def _poll_decode_job(self, future):
+        if self.decode_job is None or self.decode_job[0] is not future:
+            return # Cancelled
+        _, manual_timeout, start, multi_code, cache_key, origin = self.decode_job
+        if not future.done():
+            self.root.after(50, self._poll_decode_job, future)
+            return
+
+        self.decode_job = None
+        self.try_decode_button.configure(state=tk.NORMAL)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        self._set_busy(False, f"Decode finished in {elapsed_ms:.0f} ms")
+        try:
+            decoded_text, timings = future.result()
+        except Exception as e:
+            self.results_table.insert("", tk.END, values=("Decode Error", f"Timeout {manual_timeout}ms: {e}"))
+            return
+        self.stage_profiler.record("decode", timings, decoded=bool(decoded_text), wall_ms=round(elapsed_ms, 3))
+        self._get_result_cache().put(cache_key, self._to_cached(decoded_text, multi_code, origin), manual_timeout)
+        self._show_decode_result(decoded_text, manual_timeout, multi_code)
+
+    def _to_cached(self, result, multi_code, origin):
+        # Multi-code rects are stored relative to the decoded box's origin, so the same
+        # pixels found elsewhere in the image map back to where they are now
+        if not multi_code:
+            return result
+        x0, y0 = origin
+        return [[symbol.text, [symbol.rect[0] - x0, symbol.rect[1] - y0, symbol.rect[2] - x0, symbol.rect[3] - y0]]
+                for symbol in result]
+
+    def _from_cached(self, value, multi_code, origin):
+        if not multi_code:
+            return value
+        x0, y0 = origin
+        return [DecodedSymbol(text=text, rect=(x1 + x0, y1 + y0, x2 + x0, y2 + y0)) for text, (x1, y1, x2, y2) in value]
+
+    def _show_decode_result(self, decoded_text, manual_timeout, multi_code):
+        if multi_code:
+            self._show_decoded_symbols(decoded_text, manual_timeout)
+        elif decoded_text:
             self.results_table.insert("", tk.END, values=("Manual Decode", decoded_text))
         else:
             self.results_table.insert("", tk.END, values=("Manual Decode", f"No code (timeout {manual_timeout}ms)"))
 
+    def _show_decoded_symbols(self, symbols, manual_timeout):
+        # One results row and one canvas box per symbol
+        self.decoded_symbols = symbols
+        self.draw_decoded_symbols()
+        if not symbols:
+            self.results_table.insert("", tk.END, values=("Manual Decode", f"No code (timeout {manual_timeout}ms)"))
+            return
+        for index, symbol in enumerate(symbols, start=1):
+            x1, y1, x2, y2 = symbol.rect
+            self.results_table.insert("", tk.END, values=(f"Code {index} @ ({x1},{y1})-({x2},{y2})", symbol.text))
+        self.status_var.set(f"{self.status_var.get()}, {len(symbols)} code(s)")
+
+    def cancel_decode(self):
+        # Abandons in-flight work: pending jobs are cancelled, running ones finish in
+        # the background and their results are ignored
+        cancelled = False
+        if self.decode_job is not None:
+            self.decode_job[0].cancel()
+            self.decode_job = None
+            self.try_decode_button.configure(state=tk.NORMAL)
+            cancelled = True
+        if self.preset_jobs:
+            for pending in self.preset_jobs:
+                pending.cancel()
+            self.preset_jobs = {}
+            self.preset_generation += 1 # Stops _poll_preset_jobs without a summary
+            self.preset_winner = None
+            cancelled = True
+        if self.sweep_job is not None:
+            self.sweep_job[0].set() # The sweep thread stops after its current attempt
+            self.sweep_job = None
+            cancelled = True
+        if self.autotune_job is not None:
+            self.autotune_job[0].cancel()
+            self.autotune_job = None # Stops _poll_autotune; a running scoring job is ignored
+            cancelled = True
+        if cancelled:
+            self.results_table.insert("", tk.END, values=("Info", "Decode cancelled."))
+        self._set_busy(False, "Cancelled" if cancelled else "")
+
+    def _set_busy(self, busy, message=""):
+        if busy:
+            self.decode_progress.start(10)
+            self.cancel_decode_button.configure(state=tk.NORMAL)
+        else:
+            self.decode_progress.stop()
+            self.cancel_decode_button.configure(state=tk.DISABLED)
+        self.status_var.set(message)
+
     def generate_default_presets_file(self, filepath='datamatrix_presets.ini'):
-        # Rotation removed from presets
+        # Rotation is not a preset setting; "Sweep rotation and scale" covers it (sweep.py)
         presets_content = """
 [Preset1]
 name = Default Global
@@ -662,77 +1096,174 @@ adaptive_c_value = 3
             messagebox.showerror("Error", f"Could not generate presets file: {e}")
 
     def iterate_presets(self):
-        if self.cv_image is None:
+        if self.image_source is None:
             messagebox.showwarning("Warning", "Please load an image first.")
             return
         if not self.selection:
             messagebox.showwarning("Warning", "Please select an area on the image first.")
             return
 
-        config = configparser.ConfigParser()
-        presets_file_path = 'datamatrix_presets.ini' 
-
-        if not os.path.exists(presets_file_path):
-            # self.results_text.insert(tk.END, f"Presets file not found: {presets_file_path}. Generating default.\n")
-            self.generate_default_presets_file(presets_file_path)
-            if not os.path.exists(presets_file_path): 
-                 messagebox.showerror("Error", f"Failed to create or find presets file: {presets_file_path}")
-                 return
+        if self.sweep_job is not None or self.preset_jobs or self.autotune_job is not None:
+            messagebox.showinfo("Info", "Preset iteration is already running.")
+            return
 
-        config.read(presets_file_path)
+        presets = self._load_presets()
+        if presets is None:
+            return
         
         for i in self.results_table.get_children(): # Clear previous results
             self.results_table.delete(i)
+        self._report_preset_errors()
+        if not presets:
+            self.results_table.insert("", tk.END, values=("Info", "No presets found in file."))
+            messagebox.showinfo("Info", "No presets found in the settings file.")
+            return
         
-        presets_were_read = False
         current_preset_timeout = self.preset_iteration_timeout.get()
         if current_preset_timeout <= 0:
             current_preset_timeout = 1000 
-        found_codes_count = 0
 
-        for section in config.sections():
-            if section.startswith("Preset"):
-                presets_were_read = True
-                preset_name = config.get(section, 'name', fallback=section)
-                # self.results_text.insert(tk.END, f"Trying Preset: {preset_name} (max {current_preset_timeout}ms)...\n")
-                self.root.update_idletasks() 
-
-                try:
-                    self.thresh_val.set(config.getint(section, 'thresh_val'))
-                    self.inverse.set(config.getboolean(section, 'inverse'))
-                    self.erode_size.set(config.getint(section, 'erode_size'))
-                    self.erode_iter.set(config.getint(section, 'erode_iter'))
-                    self.close_size.set(config.getint(section, 'close_size'))
-                    self.open_size.set(config.getint(section, 'open_size'))
-                    self.sharpness_factor.set(config.getint(section, 'sharpness_factor', fallback=0))
-                    self.denoise_strength.set(config.getint(section, 'denoise_strength', fallback=0)) 
-                    # Adaptive thresholding settings
-                    self.use_adaptive_thresh.set(config.getboolean(section, 'use_adaptive_thresh', fallback=False))
-                    self.adaptive_method_var.set(config.get(section, 'adaptive_method', fallback="GAUSSIAN"))
-                    self.adaptive_block_size_raw.set(config.getint(section, 'adaptive_block_size_raw', fallback=5))
-                    self.adaptive_c_value.set(config.getint(section, 'adaptive_c_value', fallback=2))
-                except Exception as e:
-                    self.results_table.insert("", tk.END, values=(f"Preset {preset_name}", f"Error loading: {e}"))
-                    self.root.update_idletasks()
-                    continue 
-
-                self.update_preview() 
-                self.root.update_idletasks() 
-                self.toggle_adaptive_thresh_controls() # Update UI based on loaded preset
-
-                decoded_text = self._try_decode_current_settings(timeout_ms=current_preset_timeout) 
-                
-                if decoded_text:
-                    found_codes_count += 1
-                    self.results_table.insert("", tk.END, values=(f"Preset '{preset_name}'", decoded_text))
-                else:
-                    self.results_table.insert("", tk.END, values=(f"Preset '{preset_name}'", "Failed"))
-                self.root.update_idletasks()
+        if self.sweep_var.get():
+            self._iterate_presets_sweep(presets, current_preset_timeout)
+            return
+        if self.parallel_presets_var.get():
+            self._iterate_presets_parallel(presets, current_preset_timeout)
+            return
 
-        if not presets_were_read:
-            self.results_table.insert("", tk.END, values=("Info", "No presets found in file."))
-            messagebox.showinfo("Info", "No presets found in the settings file.")
+        cropped = self._current_crop()
+        if cropped is None:
             return
+        roi_key = (self.image_version, self.selection)
+        digest = pixels_digest(cropped)
+        found_codes_count = 0
+        winner = None
+        for preset in presets:
+            start = time.perf_counter()
+            decoded_text, cached = self._decode_preset(cropped, roi_key, preset.params, current_preset_timeout, digest)
+            if not cached: # Statistics describe real decode attempts
+                self.preset_stats.record(preset.name, bool(decoded_text), (time.perf_counter() - start) * 1000.0)
+            source = f"Preset '{preset.name}'" + (" (cached)" if cached else "")
+            
+            if decoded_text:
+                found_codes_count += 1
+                if winner is None:
+                    winner = preset.params
+                self.results_table.insert("", tk.END, values=(source, decoded_text))
+            else:
+                self.results_table.insert("", tk.END, values=(source, "Failed"))
+            self.root.update_idletasks()
+
+            if decoded_text and self.stop_at_first_success_var.get():
+                break
+
+        if winner is not None:
+            # Only the first successful preset is reflected in the controls
+            self.apply_params(winner)
+            self.toggle_adaptive_thresh_controls() # Also refreshes the preview
+        self._show_iteration_summary(found_codes_count)
+
+    def _load_presets(self):
+        # Presets from the registry in run order (file order, or by expected payoff,
+        # i.e. success rate / cost, if enabled); None if the file could not be created
+        if not self.preset_registry.exists():
+            self.generate_default_presets_file(self.preset_registry.filepath)
+            if not self.preset_registry.exists(): 
+                 messagebox.showerror("Error", f"Failed to create or find presets file: {self.preset_registry.filepath}")
+                 return None
+        presets = list(self.preset_registry.get())
+        if self.adaptive_order_var.get():
+            presets = self.preset_stats.order(presets, lambda preset: preset.name)
+        return presets
+
+    def _report_preset_errors(self):
+        for error in self.preset_registry.errors:
+            self.results_table.insert("", tk.END, values=(f"Preset {error.name}", f"Error loading: {error.error}"))
+
+    def toggle_sweep_controls(self):
+        # The sweep runs its preset x variant attempts in cost order on one thread, so
+        # it does not combine with parallel iteration
+        self.parallel_presets_check.configure(state=tk.DISABLED if self.sweep_var.get() else tk.NORMAL)
+
+    def _iterate_presets_sweep(self, presets, timeout_ms):
+        # Presets x rotation/deskew/scale variants, cheapest first, until one decodes. The
+        # sweep runs on a worker thread (gray/denoise outputs come from the shared stage
+        # cache) and _poll_sweep collects its attempts. Only the winner and errors get a row.
+        cropped = self._current_crop()
+        if cropped is None:
+            return
+        cancel, attempts = threading.Event(), queue.Queue()
+        thread = threading.Thread(target=self._run_sweep, name="preset-sweep", daemon=True,
+                                  args=(cropped, [(preset.section, preset.name, preset.params) for preset in presets],
+                                        timeout_ms, (self.image_version, self.selection), self._get_result_cache(),
+                                        cancel, attempts))
+        self.sweep_job = (cancel, attempts)
+        self.sweep_tried = 0
+        self.sweep_winner = None
+        self._set_busy(True, "Sweeping rotation and scale...")
+        thread.start()
+        self.root.after(50, self._poll_sweep, self.sweep_job)
+
+    def _run_sweep(self, cropped, presets, timeout_ms, roi_key, result_cache, cancel, attempts):
+        # Sweep thread: no Tk calls here; attempts are queued for _poll_sweep, then None
+        try:
+            for attempt in sweep_attempts(cropped, presets, timeout_ms, cache=self.stage_cache, roi_key=roi_key,
+                                          result_cache=result_cache):
+                attempts.put(attempt)
+                if attempt.decoded_text or cancel.is_set():
+                    break
+        except Exception as e:
+            attempts.put(e)
+        attempts.put(None)
+
+    def _poll_sweep(self, job):
+        if self.sweep_job is not job:
+            return # Cancelled
+        attempts = job[1]
+        while True:
+            try:
+                attempt = attempts.get_nowait()
+            except queue.Empty:
+                self.status_var.set(f"Sweeping rotation and scale... {self.sweep_tried} attempt(s)")
+                self.root.after(50, self._poll_sweep, job)
+                return
+            if attempt is None:
+                break
+            if isinstance(attempt, Exception):
+                self.results_table.insert("", tk.END, values=("Decode Error", f"Sweep: {attempt}"))
+                continue
+            self.sweep_tried += 1
+            source = f"Preset '{attempt.name}' ({attempt.variant.describe()})" + (" (cached)" if attempt.cached else "")
+            # Statistics describe the presets as configured; variant attempts would bias their rates
+            if not attempt.cached and not attempt.error and attempt.variant.is_identity():
+                self.preset_stats.record(attempt.name, bool(attempt.decoded_text), attempt.elapsed_ms)
+            if attempt.error:
+                self.results_table.insert("", tk.END, values=("Decode Error", f"{source}: {attempt.error}"))
+            elif attempt.decoded_text:
+                self.sweep_winner = attempt
+                self.results_table.insert("", tk.END, values=(source, attempt.decoded_text))
+
+        self.sweep_job = None
+        self._set_busy(False)
+        try:
+            self.preset_stats.save()
+        except Exception as e:
+            self.results_table.insert("", tk.END, values=("Stats Error", f"Could not save preset statistics: {e}"))
+        winner = self.sweep_winner
+        if winner is None:
+            summary_message = f"Sweep complete. No code found in {self.sweep_tried} preset/variant attempt(s)."
+        else:
+            summary_message = f"Sweep complete. Decoded with preset '{winner.name}' ({winner.variant.describe()}) after {self.sweep_tried} attempt(s)."
+            # The controls take the preset; the variant is not a processing setting
+            self.apply_params(winner.params)
+            self.toggle_adaptive_thresh_controls() # Also refreshes the preview
+        self.results_table.insert("", tk.END, values=("Summary", summary_message))
+        messagebox.showinfo("Iteration Complete", summary_message)
+
+    def _show_iteration_summary(self, found_codes_count):
+        try:
+            self.preset_stats.save()
+        except Exception as e:
+            self.results_table.insert("", tk.END, values=("Stats Error", f"Could not save preset statistics: {e}"))
 
         summary_message = f"Iteration complete. Found code(s) with {found_codes_count} preset(s)."
         if found_codes_count == 0:
@@ -740,7 +1271,368 @@ adaptive_c_value = 3
         
         self.results_table.insert("", tk.END, values=("Summary", summary_message))
         messagebox.showinfo("Iteration Complete", summary_message + " Check results table for details.")
+
+    def _get_decode_executor(self):
+        if self.decode_executor is None:
+            self.decode_executor = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+        return self.decode_executor
+
+    def _iterate_presets_parallel(self, presets, timeout_ms):
+        # Submits every preset for the current ROI to the process pool; results are
+        # collected by _poll_preset_jobs so the Tk main loop keeps running.
+        if self.preset_jobs:
+            messagebox.showinfo("Info", "Preset iteration is already running.")
+            return
+
+        cropped = self.image_source.read_region(self.selection)
+        if cropped is None:
+            self.results_table.insert("", tk.END, values=("Process Warning", "Invalid selection area (zero width or height)."))
+            return
+
+        # Every preset is checked against the result cache before anything is submitted
+        cache = self._get_result_cache()
+        digest = pixels_digest(cropped)
+        uncached = []
+        cached_winners = []
+        for preset in presets:
+            key = decode_key(digest, preset.params)
+            hit, decoded_text = cache.get(key, timeout_ms)
+            if not hit:
+                uncached.append((preset, key))
+                continue
+            self.results_table.insert("", tk.END, values=(f"Preset '{preset.name}' (cached)", decoded_text or "Failed"))
+            if decoded_text:
+                cached_winners.append(preset.params)
+                if self.stop_at_first_success_var.get():
+                    uncached = [] # A known winner ends the run; nothing is submitted
+                    break
+
+        jobs = {}
+        if uncached:
+            executor = self._get_decode_executor()
+            for preset, key in uncached: # Submission order decides what runs first
+                jobs[executor.submit(decode_roi_timed, cropped, preset.params, timeout_ms)] = (f"Preset '{preset.name}'", preset.params, preset.name, (key, timeout_ms))
+            self.results_table.insert("", tk.END, values=("Info", f"Running {len(jobs)} preset(s) in parallel..."))
+        self._start_preset_jobs(jobs, "presets", len(cached_winners), cached_winners[0] if cached_winners else None)
+
+    def _start_preset_jobs(self, jobs, kind, found_count=0, winner=None):
+        # found_count/winner carry results known before any job ran (result cache hits)
+        self.preset_jobs = jobs
+        self.preset_jobs_kind = kind
+        self.preset_generation += 1
+        self.preset_found_count = found_count
+        self.preset_winner = winner
+        if not jobs:
+            self._finish_preset_jobs()
+            return
+        self._set_busy(True, f"Running {len(jobs)} decode job(s)...")
+        self.root.after(50, self._poll_preset_jobs, self.preset_generation)
+
+    def _poll_preset_jobs(self, generation):
+        if generation != self.preset_generation:
+            return # Cancelled from the Cancel button
+        for future in [f for f in self.preset_jobs if f.done()]:
+            source, params, stats_name, cache_entry = self.preset_jobs.pop(future)
+            if future.cancelled():
+                continue
+            try:
+                decoded_text, timings = future.result()
+            except Exception as e:
+                self.results_table.insert("", tk.END, values=("Decode Error", f"{source}: {e}"))
+                continue
+            if stats_name is not None:
+                self.preset_stats.record(stats_name, bool(decoded_text), sum(timings.values()))
+            if cache_entry is not None:
+                self._get_result_cache().put(cache_entry[0], decoded_text, cache_entry[1])
+            kind = "autotune" if self.preset_jobs_kind == "autotune" else "preset"
+            self.stage_profiler.record(kind, timings, decoded=bool(decoded_text), source=source)
+
+            if decoded_text:
+                self.preset_found_count += 1
+                if self.preset_winner is None:
+                    self.preset_winner = params
+                self.results_table.insert("", tk.END, values=(source, decoded_text))
+                if self.stop_at_first_success_var.get():
+                    # Pending jobs are dropped; jobs already running finish in the background and are ignored
+                    for pending in self.preset_jobs:
+                        pending.cancel()
+                    self.preset_jobs = {}
+                    break
+            else:
+                self.results_table.insert("", tk.END, values=(source, "Failed"))
+
+        if self.preset_jobs:
+            self.status_var.set(f"{len(self.preset_jobs)} decode job(s) still running...")
+            self.root.after(50, self._poll_preset_jobs, generation)
+            return
+        self._finish_preset_jobs()
+
+    def _finish_preset_jobs(self):
+        self._set_busy(False)
+        if self.preset_winner is not None:
+            # Reflect the first successful preset in the controls
+            self.apply_params(self.preset_winner)
+            self.toggle_adaptive_thresh_controls() # Also refreshes the preview
+        if self.preset_jobs_kind == "autotune":
+            self._show_autotune_summary()
+        else:
+            self._show_iteration_summary(self.preset_found_count)
+
+    def auto_tune(self):
+        # Scores a grid of threshold/morphology settings for the ROI, then decodes the best
+        # candidates, both on the process pool. The winner can be saved as a preset.
+        if self.image_source is None:
+            messagebox.showwarning("Warning", "Please load an image first.")
+            return
+        if not self.selection:
+            messagebox.showwarning("Warning", "Please select an area on the image first.")
+            return
+        if self.preset_jobs or self.sweep_job is not None or self.autotune_job is not None:
+            messagebox.showinfo("Info", "Preset iteration is already running.")
+            return
+
+        cropped = self.image_source.read_region(self.selection)
+        if cropped is None:
+            self.results_table.insert("", tk.END, values=("Process Warning", "Invalid selection area (zero width or height)."))
+            return
+
+        for i in self.results_table.get_children(): # Clear previous results
+            self.results_table.delete(i)
+        self._set_busy(True, "Scoring parameter grid...")
+        future = self._get_decode_executor().submit(rank_candidates, cropped, self.current_params())
+        self.autotune_job = (future, cropped, time.perf_counter())
+        self.root.after(50, self._poll_autotune, self.autotune_job)
+
+    def _poll_autotune(self, job):
+        if self.autotune_job is not job:
+            return # Cancelled
+        future, cropped, start = job
+        if not future.done():
+            self.root.after(50, self._poll_autotune, job)
+            return
+        self.autotune_job = None
+        try:
+            candidates = future.result()
+        except Exception as e:
+            self._set_busy(False)
+            messagebox.showerror("Auto-Tune Error", f"Could not score parameters: {e}")
+            return
+        self.results_table.insert("", tk.END, values=("Auto-tune", f"Scored the parameter grid in {(time.perf_counter() - start) * 1000.0:.0f} ms; decoding the best {len(candidates)}..."))
+
+        timeout_ms = self.preset_iteration_timeout.get()
+        if timeout_ms <= 0:
+            timeout_ms = 1000
+        executor = self._get_decode_executor()
+        jobs = {}
+        for rank, candidate in enumerate(candidates, start=1): # Best score is submitted first
+            source = f"Auto-tune #{rank}: {candidate.describe()}"
+            jobs[executor.submit(decode_roi_timed, cropped, candidate.params, timeout_ms)] = (source, candidate.params, None, None)
+        self._start_preset_jobs(jobs, "autotune")
+
+    def _show_autotune_summary(self):
+        if self.preset_winner is None:
+            summary_message = "Auto-tune complete. No candidate setting decoded the code."
+            self.results_table.insert("", tk.END, values=("Summary", summary_message))
+            messagebox.showinfo("Auto-Tune Complete", summary_message)
+            return
+        summary_message = f"Auto-tune complete. {self.preset_found_count} candidate setting(s) decoded the code; the first one is now applied."
+        self.results_table.insert("", tk.END, values=("Summary", summary_message))
+        if messagebox.askyesno("Auto-Tune Complete", summary_message + "\n\nSave these settings as a preset?"):
+            self.save_current_as_preset()
         
+    def toggle_watch_folder(self):
+        # Starts decoding new images from a hot folder with the current presets, or stops it
+        if self.watch_pipeline is not None:
+            self.watch_pipeline.stop()
+            self.watch_pipeline = None
+            self.watch_button.configure(text="Watch Folder...")
+            self._drain_watch_feed()
+            try:
+                self.preset_stats.save()
+            except Exception as e:
+                self.results_table.insert("", tk.END, values=("Stats Error", f"Could not save preset statistics: {e}"))
+            self.status_var.set("Stopped watching.")
+            return
+
+        folder = filedialog.askdirectory(title="Folder to watch")
+        if not folder:
+            return
+        presets = self._load_presets()
+        if presets is None:
+            return
+        if not presets:
+            messagebox.showinfo("Info", "No presets found in the settings file.")
+            return
+        output_path = os.path.join(folder, "watch_results.jsonl")
+        roi = self.selection if self.selection and not self.multi_code_var.get() else None # Fixed camera: reuse the ROI
+        try:
+            self.watch_pipeline = WatchPipeline(folder, [(p.section, p.name, p.params) for p in presets], output_path,
+                                                max(1, self.preset_iteration_timeout.get()), roi=roi,
+                                                locate=roi is None, all_codes=self.multi_code_var.get(), feed=self.watch_feed)
+            self.watch_pipeline.start()
+        except Exception as e:
+            self.watch_pipeline = None
+            messagebox.showerror("Error", f"Could not watch folder: {e}")
+            return
+        self._report_preset_errors()
+        self.results_table.insert("", tk.END, values=("Info", f"Watching {folder}; results logged to {output_path}"))
+        self.watch_button.configure(text="Stop Watching")
+        self.root.after(200, self._poll_watch_feed, self.watch_pipeline)
+
+    def _drain_watch_feed(self):
+        # Live feed rows for finished images; the table keeps the newest WATCH_FEED_ROWS rows
+        while True:
+            try:
+                record, attempts = self.watch_feed.get_nowait()
+            except queue.Empty:
+                break
+            for name, success, elapsed_ms in attempts:
+                self.preset_stats.record(name, success, elapsed_ms)
+            source = os.path.basename(record['path'])
+            if record['decoded_text']:
+                self.results_table.insert("", tk.END, values=(f"{source} ({record['preset']})", record['decoded_text']))
+            else:
+                self.results_table.insert("", tk.END, values=(source, f"Failed {record['error'] or ''}".strip()))
+        rows = self.results_table.get_children()
+        for item in rows[:max(0, len(rows) - WATCH_FEED_ROWS)]:
+            self.results_table.delete(item)
+        if rows:
+            self.results_table.see(rows[-1])
+
+    def _poll_watch_feed(self, pipeline):
+        if pipeline is not self.watch_pipeline:
+            return # Stopped
+        self._drain_watch_feed()
+        status = pipeline.status()
+        self.status_var.set(f"Watching: {status['decoded']} decoded, {status['failed']} failed, "
+                            f"queues load {status['load_queue']} / decode {status['decode_queue']}")
+        self.root.after(200, self._poll_watch_feed, pipeline)
+
+    def show_preset_stats(self):
+        window = tk.Toplevel(self.root)
+        window.title("Preset Statistics")
+        cols = ("Preset", "Attempts", "Successes", "Success Rate", "Mean ms", "Rank")
+        table = ttk.Treeview(window, columns=cols, show='headings', height=12)
+        for col in cols:
+            table.heading(col, text=col)
+            table.column(col, width=200 if col == "Preset" else 90, stretch=tk.YES)
+        table.pack(fill="both", expand=True, padx=5, pady=5)
+
+        def refresh():
+            for item in table.get_children():
+                table.delete(item)
+            for rank, (name, attempts, successes, rate, mean_ms, _) in enumerate(self.preset_stats.rows(), start=1):
+                table.insert("", tk.END, values=(name, attempts, successes, f"{rate:.0%}", f"{mean_ms:.0f}", rank))
+
+        def reset():
+            if messagebox.askyesno("Preset Statistics", "Reset all preset statistics?", parent=window):
+                self.preset_stats.reset()
+                refresh()
+
+        ttk.Button(window, text="Reset Statistics", command=reset).pack(fill="x", padx=5, pady=(0,5))
+        refresh()
+
+    def show_stage_timings(self):
+        # Last run and rolling percentiles per stage; refreshes itself while open
+        window = tk.Toplevel(self.root)
+        window.title("Stage Timings")
+        kind_var = tk.StringVar(value="all")
+        filter_row = ttk.Frame(window)
+        filter_row.pack(fill="x", padx=5, pady=(5,0))
+        ttk.Label(filter_row, text="Runs:").pack(side="left")
+        ttk.Combobox(filter_row, textvariable=kind_var, state="readonly", width=12,
+                     values=["all", "preview", "decode", "preset", "autotune", "profile"]).pack(side="left", padx=5)
+        last_var = tk.StringVar()
+        ttk.Label(filter_row, textvariable=last_var).pack(side="left", padx=5)
+
+        cols = ("Stage", "Last ms", "Last Output", "Runs", "p50 ms", "p90 ms", "p99 ms")
+        table = ttk.Treeview(window, columns=cols, show='headings', height=14)
+        for col in cols:
+            table.heading(col, text=col)
+            table.column(col, width=110 if col in ("Stage", "Last Output") else 80, stretch=tk.YES)
+        table.pack(fill="both", expand=True, padx=5, pady=5)
+
+        def refresh():
+            kind = None if kind_var.get() == "all" else kind_var.get()
+            for item in table.get_children():
+                table.delete(item)
+            last = self.stage_profiler.last_run(kind) or {'timings': {}, 'sizes': {}, 'total_ms': None}
+            percentiles = self.stage_profiler.stage_percentiles(kind)
+            for stage in self.stage_profiler.stages(kind) + ['total']:
+                if stage == 'total':
+                    last_ms, last_size = last['total_ms'], None
+                else:
+                    last_ms, last_size = last['timings'].get(stage), last['sizes'].get(stage)
+                count, values = percentiles.get(stage, (0, []))
+                table.insert("", tk.END, values=(
+                    stage,
+                    f"{last_ms:.1f}" if last_ms is not None else ("cached" if last_size else ""),
+                    f"{last_size[1]}x{last_size[0]}" if last_size else "",
+                    count,
+                    *[f"{value:.1f}" for value in values]))
+            last_var.set(f"{len(self.stage_profiler.runs)} run(s) kept")
+
+        def poll():
+            if window.winfo_exists():
+                refresh()
+                window.after(1000, poll)
+
+        def export():
+            filepath = filedialog.asksaveasfilename(parent=window, defaultextension=".json",
+                                                    filetypes=[("JSON", "*.json")], initialfile="stage_timings.json")
+            if not filepath:
+                return
+            try:
+                self.stage_profiler.export_json(filepath, None if kind_var.get() == "all" else kind_var.get())
+            except Exception as e:
+                messagebox.showerror("Error", f"Could not export timings: {e}", parent=window)
+
+        def reset():
+            self.stage_profiler.reset()
+            refresh()
+
+        button_row = ttk.Frame(window)
+        button_row.pack(fill="x", padx=5, pady=(0,5))
+        ttk.Button(button_row, text="Export JSON...", command=export).pack(side="left", fill="x", expand=True)
+        ttk.Button(button_row, text="Profile One Run...", command=self.profile_one_run).pack(side="left", fill="x", expand=True, padx=5)
+        ttk.Button(button_row, text="Reset", command=reset).pack(side="left", fill="x", expand=True)
+        kind_var.trace_add("write", lambda *args: refresh())
+        poll()
+
+    def profile_one_run(self):
+        # Opt-in: one uncached preprocess + decode of the ROI under cProfile, in this process
+        cropped = self._current_crop()
+        if cropped is None:
+            messagebox.showwarning("Warning", "Please load an image and select an area first.")
+            return
+        params = self.current_params()
+        timings = {}
+        self._set_busy(True, "Profiling one decode run...")
+        self.root.update_idletasks()
+        try:
+            decoded_text, report, profile = profile_call(decode_roi, cropped, params, self.manual_decode_timeout.get(), timings)
+        except Exception as e:
+            self._set_busy(False)
+            messagebox.showerror("Error", f"Profiled run failed: {e}")
+            return
+        self._set_busy(False, f"Profiled run: {sum(timings.values()):.0f} ms")
+        self.stage_profiler.record("profile", timings, decoded=bool(decoded_text))
+
+        window = tk.Toplevel(self.root)
+        window.title("cProfile: one decode run")
+        text = tk.Text(window, wrap="none", width=120, height=35, font=("Courier", 9))
+        text.insert("1.0", report)
+        text.configure(state=tk.DISABLED)
+        text.pack(fill="both", expand=True, padx=5, pady=5)
+
+        def save():
+            filepath = filedialog.asksaveasfilename(parent=window, defaultextension=".prof",
+                                                    filetypes=[("cProfile data", "*.prof")], initialfile="decode.prof")
+            if filepath:
+                profile.dump_stats(filepath)
+
+        ttk.Button(window, text="Save .prof...", command=save).pack(fill="x", padx=5, pady=(0,5))
+
     def save_settings(self):
         config = configparser.ConfigParser()
         config['Morphology'] = {
@@ -759,16 +1651,48 @@ adaptive_c_value = 3
         config['Denoising'] = { 
             'denoise_strength': str(self.denoise_strength.get())
         }
+        config['CLAHE'] = {
+            'clip_limit': str(round(self.clahe_clip_limit.get(), 1)),
+            'tile_grid': str(self.clahe_tile_grid.get())
+        }
+        config['Upscaling'] = {
+            'upscale_factor': str(round(self.upscale_factor_var.get(), 2)),
+            'upscale_interpolation': self.upscale_interp_var.get()
+        }
         config['Timeouts'] = { 
             'manual_decode_timeout': str(self.manual_decode_timeout.get()),
             'preset_iteration_timeout': str(self.preset_iteration_timeout.get())
         }
+        config['Decoder'] = {
+            'shrink': str(self.dmtx_shrink.get()),
+            'max_count': str(self.dmtx_max_count.get()),
+            'min_edge': str(self.dmtx_min_edge.get()),
+            'max_edge': str(self.dmtx_max_edge.get()),
+            'threshold': str(self.dmtx_threshold.get()),
+            'deviation': str(self.dmtx_deviation.get()),
+            'shape': self.dmtx_shape.get(),
+            'auto_edges': str(self.dmtx_auto_edges.get()),
+            'grid_sample': str(self.grid_sample_var.get()),
+            'multi_code': str(self.multi_code_var.get())
+        }
+        config['Preview'] = {
+            'debounce_ms': str(self.preview_debounce_ms.get())
+        }
         config['AdaptiveThreshold'] = {
             'use_adaptive_thresh': str(self.use_adaptive_thresh.get()),
             'adaptive_method': self.adaptive_method_var.get(),
             'adaptive_block_size_raw': str(self.adaptive_block_size_raw.get()),
             'adaptive_c_value': str(self.adaptive_c_value.get())
         }
+        config['PresetIteration'] = {
+            'parallel': str(self.parallel_presets_var.get()),
+            'stop_at_first_success': str(self.stop_at_first_success_var.get()),
+            'adaptive_order': str(self.adaptive_order_var.get()),
+            'sweep': str(self.sweep_var.get())
+        }
+        config['ResultCache'] = {
+            'persistent': str(self.persist_results_var.get())
+        }
         
         with open('datamatrix_settings.ini', 'w') as configfile:
             config.write(configfile)
@@ -793,16 +1717,48 @@ adaptive_c_value = 3
             
             if 'Denoising' in config: 
                 self.denoise_strength.set(config.getint('Denoising', 'denoise_strength', fallback=0))
+
+            if 'CLAHE' in config:
+                self.clahe_clip_limit.set(config.getfloat('CLAHE', 'clip_limit', fallback=2.0))
+                self.clahe_tile_grid.set(config.getint('CLAHE', 'tile_grid', fallback=8))
+
+            if 'Upscaling' in config:
+                self.upscale_factor_var.set(config.getfloat('Upscaling', 'upscale_factor', fallback=1.0))
+                self.upscale_interp_var.set(config.get('Upscaling', 'upscale_interpolation', fallback="LANCZOS").upper())
             
             if 'Timeouts' in config: 
                 self.manual_decode_timeout.set(config.getint('Timeouts', 'manual_decode_timeout', fallback=2000))
                 self.preset_iteration_timeout.set(config.getint('Timeouts', 'preset_iteration_timeout', fallback=1000))
 
+            if 'Decoder' in config:
+                self.dmtx_shrink.set(config.getint('Decoder', 'shrink', fallback=1))
+                self.dmtx_max_count.set(config.getint('Decoder', 'max_count', fallback=0))
+                self.dmtx_min_edge.set(config.getint('Decoder', 'min_edge', fallback=0))
+                self.dmtx_max_edge.set(config.getint('Decoder', 'max_edge', fallback=0))
+                self.dmtx_threshold.set(config.getint('Decoder', 'threshold', fallback=0))
+                self.dmtx_deviation.set(config.getint('Decoder', 'deviation', fallback=0))
+                self.dmtx_shape.set(config.get('Decoder', 'shape', fallback="AUTO").upper())
+                self.dmtx_auto_edges.set(config.getboolean('Decoder', 'auto_edges', fallback=False))
+                self.grid_sample_var.set(config.getboolean('Decoder', 'grid_sample', fallback=False))
+                self.multi_code_var.set(config.getboolean('Decoder', 'multi_code', fallback=False))
+
+            if 'Preview' in config:
+                self.preview_debounce_ms.set(config.getint('Preview', 'debounce_ms', fallback=DEFAULT_DEBOUNCE_MS))
+
             if 'AdaptiveThreshold' in config:
                 self.use_adaptive_thresh.set(config.getboolean('AdaptiveThreshold', 'use_adaptive_thresh', fallback=False))
                 self.adaptive_method_var.set(config.get('AdaptiveThreshold', 'adaptive_method', fallback="GAUSSIAN"))
                 self.adaptive_block_size_raw.set(config.getint('AdaptiveThreshold', 'adaptive_block_size_raw', fallback=5))
                 self.adaptive_c_value.set(config.getint('AdaptiveThreshold', 'adaptive_c_value', fallback=2))
+
+            if 'PresetIteration' in config:
+                self.parallel_presets_var.set(config.getboolean('PresetIteration', 'parallel', fallback=False))
+                self.stop_at_first_success_var.set(config.getboolean('PresetIteration', 'stop_at_first_success', fallback=False))
+                self.adaptive_order_var.set(config.getboolean('PresetIteration', 'adaptive_order', fallback=False))
+                self.sweep_var.set(config.getboolean('PresetIteration', 'sweep', fallback=False))
+
+            if 'ResultCache' in config:
+                self.persist_results_var.set(config.getboolean('ResultCache', 'persistent', fallback=False))
             
             # self.toggle_adaptive_thresh_controls() # Called after create_controls in __init__
                 
@@ -829,7 +1785,7 @@ adaptive_c_value = 3
                 messagebox.showerror("Error", "Failed to convert clipboard image to OpenCV format.")
                 return
                 
-            self._setup_new_cv_image(cv_image_data)
+            self._setup_new_image_source(ImageSource.from_array(cv_image_data))
             if hasattr(self, 'results_table'): # Check if table exists
                 self.results_table.insert("", tk.END, values=("Info", "Image loaded from clipboard."))
 
@@ -843,56 +1799,43 @@ adaptive_c_value = 3
         if not preset_name_input:
             return 
 
-        presets_file_path = 'datamatrix_presets.ini'
-        config = configparser.ConfigParser()
-
-        if not os.path.exists(presets_file_path):
-            self.generate_default_presets_file(presets_file_path)
-            if not os.path.exists(presets_file_path): 
-                 messagebox.showerror("Error", f"Failed to create or find presets file: {presets_file_path} for saving.")
+        if not self.preset_registry.exists():
+            self.generate_default_presets_file(self.preset_registry.filepath)
+            if not self.preset_registry.exists(): 
+                 messagebox.showerror("Error", f"Failed to create or find presets file: {self.preset_registry.filepath} for saving.")
                  return
-        
-        config.read(presets_file_path)
-
-        next_preset_num = 1
-        existing_preset_nums = []
-        for section in config.sections():
-            if section.startswith("Preset"):
-                try:
-                    num = int(section[len("Preset"):])
-                    existing_preset_nums.append(num)
-                except ValueError:
-                    continue 
-        if existing_preset_nums:
-            next_preset_num = max(existing_preset_nums) + 1
-        
-        section_title = f"Preset{next_preset_num}"
-        config.add_section(section_title)
-        config.set(section_title, 'name', preset_name_input)
-        config.set(section_title, 'thresh_val', str(self.thresh_val.get()))
-        config.set(section_title, 'inverse', str(self.inverse.get()))
-        config.set(section_title, 'erode_size', str(self.erode_size.get()))
-        config.set(section_title, 'erode_iter', str(self.erode_iter.get()))
-        config.set(section_title, 'close_size', str(self.close_size.get()))
-        config.set(section_title, 'open_size', str(self.open_size.get()))
-        config.set(section_title, 'sharpness_factor', str(self.sharpness_factor.get()))
-        config.set(section_title, 'denoise_strength', str(self.denoise_strength.get()))
-        # Adaptive thresholding settings
-        config.set(section_title, 'use_adaptive_thresh', str(self.use_adaptive_thresh.get()))
-        config.set(section_title, 'adaptive_method', self.adaptive_method_var.get())
-        config.set(section_title, 'adaptive_block_size_raw', str(self.adaptive_block_size_raw.get()))
-        config.set(section_title, 'adaptive_c_value', str(self.adaptive_c_value.get()))
 
         try:
-            with open(presets_file_path, 'w') as configfile:
-                config.write(configfile)
+            preset = self.preset_registry.add(preset_name_input, self.current_params())
             if hasattr(self, 'results_table'): # Check if table exists
-                self.results_table.insert("", tk.END, values=("Info", f"Preset '{preset_name_input}' saved as {section_title}."))
+                self.results_table.insert("", tk.END, values=("Info", f"Preset '{preset_name_input}' saved as {preset.section}."))
             messagebox.showinfo("Preset Saved", f"Settings saved as Preset '{preset_name_input}'.")
         except Exception as e:
             messagebox.showerror("Error", f"Could not save preset: {e}")
 
 if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        # Headless batch mode: python read.py batch <inputs> ...
+        import batch
+        sys.exit(batch.main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        # Preset benchmark on the synthetic corpus: python read.py benchmark ...
+        import benchmark
+        sys.exit(benchmark.main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'watch':
+        # Hot-folder mode: python read.py watch <folder> ...
+        import watch
+        sys.exit(watch.main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'stream':
+        # Video / image sequence decoding: python read.py stream <source> ...
+        import stream
+        sys.exit(stream.main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        # Local decode service for other software: python read.py serve ...
+        import service
+        sys.exit(service.main(sys.argv[2:]))
+
     root = tk.Tk()
     app = DataMatrixReader(root)
     root.mainloop()
\ No newline at end of file
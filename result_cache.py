@@ -0,0 +1,136 @@
+"""Content-addressed cache of decode results.
+
+Keys are hashes of what determines a result: the ROI pixels (or, for
+batch runs, the file's path, size and mtime) plus the canonical processing
+parameters and decoder options. Values are JSON-serialisable results,
+including negative ones (nothing decoded). A negative result only counts
+as a hit for a decode timeout no longer than the one it was recorded with,
+since a longer timeout might still succeed.
+
+ResultCache keeps an in-memory LRU and, optionally, an on-disk SQLite tier
+that survives restarts: re-running a batch after a crash skips the images
+already done without opening them.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict
+
+import numpy as np
+
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_DB_FILE = 'datamatrix_results.sqlite'
+COMMIT_EVERY = 200 # SQLite puts per commit; close() commits the rest
+COMMIT_INTERVAL_S = 2.0
+
+
+def params_key(params):
+    # Canonical text form of a ProcessingParams
+    return json.dumps(asdict(params), sort_keys=True, separators=(',', ':'))
+
+
+def pixels_digest(cropped):
+    # Hash of an ROI's pixels (with shape and dtype); computed once per ROI, then combined
+    # with each preset by decode_key
+    pixels = np.ascontiguousarray(cropped)
+    digest = hashlib.blake2b(f"{pixels.shape}|{pixels.dtype}|".encode('utf-8'), digest_size=20)
+    digest.update(memoryview(pixels).cast('B'))
+    return digest.hexdigest()
+
+
+def decode_key(digest, params, mode="single"):
+    # Key for decoding the ROI with pixels_digest digest using params; mode keeps
+    # single-code and multi-code results apart
+    return hashlib.blake2b(f"{mode}|{digest}|{params_key(params)}".encode('utf-8'), digest_size=20).hexdigest()
+
+
+def file_key(path, stat, presets, options):
+    # Key for a whole batch record: the file (path, size, mtime), the set of presets and the
+    # run options (roi, locate, all_codes, ...), without reading the image. Preset order is
+    # left out so reordering by statistics does not invalidate a half-finished run.
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"file|{path}|{stat.st_size}|{stat.st_mtime_ns}|{json.dumps(options, sort_keys=True)}|".encode('utf-8'))
+    for name, params_text in sorted((preset[1], params_key(preset[2])) for preset in presets):
+        digest.update(f"{name}={params_text};".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, db_path=None):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.entries = OrderedDict() # key -> (value, timeout_ms), LRU order
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                             "timeout_ms INTEGER NOT NULL, created REAL NOT NULL)")
+            self._db.commit()
+
+    def get(self, key, timeout_ms=0):
+        # Returns (True, value) on a hit and (False, None) otherwise
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute("SELECT value, timeout_ms FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = (json.loads(row[0]), row[1])
+                    self._remember(key, entry)
+            if entry is None or (not _is_positive(entry[0]) and entry[1] < timeout_ms):
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key, value, timeout_ms=0):
+        with self._lock:
+            self._remember(key, (value, timeout_ms))
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO results (key, value, timeout_ms, created) VALUES (?, ?, ?, ?)",
+                                 (key, json.dumps(value), timeout_ms, time.time()))
+                self._uncommitted += 1
+                if self._uncommitted >= COMMIT_EVERY or time.monotonic() - self._last_commit >= COMMIT_INTERVAL_S:
+                    self._commit()
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
+                self._commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._commit()
+                self._db.close()
+                self._db = None
+
+    def _remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _commit(self):
+        self._db.commit()
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+
+
+def _is_positive(value):
+    # Decoded text, a non-empty symbol list or a batch record with decoded_text
+    if isinstance(value, dict):
+        return bool(value.get('decoded_text'))
+    return bool(value)
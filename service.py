@@ -0,0 +1,410 @@
+"""Local decode service (HTTP over TCP or a Unix socket), built on asyncio.
+
+Usage:
+    python read.py serve [--host 127.0.0.1] [--port 8765 | --unix /run/dmtx.sock]
+                         [--workers N] [--presets datamatrix_presets.ini]
+
+Endpoints:
+
+    POST /decode   JSON {"path": ...} or {"image": <base64>}, plus optional
+                   "roi": [x1, y1, x2, y2], "presets": [names], "locate",
+                   "all_codes", "sweep" and "timeout_ms" (total budget for the request).
+                   Raw image bytes are accepted too, with the options in the
+                   query string (?roi=x1,y1,x2,y2&presets=a,b&timeout_ms=500).
+    GET  /metrics  Prometheus text format: queue depth, requests in flight,
+                   outcomes, batch sizes and a latency histogram.
+    GET  /health
+
+The response is the same record as in batch mode (decoded text, winning
+preset, ROI, per-stage timings) plus queue_ms and batch_size.
+
+Decoding runs on a process pool that is started and warmed up before the
+first request, so cv2/pylibdmtx are imported and the presets parsed once
+per worker (presets are reloaded when the file changes, see presets.py).
+Requests waiting at the same time are sent to a worker together in one
+batch, which saves a process round trip per request for small images. At
+most --max-concurrent requests are admitted; more get 503 immediately.
+Requests whose budget runs out get 504; the worker also stops starting
+presets once the budget is spent.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+
+from batch import decode_crops, iter_crops, open_rois, parse_roi, select_rois
+from image_source import ImageSource
+from presets import DEFAULT_PRESETS_FILE, PresetRegistry
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_CONCURRENT = 32
+DEFAULT_BATCH_SIZE = 8
+DEFAULT_BATCH_WINDOW_MS = 2 # How long a dispatcher waits for more requests to join a batch
+DEFAULT_BUDGET_MS = 5000 # Per request, queueing included
+DEFAULT_PRESET_TIMEOUT_MS = 1000
+MAX_BODY_BYTES = 64 * 1024 * 1024
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_worker_registry = None # PresetRegistry of the worker process
+
+
+def _init_worker(presets_path):
+    global _worker_registry
+    _worker_registry = PresetRegistry(presets_path)
+    _worker_registry.get()
+
+
+def _warm_up():
+    # Runs once per worker at start-up so process spawn and imports happen before the first request
+    return os.getpid()
+
+
+def _decode_job(job):
+    timings = {}
+    presets = [(preset.section, preset.name, preset.params) for preset in _worker_registry.get()]
+    if job.get('presets'):
+        by_name = {preset[1]: preset for preset in presets}
+        missing = [name for name in job['presets'] if name not in by_name]
+        if missing:
+            return {'error': f"Unknown preset(s): {', '.join(missing)}", 'timings': timings}
+        presets = [by_name[name] for name in job['presets']]
+
+    roi = tuple(job['roi']) if job.get('roi') else None
+    if job.get('path'):
+        source, rois = open_rois(job['path'], timings, roi, job.get('locate', False))
+    else:
+        start = time.perf_counter()
+        image = cv2.imdecode(np.frombuffer(job['image'], dtype=np.uint8), cv2.IMREAD_COLOR)
+        timings['load'] = (time.perf_counter() - start) * 1000.0
+        source = ImageSource.from_array(image) if image is not None else None
+        rois = select_rois(source, timings, roi, job.get('locate', False)) if source is not None else None
+    crops = iter_crops(source, rois, timings) if source is not None else None
+    record = decode_crops(job.get('path'), crops, presets, job['preset_timeout_ms'], timings,
+                          job.get('all_codes', False), job['deadline'], job.get('sweep', False))
+    record.pop('_attempts', None)
+    return record
+
+
+def decode_batch(jobs):
+    # Worker entry point: one record per job, in order
+    records = []
+    for job in jobs:
+        try:
+            records.append(_decode_job(job))
+        except Exception as e:
+            records.append({'error': str(e), 'timings': {}})
+    return records
+
+
+class Metrics:
+    def __init__(self):
+        self.outcomes = {'decoded': 0, 'failed': 0, 'error': 0, 'timeout': 0, 'rejected': 0}
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1) # Last one is +Inf
+        self.latency_sum_ms = 0.0
+        self.batches = 0
+        self.batched_jobs = 0
+        self.pool_restarts = 0 # Worker pool recreated after a worker died
+
+    def observe(self, outcome, latency_ms):
+        self.outcomes[outcome] += 1
+        self.latency_sum_ms += latency_ms
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if latency_ms <= bound:
+                self.bucket_counts[index] += 1
+                break
+        else:
+            self.bucket_counts[-1] += 1
+
+    def render(self, queue_depth, in_flight):
+        lines = [
+            "# TYPE dmtx_queue_depth gauge", f"dmtx_queue_depth {queue_depth}",
+            "# TYPE dmtx_requests_in_flight gauge", f"dmtx_requests_in_flight {in_flight}",
+            "# TYPE dmtx_requests_total counter",
+        ]
+        lines += [f'dmtx_requests_total{{outcome="{outcome}"}} {count}' for outcome, count in self.outcomes.items()]
+        lines += ["# TYPE dmtx_batches_total counter", f"dmtx_batches_total {self.batches}",
+                  "# TYPE dmtx_batched_requests_total counter", f"dmtx_batched_requests_total {self.batched_jobs}",
+                  "# TYPE dmtx_pool_restarts_total counter", f"dmtx_pool_restarts_total {self.pool_restarts}",
+                  "# TYPE dmtx_request_latency_ms histogram"]
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS + ('+Inf',), self.bucket_counts):
+            cumulative += count
+            lines.append(f'dmtx_request_latency_ms_bucket{{le="{bound}"}} {cumulative}')
+        lines += [f"dmtx_request_latency_ms_sum {self.latency_sum_ms:.3f}",
+                  f"dmtx_request_latency_ms_count {cumulative}"]
+        return "\n".join(lines) + "\n"
+
+
+class DecodeService:
+    def __init__(self, presets_path=DEFAULT_PRESETS_FILE, workers=None, max_concurrent=DEFAULT_MAX_CONCURRENT,
+                 batch_size=DEFAULT_BATCH_SIZE, batch_window_ms=DEFAULT_BATCH_WINDOW_MS,
+                 default_budget_ms=DEFAULT_BUDGET_MS, preset_timeout_ms=DEFAULT_PRESET_TIMEOUT_MS):
+        self.presets_path = presets_path
+        self.workers = workers or os.cpu_count() or 1
+        self.max_concurrent = max_concurrent
+        self.batch_size = max(1, batch_size)
+        self.batch_window_s = batch_window_ms / 1000.0
+        self.default_budget_ms = default_budget_ms
+        self.preset_timeout_ms = preset_timeout_ms
+        self.metrics = Metrics()
+        self.in_flight = 0
+        self.pending = None # asyncio.Queue of (job, future, enqueued time); created in start()
+        self.executor = None
+        self._restart_lock = None # asyncio.Lock; created in start()
+        self._dispatchers = []
+
+    async def start(self):
+        self.pending = asyncio.Queue()
+        self._restart_lock = asyncio.Lock()
+        await self._start_executor()
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+
+    async def _start_executor(self):
+        loop = asyncio.get_running_loop()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                            initargs=(self.presets_path,))
+        # Pre-warm: make every worker start (and run its initializer) now
+        await asyncio.gather(*[loop.run_in_executor(self.executor, _warm_up) for _ in range(self.workers)])
+
+    async def _restart_executor(self, broken):
+        # A dead worker (e.g. killed for memory on a huge image) breaks the whole pool; every
+        # dispatcher sees that, but only the first one replaces it
+        async with self._restart_lock:
+            if self.executor is not broken:
+                return
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.metrics.pool_restarts += 1
+            await self._start_executor()
+
+    async def stop(self):
+        for task in self._dispatchers:
+            task.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _dispatch(self):
+        # One dispatcher per worker: take a request, let others join for batch_window, send the batch
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.pending.get()]
+            batch_deadline = loop.time() + self.batch_window_s
+            while len(batch) < self.batch_size:
+                remaining = batch_deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.pending.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            batch = [item for item in batch if not item[1].done()] # Drop requests that already timed out
+            if not batch:
+                continue
+            self.metrics.batches += 1
+            self.metrics.batched_jobs += len(batch)
+            now = time.perf_counter()
+            executor = self.executor
+            try:
+                records = await loop.run_in_executor(executor, decode_batch, [item[0] for item in batch])
+            except BrokenProcessPool:
+                # The batch is not retried: it may hold the image that killed the worker
+                records = [{'error': "Decode worker crashed; the worker pool was restarted", 'timings': {}}] * len(batch)
+                await self._restart_executor(executor)
+            except Exception as e:
+                records = [{'error': str(e), 'timings': {}}] * len(batch)
+            for (job, future, enqueued), record in zip(batch, records):
+                if not future.done():
+                    future.set_result(dict(record, queue_ms=round((now - enqueued) * 1000.0, 3), batch_size=len(batch)))
+
+    async def decode(self, job):
+        # Returns (HTTP status, response dict)
+        start = time.perf_counter()
+        if self.in_flight >= self.max_concurrent:
+            self.metrics.outcomes['rejected'] += 1
+            return 503, {'error': "Too many concurrent requests"}
+        budget_ms = job.pop('timeout_ms', None) or self.default_budget_ms
+        job['deadline'] = time.time() + budget_ms / 1000.0
+        job['preset_timeout_ms'] = min(self.preset_timeout_ms, budget_ms)
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight += 1
+        try:
+            await self.pending.put((job, future, start))
+            try:
+                record = await asyncio.wait_for(future, budget_ms / 1000.0)
+            except asyncio.TimeoutError:
+                self.metrics.observe('timeout', (time.perf_counter() - start) * 1000.0)
+                return 504, {'error': f"No result within {budget_ms} ms"}
+        finally:
+            self.in_flight -= 1
+
+        timings = {stage: round(ms, 3) for stage, ms in record.get('timings', {}).items()}
+        record = dict(record, timings=timings, total_ms=round(sum(timings.values()), 3))
+        if record.get('decoded_text'):
+            outcome, status = 'decoded', 200
+        elif record.get('presets_tried'):
+            outcome, status = 'failed', 200
+        else:
+            outcome, status = 'error', 422 # Unreadable image, unknown preset, ...
+        self.metrics.observe(outcome, (time.perf_counter() - start) * 1000.0)
+        return status, record
+
+    def metrics_text(self):
+        return self.metrics.render(self.pending.qsize() if self.pending is not None else 0, self.in_flight)
+
+
+def parse_decode_request(headers, query, body):
+    # Builds a job dict from a POST /decode request; raises ValueError for bad requests
+    content_type = headers.get('content-type', '')
+    if content_type.startswith('application/json'):
+        try:
+            data = json.loads(body.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise ValueError(f"Invalid JSON: {e}")
+        if not isinstance(data, dict):
+            raise ValueError("JSON body must be an object")
+        job = {key: data[key] for key in ('path', 'roi', 'presets', 'locate', 'all_codes', 'sweep', 'timeout_ms') if key in data}
+        if 'image' in data:
+            try:
+                job['image'] = base64.b64decode(data['image'])
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Invalid base64 image: {e}")
+    else:
+        job = {'image': body}
+        if 'roi' in query:
+            job['roi'] = parse_roi(query['roi'][0])
+        if 'presets' in query:
+            job['presets'] = [name for name in query['presets'][0].split(',') if name]
+        if 'timeout_ms' in query:
+            job['timeout_ms'] = int(query['timeout_ms'][0])
+        for flag in ('locate', 'all_codes', 'sweep'):
+            if flag in query:
+                job[flag] = query[flag][0].lower() in ('1', 'true', 'yes')
+    if not job.get('path') and not job.get('image'):
+        raise ValueError("Either a path or image bytes are required")
+    if job.get('roi') is not None and len(job['roi']) != 4:
+        raise ValueError("roi must be [x1, y1, x2, y2]")
+    if job.get('timeout_ms') is not None:
+        job['timeout_ms'] = int(job['timeout_ms'])
+    return job
+
+
+async def _read_request(reader):
+    request_line = (await reader.readline()).decode('latin-1').strip()
+    if not request_line:
+        return None
+    method, target, _ = request_line.split(' ', 2)
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        key, _, value = line.partition(':')
+        headers[key.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY_BYTES:
+        raise OverflowError(length)
+    body = await reader.readexactly(length) if length else b''
+    return method, target, headers, body
+
+
+async def _write_response(writer, status, payload, content_type='application/json'):
+    reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+               422: 'Unprocessable Entity', 503: 'Service Unavailable', 504: 'Gateway Timeout'}
+    body = payload.encode('utf-8') if isinstance(payload, str) else json.dumps(payload).encode('utf-8')
+    head = (f"HTTP/1.1 {status} {reasons.get(status, '')}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n")
+    writer.write(head.encode('latin-1') + body)
+    await writer.drain()
+
+
+def make_handler(service):
+    async def handle(reader, writer):
+        try:
+            try:
+                request = await _read_request(reader)
+            except OverflowError:
+                await _write_response(writer, 413, {'error': "Request body too large"})
+                return
+            except (ValueError, asyncio.IncompleteReadError):
+                await _write_response(writer, 400, {'error': "Malformed HTTP request"})
+                return
+            if request is None:
+                return
+            method, target, headers, body = request
+            url = urlsplit(target)
+            if method == 'GET' and url.path == '/metrics':
+                await _write_response(writer, 200, service.metrics_text(), 'text/plain; version=0.0.4')
+            elif method == 'GET' and url.path == '/health':
+                await _write_response(writer, 200, {'status': 'ok', 'workers': service.workers})
+            elif method == 'POST' and url.path == '/decode':
+                try:
+                    job = parse_decode_request(headers, parse_qs(url.query), body)
+                except (ValueError, TypeError) as e:
+                    await _write_response(writer, 400, {'error': str(e)})
+                    return
+                status, record = await service.decode(job)
+                await _write_response(writer, status, record)
+            else:
+                await _write_response(writer, 404, {'error': f"No route for {method} {url.path}"})
+        except ConnectionError:
+            pass # Client went away
+        finally:
+            writer.close()
+    return handle
+
+
+async def serve(args):
+    service = DecodeService(args.presets, args.workers, args.max_concurrent, args.batch_size,
+                            args.batch_window_ms, args.timeout, args.preset_timeout)
+    await service.start()
+    if args.unix:
+        server = await asyncio.start_unix_server(make_handler(service), path=args.unix)
+        where = args.unix
+    else:
+        server = await asyncio.start_server(make_handler(service), args.host, args.port)
+        where = f"http://{args.host}:{args.port}"
+    print(f"Decode service on {where} with {service.workers} warm worker(s). Ctrl+C to stop.", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(prog="read.py serve", description="Local DataMatrix decode service.")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="TCP port (default: %(default)s)")
+    parser.add_argument('--unix', default=None, help="Listen on this Unix socket instead of TCP")
+    parser.add_argument('--presets', default=DEFAULT_PRESETS_FILE, help="Presets INI file (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--max-concurrent', type=int, default=DEFAULT_MAX_CONCURRENT, help="Requests admitted at once (default: %(default)s)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Requests per worker batch (default: %(default)s)")
+    parser.add_argument('--batch-window-ms', type=float, default=DEFAULT_BATCH_WINDOW_MS, help="Wait for a batch to fill (default: %(default)s)")
+    parser.add_argument('--timeout', type=int, default=DEFAULT_BUDGET_MS, help="Default time budget per request in ms (default: %(default)s)")
+    parser.add_argument('--preset-timeout', type=int, default=DEFAULT_PRESET_TIMEOUT_MS, help="Decode timeout per preset in ms (default: %(default)s)")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if not os.path.exists(args.presets):
+        print(f"Presets file not found: {args.presets}", file=sys.stderr)
+        return 2
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
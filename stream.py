@@ -0,0 +1,311 @@
+"""Continuous decoding of video files and image sequences.
+
+Usage:
+    python read.py stream SOURCE [--presets datamatrix_presets.ini] [--output stream_results.jsonl]
+                          [--realtime] [--stride N] [--locate-every N]
+
+SOURCE is a video file, a cv2.VideoCapture pattern such as frames/%05d.png,
+a directory or glob of still images, or a camera index. Per frame:
+
+* Frames that barely differ from the last processed frame (mean absolute
+  difference of small grayscale thumbnails) are skipped.
+* Every symbol decoded before is tracked: only a search window around its
+  last position is processed and decoded, with the preset that found it
+  first, and the window follows the symbol as it moves.
+* The whole frame is searched with locate.find_candidate_rois only every
+  few frames, or when nothing is tracked.
+* A symbol is reported once; decoding the same text again while it is
+  tracked (or shortly after it was lost) is treated as a duplicate.
+
+With --realtime, frames are dropped (grabbed but not decoded) whenever
+processing falls behind the source frame rate, as it would be for a live
+conveyor camera.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass, replace
+
+import cv2
+
+from batch import is_image_path
+from locate import find_candidate_rois
+from pipeline import crop_selection, decode_all_roi, load_presets
+
+DEFAULT_STREAM_TIMEOUT_MS = 100 # Per decode; a 30 fps frame lasts 33 ms
+DEFAULT_DIFF_THRESHOLD = 1.5 # Mean absolute thumbnail difference (gray levels) below which a frame is skipped
+DIFF_THUMBNAIL_WIDTH = 64
+DEFAULT_LOCATE_EVERY = 15 # Frames between full-frame searches while something is tracked
+DEFAULT_SEARCH_MARGIN = 0.5 # Track search window: last symbol box grown by this fraction per side
+DEFAULT_MAX_MISSES = 5 # Processed frames a track may fail before it is dropped
+DEFAULT_DEDUP_FRAMES = 90 # Frames a lost symbol's text still counts as a duplicate
+MAX_LOCATE_CANDIDATES = 3
+
+
+@dataclass
+class Track:
+    text: str
+    box: tuple # Last symbol box (x1, y1, x2, y2) in frame coordinates
+    preset: tuple # (section, name, ProcessingParams) that decoded it
+    last_frame: int
+    misses: int = 0
+
+
+@dataclass(frozen=True)
+class StreamSymbol:
+    frame: int
+    text: str
+    rect: tuple
+    preset: str
+
+
+def open_frames(source):
+    # Generator: first the source fps (or None), then (index, BGR frame) per frame.
+    # For captures, send(n) drops the next n frames without converting them to BGR.
+    if isinstance(source, int) or source.isdigit():
+        yield from _capture_frames(cv2.VideoCapture(int(source)))
+        return
+    if os.path.isdir(source):
+        paths = sorted(os.path.join(source, name) for name in os.listdir(source) if is_image_path(name))
+    elif any(char in source for char in '*?['):
+        paths = sorted(path for path in glob.glob(source) if is_image_path(path))
+    else:
+        yield from _capture_frames(cv2.VideoCapture(source)) # Video file or printf-style image pattern
+        return
+    yield None
+    for index, path in enumerate(paths):
+        frame = cv2.imread(path)
+        if frame is not None:
+            yield index, frame
+
+
+def _capture_frames(capture):
+    if not capture.isOpened():
+        raise IOError("Could not open video source")
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        yield fps if fps and fps > 0 else None
+        index = 0
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                return
+            skip = yield index, frame
+            index += 1
+            while skip: # Caller asked to drop frames to catch up: grab without decoding to BGR
+                if not capture.grab():
+                    return
+                index += 1
+                skip -= 1
+    finally:
+        capture.release()
+
+
+def _thumbnail(frame):
+    gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    height = max(1, int(gray.shape[0] * DIFF_THUMBNAIL_WIDTH / float(gray.shape[1])))
+    return cv2.resize(gray, (DIFF_THUMBNAIL_WIDTH, height), interpolation=cv2.INTER_AREA)
+
+
+def _grow(box, margin, width, height):
+    x1, y1, x2, y2 = box
+    dx, dy = int((x2 - x1) * margin), int((y2 - y1) * margin)
+    return (max(0, x1 - dx), max(0, y1 - dy), min(width, x2 + dx), min(height, y2 + dy))
+
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class StreamDecoder:
+    def __init__(self, presets, timeout_ms=DEFAULT_STREAM_TIMEOUT_MS, diff_threshold=DEFAULT_DIFF_THRESHOLD,
+                 locate_every=DEFAULT_LOCATE_EVERY, search_margin=DEFAULT_SEARCH_MARGIN,
+                 max_misses=DEFAULT_MAX_MISSES, dedup_frames=DEFAULT_DEDUP_FRAMES):
+        # presets: [(section, name, ProcessingParams)]; only one symbol is looked for per
+        # window, so libdmtx can stop scanning at the first one
+        self.presets = [(section, name, replace(params, dmtx_max_count=1)) for section, name, params in presets]
+        self.timeout_ms = timeout_ms
+        self.diff_threshold = diff_threshold
+        self.locate_every = max(1, locate_every)
+        self.search_margin = search_margin
+        self.max_misses = max_misses
+        self.dedup_frames = dedup_frames
+        self.tracks = []
+        self.recent = {} # text -> last frame it was decoded in
+        self.previous_thumbnail = None
+        self.last_locate = None
+        self.counts = {'frames': 0, 'processed': 0, 'unchanged': 0, 'dropped': 0, 'symbols': 0, 'duplicates': 0, 'errors': 0}
+        self.first_error = None # "preset: message" of the first failed decode, for the summary
+        self.processing_ms = 0.0
+
+    def process(self, index, frame, timings=None):
+        # Returns the StreamSymbols first seen in this frame, or None if the frame was skipped
+        self.counts['frames'] += 1
+        thumbnail = _thumbnail(frame)
+        if (self.previous_thumbnail is not None and self.previous_thumbnail.shape == thumbnail.shape
+                and cv2.norm(thumbnail, self.previous_thumbnail, cv2.NORM_L1) / thumbnail.size < self.diff_threshold):
+            self.counts['unchanged'] += 1
+            return None
+        self.previous_thumbnail = thumbnail
+        self.counts['processed'] += 1
+        start = time.perf_counter()
+
+        height, width = frame.shape[:2]
+        found = []
+        covered = []
+        for track in list(self.tracks):
+            window = _grow(track.box, self.search_margin, width, height)
+            covered.append(window)
+            symbol = self._decode_window(frame, window, [track.preset], timings)
+            if symbol is None:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    self.tracks.remove(track)
+                continue
+            text, box, _ = symbol
+            if any(text == other[0] for other in found):
+                self.tracks.remove(track) # Two tracks converged on the same symbol
+                continue
+            # The text may change when the next item arrives where the previous one was
+            track.text, track.box, track.last_frame, track.misses = text, box, index, 0
+            found.append((text, box, track.preset[1]))
+
+        if not self.tracks or self.last_locate is None or index - self.last_locate >= self.locate_every:
+            self.last_locate = index
+            for candidate in find_candidate_rois(frame, max_candidates=MAX_LOCATE_CANDIDATES):
+                window = candidate.selection
+                if any(_overlaps(window, other) for other in covered):
+                    continue # Already handled by a track
+                symbol = self._decode_window(frame, window, self.presets, timings)
+                if symbol is None:
+                    continue
+                text, box, preset = symbol
+                self.tracks.append(Track(text=text, box=box, preset=preset, last_frame=index))
+                covered.append(_grow(box, self.search_margin, width, height))
+                found.append((text, box, preset[1]))
+
+        new_symbols = []
+        for text, box, preset_name in found:
+            last = self.recent.get(text)
+            self.recent[text] = index
+            if last is not None and index - last <= self.dedup_frames:
+                self.counts['duplicates'] += 1
+                continue
+            new_symbols.append(StreamSymbol(frame=index, text=text, rect=box, preset=preset_name))
+        self.counts['symbols'] += len(new_symbols)
+        # Forget texts that can no longer be duplicates
+        self.recent = {text: last for text, last in self.recent.items() if index - last <= self.dedup_frames}
+        self.processing_ms += (time.perf_counter() - start) * 1000.0
+        return new_symbols
+
+    def _decode_window(self, frame, window, presets, timings):
+        # First symbol found in window with presets in order: (text, box, preset) or None
+        cropped = crop_selection(frame, window)
+        if cropped is None:
+            return None
+        for preset in presets:
+            try:
+                symbols = decode_all_roi(cropped, preset[2], self.timeout_ms, timings, origin=window[:2])
+            except Exception as e:
+                # Not the same as "no symbol": counted and reported in the summary
+                self.counts['errors'] += 1
+                if self.first_error is None:
+                    self.first_error = f"Preset '{preset[1]}': {e}"
+                continue
+            if symbols:
+                return symbols[0].text, symbols[0].rect, preset
+        return None
+
+
+def run_stream(source, decoder, on_symbol, realtime=False, stride=1, timings=None):
+    # Feeds every stride-th frame of source to decoder; with realtime, frames are dropped
+    # while processing is behind the source frame rate. Returns the number of frames read.
+    frames = open_frames(source)
+    read = 0
+    fps = next(frames)
+    frame_budget = 1.0 / fps if realtime and fps else None
+    debt = 0.0 # Seconds processing is behind the source
+    item = next(frames, None)
+    while item is not None:
+        index, frame = item
+        read += 1
+        start = time.perf_counter()
+        symbols = decoder.process(index, frame, timings) if index % max(1, stride) == 0 else None
+        for symbol in symbols or ():
+            on_symbol(symbol)
+        skip = 0
+        if frame_budget is not None:
+            debt = max(0.0, debt + time.perf_counter() - start - frame_budget)
+            skip = int(debt / frame_budget)
+            debt -= skip * frame_budget
+            decoder.counts['dropped'] += skip
+            read += skip
+        try:
+            item = frames.send(skip) if skip else next(frames)
+        except StopIteration:
+            item = None
+    return read
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(prog="read.py stream", description="Decode DataMatrix codes continuously from a video or image sequence.")
+    parser.add_argument('source', help="Video file, capture pattern (frames/%%05d.png), image folder or glob, or camera index")
+    parser.add_argument('--presets', default='datamatrix_presets.ini', help="Presets INI file (default: %(default)s)")
+    parser.add_argument('--output', '-o', default=None, help="JSONL file for the decoded symbols (default: stdout)")
+    parser.add_argument('--timeout', type=int, default=DEFAULT_STREAM_TIMEOUT_MS, help="Decode timeout per window in ms (default: %(default)s)")
+    parser.add_argument('--realtime', action='store_true', help="Drop frames when processing falls behind the source frame rate")
+    parser.add_argument('--stride', type=int, default=1, help="Only consider every N-th frame (default: %(default)s)")
+    parser.add_argument('--locate-every', type=int, default=DEFAULT_LOCATE_EVERY, help="Frames between full-frame searches (default: %(default)s)")
+    parser.add_argument('--diff-threshold', type=float, default=DEFAULT_DIFF_THRESHOLD,
+                        help="Skip frames whose mean thumbnail difference is below this (default: %(default)s, 0 = never)")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    try:
+        presets = load_presets(args.presets)
+    except Exception as e:
+        print(f"Could not load presets: {e}", file=sys.stderr)
+        return 2
+    if not presets:
+        print(f"No presets found in {args.presets}", file=sys.stderr)
+        return 2
+
+    decoder = StreamDecoder(presets, args.timeout, args.diff_threshold, args.locate_every)
+    stream = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+
+    def write(symbol):
+        stream.write(json.dumps({'frame': symbol.frame, 'text': symbol.text, 'rect': list(symbol.rect), 'preset': symbol.preset}) + "\n")
+        stream.flush()
+
+    start = time.perf_counter()
+    read = 0
+    try:
+        read = run_stream(args.source, decoder, write, args.realtime, args.stride)
+    except IOError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    elapsed = time.perf_counter() - start
+
+    counts = decoder.counts
+    per_frame = decoder.processing_ms / counts['processed'] if counts['processed'] else 0.0
+    print(f"{read} frame(s) in {elapsed:.1f}s ({read / elapsed if elapsed > 0 else 0:.1f} fps): "
+          f"{counts['processed']} processed ({per_frame:.1f} ms each), {counts['unchanged']} unchanged, "
+          f"{counts['dropped']} dropped to keep up; {counts['symbols']} symbol(s), {counts['duplicates']} duplicate decode(s).",
+          file=sys.stderr)
+    if counts['errors']:
+        print(f"{counts['errors']} decode error(s); first: {decoder.first_error}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,259 @@
+"""Orientation and scale sweep as a search dimension alongside the presets.
+
+Rotation used to be a preset setting and was removed; a label that is
+skewed or printed at an unusual size then only decodes once the operator
+fixes it by hand. The sweep instead tries every preset on variants of the
+ROI:
+
+* a pyramid level (cv2.pyrDown / cv2.pyrUp, i.e. half or double size),
+* a small-angle deskew, estimated once per ROI from the symbol edges,
+* a quarter turn (transpose and/or flip, so no resampling).
+
+Variants are derived from the output of the denoise stage, so grayscale,
+upscale and denoise run once per ROI (per distinct settings of those
+stages) and are shared by every variant; only sharpen, CLAHE, threshold,
+morphology and the decode run per variant.
+
+Most labels decode as they are, so every preset is first tried on the
+unchanged ROI, in preset order, before any variant; the skew is only
+estimated once those fail. The remaining preset x variant pairs are tried
+cheapest first (relative pixel count plus transform cost, ties in preset
+order). Quarter turns come last: libdmtx already finds symbols at any
+orientation, so they only help in rare cases. The sweep stops at the first
+decode.
+"""
+import itertools
+import time
+from dataclasses import dataclass, replace
+
+import cv2
+import numpy as np
+
+from pipeline import DEFAULT_DECODE_TIMEOUT_MS, STAGES, StageCache, decode_processed, process_roi
+from result_cache import decode_key, pixels_digest
+
+ROTATIONS = (0, 90, 180, 270) # Counter-clockwise quarter turns
+PYRAMID_LEVELS = (-1, 0, 1) # Image size 2**level
+MIN_SIDE = 48 # Pyramid levels that shrink the ROI below this many pixels are skipped
+MAX_SIDE = 4096 # ... and levels that grow it beyond this
+DESKEW_COST = 0.15 # Extra relative cost of a resampled (warped) variant
+ROTATION_COST = 5.0 # Ranks quarter turns after every unturned variant (see the module docstring)
+MIN_SKEW_DEG = 1.0 # Smaller skew estimates are not worth a variant
+SKEW_BINS = 180 # Orientation histogram bins over 0-90 degrees (0.5 degree steps)
+SHARED_STAGE = 'denoise' # Variants are derived from this stage's output
+EDGE_FRACTION = 0.25 # Edge pixels used for the skew estimate: magnitude above this share of the maximum
+MIN_EDGE_PIXELS = 50
+VARIANT_IMAGES = 8 # Transformed images kept per sweep (LRU) ...
+VARIANT_IMAGE_BYTES = 64 * 1024 * 1024 # ... and their total size
+
+# Stages before the variants; their params identify the base image a variant is built from
+_SHARED_STAGES = STAGES[:[stage[0] for stage in STAGES].index(SHARED_STAGE) + 1]
+
+
+@dataclass(frozen=True)
+class Variant:
+    level: int = 0 # Pyramid level; the image is 2**level times the (upscaled) ROI size
+    skew: float = 0.0 # Deskew rotation in degrees, counter-clockwise
+    rotation: int = 0 # Quarter turn in degrees, counter-clockwise
+
+    @property
+    def scale(self):
+        return 2.0 ** self.level
+
+    def is_identity(self):
+        return self.level == 0 and self.skew == 0.0 and self.rotation == 0
+
+    def cost(self):
+        # Decode and late-stage time grow with the pixel count
+        cost = self.scale * self.scale
+        if self.skew:
+            cost *= 1.0 + DESKEW_COST
+        if self.rotation:
+            cost += ROTATION_COST
+        return cost
+
+    def describe(self):
+        parts = []
+        if self.level:
+            parts.append(f"x{self.scale:g}")
+        if self.skew:
+            parts.append(f"deskew {self.skew:+.1f}°")
+        if self.rotation:
+            parts.append(f"rot {self.rotation}°")
+        return ", ".join(parts) if parts else "as is"
+
+
+@dataclass(frozen=True)
+class SweepAttempt:
+    name: str # Preset name
+    params: object # ProcessingParams
+    variant: Variant
+    decoded_text: object # Decoded string or None
+    error: object # Error message or None
+    elapsed_ms: float
+    cached: bool = False # Answered by the result cache without decoding
+
+
+def estimate_skew(gray):
+    # Dominant edge direction modulo 90 degrees, in (-45, 45]. The L finder pattern, the
+    # clock track and the module edges of a DataMatrix all run along two perpendicular
+    # directions, so a magnitude-weighted histogram of the strong gradients' orientations
+    # peaks at the symbol's rotation. Positive = the symbol is turned clockwise on screen.
+    gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+    magnitude = cv2.magnitude(gx, gy)
+    strong = magnitude > max(float(magnitude.max()) * EDGE_FRACTION, 1e-6)
+    if np.count_nonzero(strong) < MIN_EDGE_PIXELS:
+        return 0.0
+    angles = np.degrees(np.arctan2(gy[strong], gx[strong])) % 90.0
+    histogram, _ = np.histogram(angles, bins=SKEW_BINS, range=(0.0, 90.0), weights=magnitude[strong])
+    histogram = histogram + np.roll(histogram, 1) + np.roll(histogram, -1) # Circular: 0 and 90 degrees meet
+    peak = (int(np.argmax(histogram)) + 0.5) * 90.0 / SKEW_BINS
+    return peak - 90.0 if peak > 45.0 else peak
+
+
+def _pyramid(image, level):
+    for _ in range(-level):
+        image = cv2.pyrDown(image)
+    for _ in range(level):
+        image = cv2.pyrUp(image)
+    return image
+
+
+def _deskew(image, angle):
+    # Rotates on a canvas large enough to keep the corners; the border repeats the edge
+    # pixels so the added quiet zone matches the background
+    height, width = image.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2.0, height / 2.0), angle, 1.0)
+    cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+    new_width = int(np.ceil(height * sin + width * cos))
+    new_height = int(np.ceil(height * cos + width * sin))
+    matrix[0, 2] += (new_width - width) / 2.0
+    matrix[1, 2] += (new_height - height) / 2.0
+    return cv2.warpAffine(image, matrix, (new_width, new_height), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def _quarter_turn(image, rotation):
+    # Exact counter-clockwise quarter turns by transpose and flip
+    if rotation == 90:
+        return cv2.flip(cv2.transpose(image), 0)
+    if rotation == 180:
+        return cv2.flip(image, -1)
+    if rotation == 270:
+        return cv2.flip(cv2.transpose(image), 1)
+    return image
+
+
+def _variant_image(base, base_key, variant, images):
+    # Scale, then deskew, then turn; partial results are kept in images (a small StageCache
+    # LRU) so variants sharing a level (and skew) build on them. Results are new arrays;
+    # base is never modified.
+    key = (base_key, variant)
+    image = images.get(key)
+    if image is None:
+        if variant.rotation:
+            image = _quarter_turn(_variant_image(base, base_key, replace(variant, rotation=0), images), variant.rotation)
+        elif variant.skew:
+            image = _deskew(_variant_image(base, base_key, replace(variant, skew=0.0), images), variant.skew)
+        else:
+            image = _pyramid(base, variant.level)
+        images.put(key, image)
+    return image
+
+
+def _variant_params(params, variant):
+    # Decoder edge limits are given in ROI pixels and must follow the pyramid level
+    if not variant.level or not (params.dmtx_min_edge or params.dmtx_max_edge):
+        return params
+    return replace(params, dmtx_min_edge=int(round(params.dmtx_min_edge * variant.scale)),
+                   dmtx_max_edge=int(round(params.dmtx_max_edge * variant.scale)))
+
+
+def sweep_plan(shape, presets, skew=0.0, rotations=ROTATIONS, levels=PYRAMID_LEVELS):
+    # (preset index, Variant) pairs: each preset as is, in preset order, then the variants
+    # cheapest first; ties keep the preset order
+    height, width = shape[:2]
+    skews = (0.0, skew) if skew else (0.0,)
+    plan = []
+    for index, (_, _, params) in enumerate(presets):
+        upscale = params.upscale_scale()
+        for level in levels:
+            size = upscale * 2.0 ** level
+            if level and (min(height, width) * size < MIN_SIDE or max(height, width) * size > MAX_SIDE):
+                continue
+            for variant_skew in skews:
+                for rotation in rotations:
+                    variant = Variant(level=level, skew=variant_skew, rotation=rotation)
+                    plan.append((variant.cost(), index, variant))
+    plan.sort(key=lambda item: (not item[2].is_identity(), item[0], item[1]))
+    return [(index, variant) for _, index, variant in plan]
+
+
+def _lazy_variants(cropped, presets, timings, cache, roi_key, rotations, levels, deskew):
+    # The non-identity part of the sweep plan, built when first needed
+    skew = 0.0
+    if deskew and presets:
+        start = time.perf_counter()
+        gray = process_roi(cropped, presets[0][2], timings, cache, roi_key, stop_after='gray') # Shared by every preset
+        skew = round(estimate_skew(gray) * 2.0) / 2.0
+        if abs(skew) < MIN_SKEW_DEG:
+            skew = 0.0
+        if timings is not None:
+            timings['variant'] = timings.get('variant', 0.0) + (time.perf_counter() - start) * 1000.0
+    for index, variant in sweep_plan(cropped.shape, presets, skew, rotations, levels):
+        if not variant.is_identity():
+            yield index, variant
+
+
+def sweep_attempts(cropped, presets, timeout_ms=DEFAULT_DECODE_TIMEOUT_MS, timings=None, cache=None, roi_key=None,
+                   rotations=ROTATIONS, levels=PYRAMID_LEVELS, deskew=True, deadline=None, result_cache=None):
+    # Yields a SweepAttempt per preset x variant, cheapest first; the caller stops iterating
+    # at the first decode. presets: [(section, name, ProcessingParams)]. Without a cache the
+    # shared stages live in a StageCache for this sweep. With a deadline (time.time() value)
+    # no attempt is started after it and timeouts are cut to fit. With a ResultCache, known
+    # outcomes are yielded without decoding; identities share entries with plain preset runs.
+    if cache is None or roi_key is None:
+        cache, roi_key = StageCache(), ('sweep',)
+    # (denoise cache key, Variant) -> transformed denoised ROI; bounded, as variants of
+    # large ROIs at pyramid level +1 are up to MAX_SIDE squared
+    images = StageCache(max_entries=VARIANT_IMAGES, max_bytes=VARIANT_IMAGE_BYTES)
+    digest = pixels_digest(cropped) if result_cache is not None else None
+    # The identities need no skew, which is estimated only once they have all failed
+    identities = [(index, Variant()) for index in range(len(presets))]
+    for index, variant in itertools.chain(identities, _lazy_variants(cropped, presets, timings, cache, roi_key,
+                                                                      rotations, levels, deskew)):
+        _, name, params = presets[index]
+        attempt_timeout_ms = timeout_ms
+        if deadline is not None:
+            remaining_ms = int((deadline - time.time()) * 1000.0)
+            if remaining_ms <= 0:
+                return
+            attempt_timeout_ms = min(timeout_ms, remaining_ms)
+        result_key = None
+        if result_cache is not None:
+            result_key = decode_key(digest, params, "single" if variant.is_identity() else f"sweep {variant}")
+            hit, decoded_text = result_cache.get(result_key, attempt_timeout_ms)
+            if hit:
+                yield SweepAttempt(name=name, params=params, variant=variant, decoded_text=decoded_text, error=None,
+                                   elapsed_ms=0.0, cached=True)
+                continue
+        start = time.perf_counter()
+        decoded_text, error = None, None
+        try:
+            if variant.is_identity():
+                processed = process_roi(cropped, params, timings, cache, roi_key)
+            else:
+                base = process_roi(cropped, params, timings, cache, roi_key, stop_after=SHARED_STAGE)
+                base_key = tuple(key_func(params) for _, key_func, _ in _SHARED_STAGES)
+                transform_start = time.perf_counter()
+                image = _variant_image(base, base_key, variant, images)
+                if timings is not None:
+                    timings['variant'] = timings.get('variant', 0.0) + (time.perf_counter() - transform_start) * 1000.0
+                processed = process_roi(image, params, timings, cache, (roi_key, variant), start_after=SHARED_STAGE)
+            decoded_text = decode_processed(processed, attempt_timeout_ms, timings, _variant_params(params, variant))
+            if result_key is not None:
+                result_cache.put(result_key, decoded_text, attempt_timeout_ms)
+        except Exception as e:
+            error = str(e)
+        yield SweepAttempt(name=name, params=params, variant=variant, decoded_text=decoded_text, error=error,
+                           elapsed_ms=(time.perf_counter() - start) * 1000.0)
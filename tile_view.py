@@ -0,0 +1,253 @@
+"""Viewport-aware, tiled rendering of large images on a Tk canvas.
+
+An ImagePyramid (halved levels, built lazily once per image version) is
+cut into fixed-size tiles. For each redraw only the tiles that intersect
+the visible area are rendered, from the coarsest level that still has at
+least display resolution, and the resulting PhotoImages are cached across
+redraws (bounded by count and by bytes). When zoomed in past the level's
+resolution, only the visible part of each tile is enlarged. Redraw cost and
+tile memory are therefore proportional to the canvas size, not the image
+size or zoom, and panning mostly reuses cached tiles. The pyramid may be
+built from a reduced proxy of a larger image (see image_source.py); view
+coordinates are always full-resolution image coordinates.
+"""
+import math
+from collections import OrderedDict
+
+import cv2
+from PIL import Image, ImageTk
+
+DEFAULT_TILE_SIZE = 256
+DEFAULT_MAX_CACHED_TILES = 384
+DEFAULT_MAX_CACHED_TILE_BYTES = 256 * 1024 * 1024 # Estimated PhotoImage memory (4 bytes per pixel)
+MAX_ZOOM_SCALE = 16.0 # Display pixels per image pixel when zoomed all the way in
+
+
+class ImagePyramid:
+    def __init__(self, image, tile_size=DEFAULT_TILE_SIZE):
+        self.tile_size = tile_size
+        self.levels = [image] # Level k is the image downscaled by 2**k; built on demand
+
+    @property
+    def width(self):
+        return self.levels[0].shape[1]
+
+    @property
+    def height(self):
+        return self.levels[0].shape[0]
+
+    def level_count(self):
+        # Stop halving once the whole image fits in a single tile
+        longest = max(self.width, self.height)
+        return max(1, int(math.ceil(math.log2(max(longest / float(self.tile_size), 1.0)))) + 1)
+
+    def level(self, index):
+        while len(self.levels) <= index:
+            previous = self.levels[-1]
+            size = (max(1, (previous.shape[1] + 1) // 2), max(1, (previous.shape[0] + 1) // 2))
+            self.levels.append(cv2.resize(previous, size, interpolation=cv2.INTER_AREA))
+        return self.levels[index]
+
+    def update_region(self, box):
+        # Recompute only box (x1, y1, x2, y2, full-resolution coordinates) in every level
+        # built so far, each from the matching area of the level above it
+        x1, y1, x2, y2 = box
+        for index in range(1, len(self.levels)):
+            x1, y1 = x1 // 2, y1 // 2
+            x2, y2 = (x2 + 1) // 2, (y2 + 1) // 2
+            previous, current = self.levels[index - 1], self.levels[index]
+            x2 = min(x2, current.shape[1])
+            y2 = min(y2, current.shape[0])
+            if x2 <= x1 or y2 <= y1:
+                return
+            source = previous[y1 * 2:min(y2 * 2, previous.shape[0]), x1 * 2:min(x2 * 2, previous.shape[1])]
+            current[y1:y2, x1:x2] = cv2.resize(source, (x2 - x1, y2 - y1), interpolation=cv2.INTER_AREA)
+
+    def level_for_scale(self, scale):
+        # Coarsest level whose resolution is still >= the display resolution
+        if scale >= 1.0:
+            return 0
+        return max(0, min(self.level_count() - 1, int(math.floor(math.log2(1.0 / scale)))))
+
+
+class TiledImageView:
+    def __init__(self, canvas, tile_size=DEFAULT_TILE_SIZE, max_cached_tiles=DEFAULT_MAX_CACHED_TILES,
+                 max_cached_tile_bytes=DEFAULT_MAX_CACHED_TILE_BYTES):
+        self.canvas = canvas
+        self.tile_size = tile_size
+        self.max_cached_tiles = max_cached_tiles
+        self.max_cached_tile_bytes = max_cached_tile_bytes
+        self.pyramid = None
+        self.version = None
+        self.image_width = 0 # Full-resolution size; the pyramid's level 0 may be a reduced proxy
+        self.image_height = 0
+        self.base_scale = 1.0 # Level-0 pixels per full-resolution pixel
+        self.tiles = OrderedDict() # (level, tx, ty, level box, width, height) -> PhotoImage, LRU order
+        self.tile_bytes = 0
+        self.scale = 1.0 # Display pixels per image pixel
+        self.offset_x = 0.0 # Image coordinate shown at the canvas' top-left corner
+        self.offset_y = 0.0
+        self.fitted = True # Follow the window size until the user zooms or pans
+
+    def set_image(self, image, version, full_size=None):
+        # full_size (width, height) is given when image is a downscaled proxy
+        self.pyramid = ImagePyramid(image, self.tile_size) if image is not None else None
+        self.version = version
+        if image is not None:
+            self.image_width, self.image_height = full_size or (image.shape[1], image.shape[0])
+            self.base_scale = image.shape[1] / float(self.image_width)
+        self._clear_tiles()
+        self.fitted = True
+
+    def invalidate(self, version, region=None):
+        # Pixels changed. With a region (x1, y1, x2, y2) only that part of the pyramid is
+        # recomputed and only the cached tiles overlapping it are dropped; otherwise the
+        # pyramid is rebuilt from the (mutated) level 0.
+        self.version = version
+        if self.pyramid is None:
+            return
+        if region is None:
+            self.pyramid = ImagePyramid(self.pyramid.levels[0], self.tile_size)
+            self._clear_tiles()
+            return
+
+        # Full-resolution region to the level-0 pixels covering it
+        x1, y1 = int(region[0] * self.base_scale), int(region[1] * self.base_scale)
+        x2 = max(int(math.ceil(region[2] * self.base_scale)), x1 + 1)
+        y2 = max(int(math.ceil(region[3] * self.base_scale)), y1 + 1)
+        self.pyramid.update_region((x1, y1, x2, y2))
+        for key in list(self.tiles):
+            level, tx, ty = key[:3]
+            factor = 2 ** level
+            tile_x1, tile_y1 = tx * self.tile_size * factor, ty * self.tile_size * factor
+            tile_x2, tile_y2 = tile_x1 + self.tile_size * factor, tile_y1 + self.tile_size * factor
+            if tile_x1 < x2 and x1 < tile_x2 and tile_y1 < y2 and y1 < tile_y2:
+                self._drop_tile(key)
+
+    def _clear_tiles(self):
+        self.tiles.clear()
+        self.tile_bytes = 0
+
+    def _drop_tile(self, key):
+        photo = self.tiles.pop(key)
+        self.tile_bytes -= photo.width() * photo.height() * 4
+
+    def _cache_tile(self, key, photo):
+        self.tiles[key] = photo
+        self.tile_bytes += photo.width() * photo.height() * 4
+        # The tile just added stays even if it alone exceeds the byte budget
+        while len(self.tiles) > 1 and (len(self.tiles) > self.max_cached_tiles
+                                       or self.tile_bytes > self.max_cached_tile_bytes):
+            self._drop_tile(next(iter(self.tiles)))
+
+    def canvas_size(self):
+        return self.canvas.winfo_width(), self.canvas.winfo_height()
+
+    def fit_scale(self):
+        canvas_width, canvas_height = self.canvas_size()
+        return min(canvas_width / float(self.image_width), canvas_height / float(self.image_height))
+
+    def fit(self):
+        self.scale = self.fit_scale()
+        self.offset_x = 0.0
+        self.offset_y = 0.0
+        self.fitted = True
+
+    def zoom_at(self, canvas_x, canvas_y, factor):
+        # Zoom keeping the image point under the cursor fixed
+        if self.pyramid is None:
+            return
+        image_x, image_y = self.canvas_to_image(canvas_x, canvas_y)
+        self.scale = min(MAX_ZOOM_SCALE, max(self.fit_scale() * 0.5, self.scale * factor))
+        self.offset_x = image_x - canvas_x / self.scale
+        self.offset_y = image_y - canvas_y / self.scale
+        self.fitted = False
+        self._clamp_offset()
+
+    def pan(self, dx_canvas, dy_canvas):
+        if self.pyramid is None:
+            return
+        self.offset_x -= dx_canvas / self.scale
+        self.offset_y -= dy_canvas / self.scale
+        self.fitted = False
+        self._clamp_offset()
+
+    def _clamp_offset(self):
+        # Keep at least half a window of image visible
+        canvas_width, canvas_height = self.canvas_size()
+        half_w = canvas_width / self.scale / 2.0
+        half_h = canvas_height / self.scale / 2.0
+        self.offset_x = min(max(self.offset_x, -half_w), self.image_width - half_w)
+        self.offset_y = min(max(self.offset_y, -half_h), self.image_height - half_h)
+
+    def canvas_to_image(self, x, y):
+        return self.offset_x + x / self.scale, self.offset_y + y / self.scale
+
+    def image_to_canvas(self, x, y):
+        return (x - self.offset_x) * self.scale, (y - self.offset_y) * self.scale
+
+    def render(self):
+        self.canvas.delete("tile")
+        if self.pyramid is None:
+            return
+        if self.fitted:
+            self.fit()
+
+        canvas_width, canvas_height = self.canvas_size()
+        level = self.pyramid.level_for_scale(self.scale / self.base_scale)
+        level_image = self.pyramid.level(level)
+        level_scale = self.base_scale / (2 ** level) # Level pixels per image pixel
+        tile = self.tile_size
+
+        # Visible image region, in level pixels
+        left, top = self.canvas_to_image(0, 0)
+        right, bottom = self.canvas_to_image(canvas_width, canvas_height)
+        level_h, level_w = level_image.shape[:2]
+        view_x0, view_y0 = int(math.floor(left * level_scale)), int(math.floor(top * level_scale))
+        view_x1, view_y1 = int(math.ceil(right * level_scale)), int(math.ceil(bottom * level_scale))
+        tx0 = max(0, view_x0 // tile)
+        ty0 = max(0, view_y0 // tile)
+        tx1 = min((level_w - 1) // tile, view_x1 // tile)
+        ty1 = min((level_h - 1) // tile, view_y1 // tile)
+        # Enlarged tiles are cut to the view first; otherwise a tile at 16x zoom would be
+        # rendered (and cached) at 16 times its size, mostly off-canvas
+        clip = self.scale / level_scale > 1.0
+
+        for ty in range(ty0, ty1 + 1):
+            for tx in range(tx0, tx1 + 1):
+                x_start = tx * tile
+                y_start = ty * tile
+                x_end = min(x_start + tile, level_w)
+                y_end = min(y_start + tile, level_h)
+                if clip:
+                    x_start, y_start = max(x_start, view_x0), max(y_start, view_y0)
+                    x_end, y_end = min(x_end, view_x1), min(y_end, view_y1)
+                    if x_end <= x_start or y_end <= y_start:
+                        continue
+                # Tile edges in canvas coordinates, rounded per edge so neighbours don't leave seams
+                cx0, cy0 = self.image_to_canvas(x_start / level_scale, y_start / level_scale)
+                cx1, cy1 = self.image_to_canvas(x_end / level_scale, y_end / level_scale)
+                cx0, cy0, cx1, cy1 = int(round(cx0)), int(round(cy0)), int(round(cx1)), int(round(cy1))
+                if cx1 <= cx0 or cy1 <= cy0:
+                    continue
+
+                key = (level, tx, ty, (x_start, y_start, x_end, y_end), cx1 - cx0, cy1 - cy0)
+                photo = self.tiles.get(key)
+                if photo is None:
+                    photo = self._make_tile(level_image[y_start:y_end, x_start:x_end], cx1 - cx0, cy1 - cy0)
+                    self._cache_tile(key, photo)
+                else:
+                    self.tiles.move_to_end(key)
+                self.canvas.create_image(cx0, cy0, image=photo, anchor="nw", tags="tile")
+
+        self.canvas.tag_lower("tile") # Keep selection and overlay boxes on top
+
+    def _make_tile(self, pixels, width, height):
+        interpolation = cv2.INTER_AREA if width < pixels.shape[1] else cv2.INTER_NEAREST
+        if (width, height) != (pixels.shape[1], pixels.shape[0]):
+            pixels = cv2.resize(pixels, (width, height), interpolation=interpolation)
+        if pixels.ndim == 2:
+            rgb = cv2.cvtColor(pixels, cv2.COLOR_GRAY2RGB)
+        else:
+            rgb = cv2.cvtColor(pixels, cv2.COLOR_BGR2RGB)
+        return ImageTk.PhotoImage(Image.fromarray(rgb))
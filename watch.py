@@ -0,0 +1,328 @@
+"""Hot-folder watch mode: decode images as they appear in a directory.
+
+Usage:
+    python read.py watch FOLDER [--presets datamatrix_presets.ini] [--output watch_results.jsonl]
+                         [--locate] [--roi x1,y1,x2,y2] [--workers N] [--queue-size N]
+
+New images run through concurrent stages connected by bounded queues:
+
+    watcher -> [load queue] -> locate -> [decode queue] -> load + crop + preprocess + decode (process pool)
+            -> writer (output log, live feed)
+
+The watcher uses filesystem events when the optional watchdog package is
+installed (inotify on Linux) and otherwise polls the directory; either way
+a file is only queued once its size and mtime have stopped changing, so
+half-written frames are not read. When a stage falls behind, its input
+queue fills up and the stages before it block: a burst of frames then
+waits on disk instead of piling up in memory, and nothing is dropped.
+Only paths and ROIs travel through the queues: the locate stage works on
+the downscaled proxy, and the full-resolution ROIs are read inside the
+worker processes, one at a time, so queued frames cost no pixel memory.
+Preprocessing and decoding stay together in the workers because each
+preset's decode result decides whether the next preset is run.
+"""
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from batch import ResultWriter, decode_file_rois, is_image_path, open_rois, parse_roi
+from pipeline import DEFAULT_DECODE_TIMEOUT_MS, load_presets
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError: # Optional: without watchdog the folder is polled
+    FileSystemEventHandler = object
+    Observer = None
+
+DEFAULT_QUEUE_SIZE = 16 # Images per bounded queue
+DEFAULT_POLL_INTERVAL = 0.5 # Seconds between directory scans without filesystem events
+EVENT_POLL_INTERVAL = 5.0 # Safety rescan interval when filesystem events are available
+DEFAULT_SETTLE_MS = 300 # A file must keep its size and mtime this long before it is read
+STOP_CHECK_S = 0.2 # How often blocked stages check for stop()
+
+
+class _WakeHandler(FileSystemEventHandler):
+    # Any filesystem event triggers an immediate rescan
+    def __init__(self, wakeup):
+        super().__init__()
+        self.wakeup = wakeup
+
+    def on_any_event(self, event):
+        self.wakeup.set()
+
+
+class WatchPipeline:
+    def __init__(self, folder, presets, output_path=None, timeout_ms=DEFAULT_DECODE_TIMEOUT_MS, roi=None,
+                 locate=False, all_codes=False, workers=None, queue_size=DEFAULT_QUEUE_SIZE, recursive=False,
+                 process_existing=False, poll_interval=DEFAULT_POLL_INTERVAL, settle_ms=DEFAULT_SETTLE_MS,
+                 feed=None):
+        # presets: [(section, name, ProcessingParams)] in run order. feed, if given, is a
+        # queue.Queue that receives (record, attempts) for every finished image.
+        self.folder = folder
+        self.presets = presets
+        self.output_path = output_path
+        self.timeout_ms = timeout_ms
+        self.roi = roi
+        self.locate = locate
+        self.all_codes = all_codes
+        self.workers = workers or os.cpu_count() or 1
+        self.recursive = recursive
+        self.process_existing = process_existing
+        self.poll_interval = poll_interval
+        self.settle_s = settle_ms / 1000.0
+        self.feed = feed
+
+        self.load_queue = queue.Queue(maxsize=queue_size) # Paths ready to be read
+        self.decode_queue = queue.Queue(maxsize=queue_size) # (path, rois, timings); rois=None is the whole image
+        self.results = queue.Queue() # Finished records; bounded by the in-flight limit
+        self.counts = {'queued': 0, 'loaded': 0, 'decoded': 0, 'failed': 0}
+        self.seen = {} # path -> (size, mtime_ns) already queued (or present before the start)
+        self.pending = {} # path -> ((size, mtime_ns), first time seen with that signature)
+
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._slots = threading.BoundedSemaphore(self.workers * 2) # Decode jobs in flight
+        self._executor = None
+        self._observer = None
+        self._threads = []
+        self._stream = None
+        self._writer = None
+
+    @property
+    def uses_events(self):
+        return self._observer is not None
+
+    def start(self):
+        if self._stream is None and self.output_path:
+            self._stream = open(self.output_path, 'a', newline='', encoding='utf-8')
+            self._writer = ResultWriter(self._stream, 'csv' if self.output_path.lower().endswith('.csv') else 'jsonl')
+        if not self.process_existing:
+            for path in self._list_images():
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                self.seen[path] = (stat.st_size, stat.st_mtime_ns)
+        if Observer is not None:
+            self._observer = Observer()
+            self._observer.schedule(_WakeHandler(self._wakeup), self.folder, recursive=self.recursive)
+            self._observer.start()
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        for name, target in (('watch-scan', self._scan_loop), ('watch-load', self._load_loop),
+                             ('watch-dispatch', self._dispatch_loop), ('watch-write', self._write_loop)):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        # Stops watching; queued images are abandoned, running decodes are not waited for
+        self._stop.set()
+        self._wakeup.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+        for thread in self._threads:
+            thread.join(timeout=2.0)
+        self._threads = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def status(self):
+        return dict(self.counts, load_queue=self.load_queue.qsize(), decode_queue=self.decode_queue.qsize(),
+                    pending=len(self.pending))
+
+    def _list_images(self):
+        if self.recursive:
+            for dirpath, dirnames, filenames in os.walk(self.folder):
+                for filename in filenames:
+                    if is_image_path(filename):
+                        yield os.path.join(dirpath, filename)
+        else:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if entry.is_file() and is_image_path(entry.name):
+                        yield entry.path
+
+    def _scan(self):
+        # New or rewritten paths whose size and mtime have settled, oldest first. A file
+        # overwritten under the same name gets a new signature and is decoded again.
+        now = time.monotonic()
+        ready = []
+        listed = set()
+        for path in self._list_images():
+            listed.add(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue # Deleted or renamed meanwhile
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self.seen.get(path) == signature:
+                continue
+            previous = self.pending.get(path)
+            if previous is None or previous[0] != signature:
+                self.pending[path] = (signature, now)
+            elif stat.st_size > 0 and now - previous[1] >= self.settle_s:
+                del self.pending[path]
+                self.seen[path] = signature
+                ready.append((signature[1], path))
+        # Forget files that are gone, so a long-running watch does not grow without bound
+        for known in (self.seen, self.pending):
+            for path in [path for path in known if path not in listed]:
+                del known[path]
+        return [path for _, path in sorted(ready)]
+
+    def _put(self, target, item):
+        # Blocking put (this is the backpressure); False if stopped meanwhile
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=STOP_CHECK_S)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source):
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=STOP_CHECK_S)
+            except queue.Empty:
+                continue
+        return None
+
+    def _scan_loop(self):
+        interval = EVENT_POLL_INTERVAL if self.uses_events else self.poll_interval
+        while not self._stop.is_set():
+            try:
+                paths = self._scan()
+            except OSError:
+                paths = [] # Folder temporarily unavailable (e.g. network share); retry
+            for path in paths:
+                if not self._put(self.load_queue, path):
+                    return
+                self.counts['queued'] += 1
+            # Files still settling are checked again soon even without new events
+            self._wakeup.wait(min(interval, self.settle_s) if self.pending else interval)
+            self._wakeup.clear()
+
+    def _load_loop(self):
+        while True:
+            path = self._get(self.load_queue)
+            if path is None:
+                return
+            timings = {}
+            rois = [self.roi] if self.roi is not None else None
+            if self.locate and self.roi is None:
+                try:
+                    # Only the proxy is read here; the worker reopens the image for the ROIs
+                    _, rois = open_rois(path, timings, locate=True)
+                except Exception:
+                    rois = None # The worker tries the whole image (and reports a load failure)
+            self.counts['loaded'] += 1
+            if not self._put(self.decode_queue, (path, rois, timings)):
+                return
+
+    def _dispatch_loop(self):
+        while True:
+            item = self._get(self.decode_queue)
+            if item is None:
+                return
+            while not self._slots.acquire(timeout=STOP_CHECK_S):
+                if self._stop.is_set():
+                    return
+            path, rois, timings = item
+            try:
+                future = self._executor.submit(decode_file_rois, path, rois, self.presets, self.timeout_ms, timings, self.all_codes)
+            except RuntimeError: # Executor shut down by stop()
+                self._slots.release()
+                return
+            future.add_done_callback(lambda done, path=path, timings=timings: self._on_decoded(done, path, timings))
+
+    def _on_decoded(self, future, path, timings):
+        self._slots.release()
+        if future.cancelled():
+            return
+        try:
+            record = future.result()
+        except Exception as e:
+            record = {'path': path, 'roi': None, 'preset': None, 'decoded_text': None, 'presets_tried': 0,
+                      'error': str(e), 'timings': timings}
+        self.results.put(record)
+
+    def _write_loop(self):
+        while True:
+            record = self._get(self.results)
+            if record is None:
+                return
+            attempts = record.pop('_attempts', [])
+            self.counts['decoded' if record['decoded_text'] else 'failed'] += 1
+            if self._writer is not None:
+                self._writer.write(record)
+            if self.feed is not None:
+                self.feed.put((record, attempts))
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(prog="read.py watch", description="Decode DataMatrix codes in images as they arrive in a folder.")
+    parser.add_argument('folder', help="Folder to watch")
+    parser.add_argument('--presets', default='datamatrix_presets.ini', help="Presets INI file (default: %(default)s)")
+    parser.add_argument('--output', '-o', default='watch_results.jsonl', help="Output log, appended to; .csv for CSV (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=None, help="Decode worker processes (default: CPU count)")
+    parser.add_argument('--timeout', type=int, default=DEFAULT_DECODE_TIMEOUT_MS, help="Decode timeout per preset in ms (default: %(default)s)")
+    parser.add_argument('--roi', type=parse_roi, default=None, help="Crop x1,y1,x2,y2 applied to every image (default: whole image)")
+    parser.add_argument('--locate', action='store_true', help="Find candidate code regions automatically")
+    parser.add_argument('--all-codes', action='store_true', help="Report every code in the ROI with its position")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help="Images per stage queue (default: %(default)s)")
+    parser.add_argument('--recursive', action='store_true', help="Also watch sub-directories")
+    parser.add_argument('--existing', action='store_true', help="Also decode images already in the folder")
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL, help="Seconds between scans without watchdog (default: %(default)s)")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if not os.path.isdir(args.folder):
+        print(f"Not a folder: {args.folder}", file=sys.stderr)
+        return 2
+    try:
+        presets = load_presets(args.presets)
+    except Exception as e:
+        print(f"Could not load presets: {e}", file=sys.stderr)
+        return 2
+    if not presets:
+        print(f"No presets found in {args.presets}", file=sys.stderr)
+        return 2
+
+    feed = queue.Queue()
+    pipeline = WatchPipeline(args.folder, presets, args.output, args.timeout, args.roi, args.locate, args.all_codes,
+                             args.workers, args.queue_size, args.recursive, args.existing, args.poll_interval, feed=feed)
+    pipeline.start()
+    print(f"Watching {args.folder} ({'filesystem events' if pipeline.uses_events else 'polling'}), "
+          f"results to {args.output}. Ctrl+C to stop.", file=sys.stderr)
+    try:
+        while True:
+            try:
+                record, _ = feed.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            outcome = record['decoded_text'] if record['decoded_text'] else f"FAILED {record['error'] or ''}".strip()
+            print(f"{os.path.basename(record['path'])}: {outcome} ({sum(record['timings'].values()):.0f} ms)", file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.stop()
+    counts = pipeline.counts
+    print(f"Stopped: {counts['decoded']} decoded, {counts['failed']} failed.", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())